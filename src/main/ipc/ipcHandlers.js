@@ -5,7 +5,7 @@ const { ViewNames, Settings } = require('../../utils/constants/enums');
 const { mouse, Point, keyboard, Key } = require('@nut-tree-fork/nut-js');
 const { captureSnapshot, toBoolean } = require('../../utils/utilityFunctions');
 const logger = require('../modules/logger');
-const { processDataWithFbcca, getEmotivEnvPath, stopEegInfrastructure } = require('../modules/eeg-pipeline');
+const { processDataWithFbcca, sendMarker, profileFbcca, profileEegServer, getEmotivEnvPath, stopEegInfrastructure } = require('../modules/eeg-pipeline');
 const fbccaConfiguration = require('../../../configs/fbccaConfig.json');
 
 let bciIntervalId = null;           // This will hold the ID of the BCI interval
@@ -77,6 +77,10 @@ async function registerIpcHandlers(context) {
             clearInterval(bciIntervalId);
         }
 
+        // Mark the scenario change and the start of the first gaze window in the EEG recording
+        sendMarker('scenario', { scenarioId, frequencies: stimuliFrequencies, buttonIds: activeButtonIds });
+        sendMarker('gaze-start', { scenarioId, frequencies: stimuliFrequencies, buttonIds: activeButtonIds });
+
         // Set new interval to process data every 4 seconds
         bciIntervalId = setInterval(() => {
             // Process the latest data with the fbcca algorithm. 
@@ -90,9 +94,24 @@ async function registerIpcHandlers(context) {
         if (bciIntervalId) {
             clearInterval(bciIntervalId);
             bciIntervalId = null;
+            sendMarker('gaze-end');
         }
     });
 
+    ipcMain.on('eeg-marker', (event, type, fields = {}) => {
+        // Lets a view mark a known target, e.g. { scenarioId, buttonId } during a calibration or experiment
+        sendMarker(type, fields);
+    });
+
+    ipcMain.handle('fbcca-profile', (event, calls) => {
+        // Profiles the next classifications; see src/ssvep/fbcca-py/profiling.py
+        return profileFbcca(calls);
+    });
+
+    ipcMain.handle('eeg-profile', (event, seconds) => {
+        return profileEegServer(seconds);
+    });
+
     ipcMain.on('overlay-create', async (event, overlayName, scenarioId, buttonId = null, isUpperCase = false, elementProperties) => {
         let mainWindowContentBounds = mainWindow.getContentBounds();
 
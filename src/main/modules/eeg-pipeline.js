@@ -19,6 +19,9 @@ let serverState = { ready: false, errorSinceReady: false };
 let headsetConnected = false;
 let pythonProcessRef = null; // track spawned websocket server process
 let lastQualityPercent = null; // track latest Emotiv signal quality percent
+let lastDeviceData = null; // latest Emotiv device data ({timestamp, data}), sent only when it changes
+let lastStreamMetrics = null; // latest periodic 'metrics' event from the EEG server (see stream_metrics.py)
+let fbccaLevel = 0; // cost level run_fbcca.py reported with its latest decision
 
 // Base path for SSVEP-related Python scripts (development vs packaged app)
 const ssvepBasePath = app.isPackaged
@@ -119,6 +122,36 @@ async function spawnPythonWebSocketServer(defaultConnectionType) {
                     return true;
                 }
 
+                // Periodic throughput/latency report; kept for diagnostics and not logged
+                if (type === 'metrics') {
+                    lastStreamMetrics = params;
+                    eegEvents.emit('metrics', params);
+                    return true;
+                }
+
+                // Optional memory monitor (BOGGLE_MEMORY, see memory_monitor.py)
+                if (type === 'memory') {
+                    eegEvents.emit('memory', params);
+                    return true;
+                }
+                if (type === 'memory-growth') {
+                    console.warn(`EEG server memory grew for ${params.intervals} intervals (traced ${params.tracedGrowthMb} MB, RSS ${params.rssGrowthMb} MB)`);
+                    eegEvents.emit('memory-growth', params);
+                    return true;
+                }
+
+                // Full sample/send interval histograms, sent when the server stops streaming
+                if (type === 'jitter-histogram') {
+                    eegEvents.emit('jitter-histogram', params);
+                    return true;
+                }
+
+                if (type === 'profile-written') {
+                    console.log('EEG server profile written to', params.path);
+                    eegEvents.emit('profile-written', { source: 'server', ...params });
+                    return true;
+                }
+
                 if (type === 'credentials-invalid') {
                     serverState.errorSinceReady = true;
                     eegEvents.emit('credentials-invalid');
@@ -151,7 +184,9 @@ async function spawnPythonWebSocketServer(defaultConnectionType) {
                         // Passive logging of JSON content
                         if (parsed && parsed.jsonrpc === '2.0' && parsed.method === 'event') {
                             const evtType = parsed.params && parsed.params.type ? parsed.params.type : 'unknown';
-                            console.log(`[EVENT] ${evtType}`);
+                            if (evtType !== 'metrics' && evtType !== 'memory') {
+                                console.log(`[EVENT] ${evtType}`);
+                            }
                         } else {
                             console.log(`[JSON] ${line}`);
                         }
@@ -181,13 +216,91 @@ async function spawnPythonWebSocketServer(defaultConnectionType) {
     });
 }
 
+// Emotiv contact quality arrives as a separate {qualityData: {timestamp, data: [...]}} message, only when it changes
+function handleQualityData(qualityData) {
+    if (!qualityData || !Array.isArray(qualityData.data)) {
+        return;
+    }
+
+    const eqArray = qualityData.data;
+    // Expecting an array of 17 entries (3 labels and 14 channels): [batteryPercent, overall, sampleRateQuality, <EEG Sensor Quality>]
+    const ssvepIndices = [8, 9, 10, 11];
+    let samples = [];
+    ssvepIndices.forEach(idx => {
+        if (idx < eqArray.length && typeof eqArray[idx] === 'number') {
+            samples.push(eqArray[idx]);
+        }
+    });
+    if (samples.length > 0) {
+        // Emotiv quality scale assumed 0-4 inclusive
+        const maxQuality = 4;
+        const avg = samples.reduce((a, b) => a + b, 0) / samples.length;
+        let percent = Math.round((avg / maxQuality) * 100);
+        if (percent < 0) percent = 0;
+        if (percent > 100) percent = 100;
+        lastQualityPercent = percent;
+        eegEvents.emit('quality-update', { percent });
+    }
+}
+
+function handleEegPacket(jsonData) {
+    // Handle different data formats based on the EEG data source
+    if (connectionType === 'emotiv') {
+        // Emotiv data format: {time, values} (device and quality data arrive as separate messages)
+        // Marking headset as connected only upon receiving actual data
+        if (jsonData.time && Array.isArray(jsonData.values)) {
+            if (!headsetConnected) {
+                serverState.errorSinceReady = false;
+                headsetConnected = true;
+                clearMessageBuffer();
+                eegEvents.emit('headset-connected');
+            }
+            messageResult.data.push(jsonData);
+            trimMessageBuffer();
+        } else {
+            console.log('[DEBUG] Emotiv data missing time or values:', jsonData);
+        }
+    } else {
+        // LSL data format: {time: timestamp, values: [ch1, ch2, ...]}
+        if (jsonData && (jsonData.time !== undefined) && Array.isArray(jsonData.values)) {
+            if (!headsetConnected) {
+                serverState.errorSinceReady = false;
+                headsetConnected = true;
+                clearMessageBuffer();
+                eegEvents.emit('headset-connected');
+            }
+            messageResult.data.push(jsonData);
+            trimMessageBuffer();
+        }
+    }
+}
+
 function connectWebSocketClient() {
-    ws = new WebSocket('ws://localhost:8765');
+    const socket = new WebSocket('ws://localhost:8765');
+    let opened = false;
+    ws = socket;
 
     ws.on('open', () => {
+        opened = true;
         console.log(`Connected to ${connectionType.toUpperCase()} WebSocket server`);
     });
 
+    // The server closes its clients when acquisition stops (code 1011, see acquisition_hub.py);
+    // reconnecting starts it again. Intentional disconnects clear `ws` first.
+    ws.on('close', (code, reason) => {
+        if (!opened || ws !== socket) {
+            return; // Failed connects are retried by the error handler
+        }
+        console.log(`${connectionType.toUpperCase()} WebSocket closed (${code} ${reason}); reconnecting in 1 second...`);
+        headsetConnected = false;
+        clearMessageBuffer();
+        setTimeout(() => {
+            if (ws === socket) {
+                connectWebSocketClient();
+            }
+        }, 1000);
+    });
+
     ws.on('message', function incoming(data) {
         // console.log('Received:', data);
         let latestData = [];
@@ -201,57 +314,19 @@ function connectWebSocketClient() {
                 // Parse the string as JSON
                 const jsonData = JSON.parse(dataString);
 
-                // Handle different data formats based on the EEG data source
-                if (connectionType === 'emotiv') {
-                    // Emotiv data format enhanced: {time, values, qualityData: {timestamp, data: [...]}}
-                    // Marking headset as connected only upon receiving actual data
-                    if (jsonData.time && Array.isArray(jsonData.values)) {
-                        if (!headsetConnected) {
-                            serverState.errorSinceReady = false;
-                            headsetConnected = true;
-                            clearMessageBuffer();
-                            eegEvents.emit('headset-connected');
-                        }
-                        messageResult.data.push(jsonData);
-                        trimMessageBuffer();
-
-                        // Handle quality data if present
-                        if (jsonData.qualityData && jsonData.qualityData.data && Array.isArray(jsonData.qualityData.data)) {
-                            const eqArray = jsonData.qualityData.data;
-                            // Expecting an array of 17 entries (3 labels and 14 channels): [batteryPercent, overall, sampleRateQuality, <EEG Sensor Quality>]
-                            const ssvepIndices = [8, 9, 10, 11];
-                            let samples = [];
-                            ssvepIndices.forEach(idx => {
-                                if (idx < eqArray.length && typeof eqArray[idx] === 'number') {
-                                    samples.push(eqArray[idx]);
-                                }
-                            });
-                            if (samples.length > 0) {
-                                // Emotiv quality scale assumed 0-4 inclusive
-                                const maxQuality = 4;
-                                const avg = samples.reduce((a, b) => a + b, 0) / samples.length;
-                                let percent = Math.round((avg / maxQuality) * 100);
-                                if (percent < 0) percent = 0;
-                                if (percent > 100) percent = 100;
-                                lastQualityPercent = percent;
-                                eegEvents.emit('quality-update', { percent });
-                            }
-                        }
-                    } else {
-                        console.log('[DEBUG] Emotiv data missing time or values:', jsonData);
-                    }
+                // Batched format: {samples: [packet, ...]} (Emotiv sender coroutine)
+                if (jsonData && Array.isArray(jsonData.samples)) {
+                    jsonData.samples.forEach(handleEegPacket);
+                } else if (jsonData && Array.isArray(jsonData.channelNames)) {
+                    // Channel layout is sent once on connect (and again only if it changes)
+                    console.log(`[INFO] EEG channels: ${jsonData.channelNames.join(', ')}`);
+                } else if (jsonData && jsonData.qualityData) {
+                    handleQualityData(jsonData.qualityData);
+                } else if (jsonData && jsonData.deviceData) {
+                    // Device info (battery, signal) changes rarely and is not used by the pipeline yet
+                    lastDeviceData = jsonData.deviceData;
                 } else {
-                    // LSL data format: {time: timestamp, values: [ch1, ch2, ...]}
-                    if (jsonData && (jsonData.time !== undefined) && Array.isArray(jsonData.values)) {
-                        if (!headsetConnected) {
-                            serverState.errorSinceReady = false;
-                            headsetConnected = true;
-                            clearMessageBuffer();
-                            eegEvents.emit('headset-connected');
-                        }
-                        messageResult.data.push(jsonData);
-                        trimMessageBuffer();
-                    }
+                    handleEegPacket(jsonData);
                 }
             } catch (error) {
                 console.error("Failed to parse JSON:", error.message);
@@ -270,10 +345,27 @@ function connectWebSocketClient() {
     });
 }
 
+// Sends a stimulus marker (e.g. 'gaze-start', 'gaze-end', 'decision') to the EEG server, which stamps it
+// with the acquisition clock and stores it next to the recorded samples (see src/ssvep/lsl/markers.py)
+function sendMarker(type, fields = {}) {
+    if (!ws || ws.readyState !== WebSocket.OPEN) {
+        return false;
+    }
+
+    try {
+        ws.send(JSON.stringify({ marker: { type, clientTime: Date.now() / 1000, ...fields } }));
+        return true;
+    } catch (error) {
+        console.error('Failed to send EEG marker:', error.message);
+        return false;
+    }
+}
+
 async function disconnectWebSocketClient() {
     if (ws) {
-        try { await ws.close(); } catch (_) { }
-        ws = null;
+        const socket = ws;
+        ws = null; // Before closing, so the close handler does not reconnect
+        try { await socket.close(); } catch (_) { }
     }
     headsetConnected = false;
     clearMessageBuffer(); // ensure buffer cleared when socket closes
@@ -334,7 +426,28 @@ async function ensurePythonShell() {
                 const shell = new PythonShell(scriptPath, { mode: 'json' });
 
                 shell.on('stderr', (error) => {
-                    console.error('Python Error:', error.toString());
+                    const line = error.toString();
+                    // run_fbcca.py reports finished profiling sessions on stderr (see profiling.py)
+                    if (line.startsWith('{"jsonrpc"')) {
+                        try {
+                            const params = JSON.parse(line).params || {};
+                            if (params.type === 'profile-written') {
+                                console.log('FBCCA profile written to', params.path);
+                                eegEvents.emit('profile-written', { source: 'fbcca', ...params });
+                                return;
+                            }
+                            if (params.type === 'fbcca-level') {
+                                console.log(`FBCCA level ${params.level} (budget ${params.budgetMs} ms):`, params.settings);
+                                eegEvents.emit('fbcca-level', params);
+                                return;
+                            }
+                        } catch (_) { }
+                    }
+                    if (line.startsWith('[INFO]')) {
+                        console.log('Python:', line);
+                        return;
+                    }
+                    console.error('Python Error:', line);
                 });
 
                 shell.on('close', (code) => {
@@ -368,14 +481,20 @@ function runPythonFbcca(eegData, scenarioId, stimuliFrequencies, activeButtonIds
         const shell = await ensurePythonShell();
 
         return new Promise((resolve, reject) => {
-            const handleMessage = (selectedButtonId) => {
+            const handleMessage = (response) => {
                 shell.removeListener('message', handleMessage);
                 shell.removeListener('close', handleClose);
-                if (selectedButtonId && typeof selectedButtonId === 'object' && selectedButtonId.error) {
-                    reject(new Error(selectedButtonId.error));
+                if (response && typeof response === 'object' && response.error) {
+                    reject(new Error(response.error));
+                    return;
+                }
+                // { label, level }: level is the latency governor's cost level (0 = full FBCCA, see latency_governor.py)
+                if (response && typeof response === 'object' && 'label' in response) {
+                    fbccaLevel = response.level;
+                    resolve(response.label);
                     return;
                 }
-                resolve(selectedButtonId);
+                resolve(response);
             };
 
             const handleError = (error) => {
@@ -409,6 +528,30 @@ function runPythonFbcca(eegData, scenarioId, stimuliFrequencies, activeButtonIds
     });
 }
 
+// Profiles the next `calls` classifications in run_fbcca.py; the result arrives as a 'profile-written' event
+function profileFbcca(calls = 20) {
+    return queuePythonTask(async () => {
+        const shell = await ensurePythonShell();
+        shell.send({ profile: { calls } });
+        return true;
+    });
+}
+
+// Profiles the EEG server's event loop for `seconds`; the result arrives as a 'profile-written' event
+function profileEegServer(seconds = 10) {
+    if (!ws || ws.readyState !== WebSocket.OPEN) {
+        return false;
+    }
+
+    try {
+        ws.send(JSON.stringify({ profile: { seconds } }));
+        return true;
+    } catch (error) {
+        console.error('Failed to request EEG server profile:', error.message);
+        return false;
+    }
+}
+
 // Function to handle incoming WebSocket data
 async function processDataWithFbcca(currentScenarioID, viewsList, stimuliFrequencies, activeButtonIds) {
     if (!headsetConnected) {
@@ -431,6 +574,10 @@ async function processDataWithFbcca(currentScenarioID, viewsList, stimuliFrequen
         const dataPoints = messageResult.data.slice(-requiredSampleCount);
         messageResult.data = [];
 
+        // The classified window ends here and the next one starts collecting
+        sendMarker('gaze-end', { scenarioId: currentScenarioID });
+        sendMarker('gaze-start', { scenarioId: currentScenarioID, frequencies: stimuliFrequencies, buttonIds: activeButtonIds });
+
         console.log('Sample data point:', dataPoints[0]);
 
         // Determine the actual number of channels from the first data point
@@ -465,6 +612,8 @@ async function processDataWithFbcca(currentScenarioID, viewsList, stimuliFrequen
 
         // Run fbcca in Python
         return runPythonFbcca(eegData, currentScenarioID, stimuliFrequencies, activeButtonIds).then((selectedButtonId) => {
+            sendMarker('decision', { scenarioId: currentScenarioID, selectedButtonId, fbccaLevel });
+
             if (parseInt(selectedButtonId) !== -1) {
                 console.log('PYTHON - User selected button', selectedButtonId);
 
@@ -491,6 +640,9 @@ module.exports = {
     disconnectWebSocketClient,
     stopEegInfrastructure,
     processDataWithFbcca,
+    sendMarker,
+    profileFbcca,
+    profileEegServer,
     eegEvents,
     getEmotivEnvPath
 };
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""Baseline store and regression check for benchmark results.
+
+    python bench_compare.py save NAME result.json        store a result as baseline NAME
+    python bench_compare.py list                         list the stored baselines
+    python bench_compare.py compare NAME result.json     compare a result with baseline NAME (or a file)
+                            [--alpha 0.01] [--threshold 0.05] [--all]
+
+Understands the JSON written by bench_fbcca.py (one entry per case and
+parameters, timed samples in samplesSecs) and bench_latency.py (one entry per
+hop, one sample per decision). Baselines are kept as-is in BOGGLE_BASELINE_DIR,
+or the baselines folder next to this script.
+
+An entry counts as slower (or faster) only if both
+  - the median moved by more than --threshold (relative), and
+  - the change is significant: a two-sided Mann-Whitney U test on the samples
+    gives p < --alpha.
+With fewer than MIN_TEST_SAMPLES samples on either side the test cannot reach
+a useful p-value; a median that moved by more than --threshold is then only
+reported as "inconclusive" (rerun with more bench_fbcca.py --repeats or
+bench_latency.py --decisions). Timing noise alone therefore rarely flags
+anything, while a consistent shift of a few percent on a well-sampled case does.
+
+Exits with status 1 if any entry is slower, so the comparison can gate a
+release; inconclusive entries and entries only present on one side are listed
+but never fail it.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+
+from scipy.stats import mannwhitneyu
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ---------- CONFIGS ----------
+DEFAULT_BASELINE_DIR = os.path.join(BASE_DIR, "baselines")
+DEFAULT_ALPHA = 0.01             # Significance level of the Mann-Whitney U test
+DEFAULT_THRESHOLD = 0.05         # Relative median change below which nothing is flagged
+MIN_TEST_SAMPLES = 5             # Fewer samples on a side: changes are only reported as inconclusive
+# ---------- CONFIGS ----------
+
+
+def baseline_dir():
+    return os.environ.get("BOGGLE_BASELINE_DIR") or DEFAULT_BASELINE_DIR
+
+
+def baseline_path(name):
+    """Path of baseline `name`, or `name` itself if it is an existing file."""
+    if os.path.isfile(name):
+        return name
+    return os.path.join(baseline_dir(), f"{name}.json")
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def entries(report):
+    """{key: [seconds, ...]} of a bench_fbcca.py or bench_latency.py report."""
+    if "results" in report:
+        out = {}
+        for result in report["results"]:
+            params = " ".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+            out[f"{result['case']} {params}"] = result["samplesSecs"]
+        return out
+    if "decisions" in report:
+        hops = report["decisions"][0]["hops"] if report["decisions"] else {}
+        return {f"latency {hop}": [d["hops"][hop] for d in report["decisions"] if d["hops"][hop] is not None]
+                for hop in hops}
+    raise ValueError("Not a bench_fbcca.py or bench_latency.py result.")
+
+
+def compare_samples(base, new, alpha=DEFAULT_ALPHA, threshold=DEFAULT_THRESHOLD):
+    """Compare two sample lists. Returns a dict with the medians, change, p-value and verdict."""
+    base_median, new_median = statistics.median(base), statistics.median(new)
+    change = (new_median - base_median) / base_median if base_median else 0.0
+    p_value = None
+    verdict = "same"
+    if abs(change) > threshold:
+        if len(base) < MIN_TEST_SAMPLES or len(new) < MIN_TEST_SAMPLES:
+            verdict = "inconclusive"
+        else:
+            p_value = float(mannwhitneyu(base, new, alternative="two-sided").pvalue)
+            if p_value < alpha:
+                verdict = "slower" if change > 0 else "faster"
+    return {"baseMedian": base_median, "newMedian": new_median, "change": change, "p": p_value, "verdict": verdict}
+
+
+def compare(base_report, new_report, alpha=DEFAULT_ALPHA, threshold=DEFAULT_THRESHOLD):
+    """{key: comparison} for entries present in both reports, plus the keys only in one of them."""
+    base, new = entries(base_report), entries(new_report)
+    rows = {key: compare_samples(base[key], new[key], alpha, threshold)
+            for key in base if key in new and base[key] and new[key]}
+    return rows, sorted(set(base) - set(new)), sorted(set(new) - set(base))
+
+
+def environment_changes(base_report, new_report):
+    base_env, new_env = base_report.get("environment", {}), new_report.get("environment", {})
+    return {k: (base_env.get(k), new_env.get(k)) for k in sorted(set(base_env) | set(new_env))
+            if base_env.get(k) != new_env.get(k)}
+
+
+def print_table(rows, show_all=False):
+    order = {"slower": 0, "faster": 1, "inconclusive": 2, "same": 3}
+    shown = sorted(((k, r) for k, r in rows.items() if show_all or r["verdict"] != "same"),
+                   key=lambda item: (order[item[1]["verdict"]], -abs(item[1]["change"])))
+    if not shown:
+        print("[INFO] No significant changes.")
+        return
+    width = max(len(key) for key, _ in shown)
+    print(f"{'entry':<{width}} {'base ms':>10} {'new ms':>10} {'change':>8} {'p':>8}  verdict")
+    for key, r in shown:
+        p = f"{r['p']:.4f}" if r["p"] is not None else "-"
+        print(f"{key:<{width}} {r['baseMedian'] * 1e3:>10.3f} {r['newMedian'] * 1e3:>10.3f} "
+              f"{r['change'] * 100:>+7.1f}% {p:>8}  {r['verdict']}")
+
+
+def cmd_save(args):
+    os.makedirs(baseline_dir(), exist_ok=True)
+    entries(load(args.result))  # Refuse files that cannot be compared later
+    target = os.path.join(baseline_dir(), f"{args.name}.json")
+    shutil.copyfile(args.result, target)
+    print(f"[INFO] Baseline '{args.name}' saved to {target}")
+    return 0
+
+
+def cmd_list(args):
+    directory = baseline_dir()
+    names = sorted(f[:-5] for f in os.listdir(directory) if f.endswith(".json")) if os.path.isdir(directory) else []
+    for name in names:
+        report = load(os.path.join(directory, f"{name}.json"))
+        print(f"{name:<30} {report.get('created', '-'):<20} {len(entries(report))} entries")
+    if not names:
+        print(f"[INFO] No baselines in {directory}")
+    return 0
+
+
+def cmd_compare(args):
+    path = baseline_path(args.baseline)
+    if not os.path.isfile(path):
+        print(f"[ERROR] No baseline '{args.baseline}' ({path}).")
+        return 2
+    base_report, new_report = load(path), load(args.result)
+
+    for key, (before, after) in environment_changes(base_report, new_report).items():
+        print(f"[WARN] environment {key}: {before} -> {after}")
+    rows, missing, added = compare(base_report, new_report, args.alpha, args.threshold)
+    print_table(rows, args.all)
+    if missing:
+        print(f"[WARN] {len(missing)} baseline entries missing from the result, e.g. {missing[0]}")
+    if added:
+        print(f"[INFO] {len(added)} entries not in the baseline, e.g. {added[0]}")
+
+    slower = sum(r["verdict"] == "slower" for r in rows.values())
+    faster = sum(r["verdict"] == "faster" for r in rows.values())
+    inconclusive = sum(r["verdict"] == "inconclusive" for r in rows.values())
+    print(f"[INFO] {len(rows)} entries compared: {slower} slower, {faster} faster, {inconclusive} inconclusive")
+    if inconclusive:
+        print(f"[WARN] {inconclusive} entries moved by more than {args.threshold:.0%} but have fewer than "
+              f"{MIN_TEST_SAMPLES} samples on a side; rerun with more --repeats (bench_fbcca.py) or "
+              f"--decisions (bench_latency.py) to test them.")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store benchmark baselines and check results against them")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    save = commands.add_parser("save", help="Store a result as a named baseline")
+    save.add_argument("name")
+    save.add_argument("result", help="bench_fbcca.py or bench_latency.py JSON")
+    save.set_defaults(run=cmd_save)
+
+    listing = commands.add_parser("list", help="List the stored baselines")
+    listing.set_defaults(run=cmd_list)
+
+    check = commands.add_parser("compare", help="Compare a result with a baseline")
+    check.add_argument("baseline", help="Baseline name or JSON file")
+    check.add_argument("result", help="bench_fbcca.py or bench_latency.py JSON")
+    check.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help="Significance level")
+    check.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                       help="Relative median change that counts (0.05 = 5%%)")
+    check.add_argument("--all", action="store_true", help="Also list unchanged entries")
+    check.set_defaults(run=cmd_compare)
+
+    args = parser.parse_args()
+    sys.exit(args.run(args))
@@ -0,0 +1,223 @@
+"""Microbenchmarks of the FBCCA stages over realistic input shapes.
+
+    python bench_fbcca.py [--channels 4,8,14] [--rates 250,256,500] [--windows 1,2,3,4]
+                          [--subbands 1,3,5] [--classes 4,8,12] [--repeats 7] [--only REGEX] [--json out.json]
+
+Cases (each run for every combination of the relevant parameters):
+  filterbank       filterbank() of one sub-band            channels, rate, window, subBand
+  filter_subbands  all sub-bands 1..subBands              channels, rate, window, subBands
+  cca_reference    reference signals                       window, classes, harmonics
+  cca              subband_correlations() (the CCA step)   channels, window, subBands, classes
+  fbcca            filtering + CCA + decision              channels, rate, window, subBands, classes
+  test_fbcca       test_fbcca() as run_fbcca calls it      channels, window, classes (configured rate/subBands/harmonics)
+
+Input windows are synthetic SSVEP trials (see lsl/synthetic_ssvep.py), so the
+timings are made on data with a realistic spectrum rather than white noise.
+
+Every case is timed with timeit: after one warm-up call the loop count is doubled
+until one sample takes at least MIN_SAMPLE_SECS, then --repeats samples are taken,
+each the mean time of one call over that many loops. The JSON result keeps every
+sample next to the median, percentiles and spread, together with the library
+versions and the machine, so results can be compared across commits (see
+bench_compare.py).
+
+The full default grid takes about 20 minutes on one core (the fbcca and cca
+cases dominate); narrow it with the list options or --only.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import timeit
+
+import numpy as np
+import scipy
+import sklearn
+
+from fbcca_config_service import fbcca_config
+from filterbank import filterbank
+from test_fbcca import cca_reference, fbcca_decision, fbcca_rho, filter_subbands, subband_correlations, test_fbcca
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Adding the sibling folder lsl to sys.path for the synthetic SSVEP generator.
+LSL_DIR = os.path.join(os.path.dirname(BASE_DIR), "lsl")
+if LSL_DIR not in sys.path:
+    sys.path.insert(0, LSL_DIR)
+
+from synthetic_ssvep import synthetic_trial  # noqa: E402
+
+# ---------- CONFIGS ----------
+DEFAULT_CHANNELS = "4,8,14"      # Unicorn/OpenBCI subsets, 8-channel default, Emotiv EpocX
+DEFAULT_RATES = "250,256,500"    # 256 is the filter bank's native rate; others are resampled
+DEFAULT_WINDOWS = "1,2,3,4"      # Seconds
+DEFAULT_SUBBANDS = "1,3,5"
+DEFAULT_CLASSES = "4,8,12"
+DEFAULT_REPEATS = 7
+MIN_SAMPLE_SECS = 0.05           # Minimum timed duration of one sample
+PERCENTILES = (5, 25, 75, 95)
+# ---------- CONFIGS ----------
+
+CASES = ("filterbank", "filter_subbands", "cca_reference", "cca", "fbcca", "test_fbcca")
+
+
+def _parse_list(text, cast):
+    return sorted({cast(value) for value in text.split(",") if value.strip()})
+
+
+def class_frequencies(num_classes):
+    """Stimulus frequencies 0.5 Hz apart from 6 Hz, like the low-frequency scenarios."""
+    return [6.0 + 0.5 * i for i in range(num_classes)]
+
+
+def trial(channels, rate, window, num_classes, seed=0):
+    """Synthetic (channels, samples) gaze window on class 0."""
+    return synthetic_trial(class_frequencies(num_classes), seconds=window, channels=channels,
+                           sampling_rate=rate, seed=seed).astype(np.float64)
+
+
+def measure(fn, repeats=DEFAULT_REPEATS, min_sample_secs=MIN_SAMPLE_SECS):
+    """Time fn(). Returns (loops per sample, [seconds per call for each sample])."""
+    fn()  # Warm-up: filter design caches, lazy imports
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_sample_secs:
+            break
+        number *= 2
+    return number, [timer.timeit(number) / number for _ in range(repeats)]
+
+
+def summarise(samples):
+    """Median, percentiles (linear interpolation) and spread, in seconds."""
+    ordered = sorted(samples)
+    summary = {
+        "medianSecs": statistics.median(ordered),
+        "meanSecs": statistics.fmean(ordered),
+        "minSecs": ordered[0],
+        "maxSecs": ordered[-1],
+        "stdevSecs": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+    }
+    for p in PERCENTILES:
+        summary[f"p{p:02d}Secs"] = float(np.percentile(ordered, p))
+    return summary
+
+
+def iter_cases(grid):
+    """Yield (case name, params, callable) for the whole grid."""
+    harmonics = fbcca_config["harmonics"]
+    max_subbands = max(grid["subBands"])
+
+    for channels in grid["channels"]:
+        for rate in grid["rates"]:
+            for window in grid["windows"]:
+                eeg = trial(channels, rate, window, max(grid["classes"]))
+                base = {"channels": channels, "rate": rate, "window": window}
+                for idx in range(1, max_subbands + 1):
+                    yield "filterbank", dict(base, subBand=idx), lambda e=eeg, i=idx, r=rate: filterbank(e, i, fs=r)
+                for subbands in grid["subBands"]:
+                    yield ("filter_subbands", dict(base, subBands=subbands),
+                           lambda e=eeg, s=subbands, r=rate: filter_subbands(e, s, fs=r))
+                    for classes in grid["classes"]:
+                        freqs = class_frequencies(classes)
+
+                        def full(e=eeg, s=subbands, r=rate, f=freqs):
+                            return fbcca_decision(fbcca_rho(subband_correlations(filter_subbands(e, s, fs=r), f)))
+
+                        yield "fbcca", dict(base, subBands=subbands, classes=classes), full
+
+    # The CCA step only sees 256 Hz sub-bands, so the input rate does not matter
+    for window in grid["windows"]:
+        num_samples = int(round(256 * window))
+        for classes in grid["classes"]:
+            yield ("cca_reference", {"window": window, "classes": classes, "harmonics": harmonics},
+                   lambda n=num_samples, f=class_frequencies(classes): cca_reference(f, n, fs=256))
+        for channels in grid["channels"]:
+            subbands_256 = filter_subbands(trial(channels, 256, window, max(grid["classes"])), max_subbands, fs=256)
+            for subbands in grid["subBands"]:
+                for classes in grid["classes"]:
+                    yield ("cca", {"channels": channels, "window": window, "subBands": subbands, "classes": classes},
+                           lambda b=subbands_256[:subbands], f=class_frequencies(classes): subband_correlations(b, f))
+
+    # Exactly what run_fbcca runs per request
+    rate = fbcca_config["samplingRate"]
+    for channels in grid["channels"]:
+        for window in grid["windows"]:
+            for classes in grid["classes"]:
+                eeg = trial(channels, rate, window, classes)
+                yield ("test_fbcca", {"channels": channels, "rate": rate, "window": window, "classes": classes,
+                                      "subBands": fbcca_config["subBands"], "harmonics": harmonics},
+                       lambda e=eeg, f=class_frequencies(classes): test_fbcca(e, f))
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "sklearn": sklearn.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.platform(),
+        "cpus": os.cpu_count(),
+        "fbccaConfig": {k: fbcca_config[k] for k in ("samplingRate", "subBands", "harmonics")},
+    }
+
+
+def run(grid, repeats=DEFAULT_REPEATS, only=None, progress=True):
+    """Run every case of the grid (optionally only names matching the regex `only`). Returns the result dict."""
+    pattern = re.compile(only) if only else None
+    results = []
+    started = time.perf_counter()
+    for name, params, fn in iter_cases(grid):
+        if pattern is not None and not pattern.search(name):
+            continue
+        number, samples = measure(fn, repeats)
+        result = {"case": name, "params": params, "loops": number, "samplesSecs": samples}
+        result.update(summarise(samples))
+        results.append(result)
+        if progress:
+            shown = " ".join(f"{k}={v}" for k, v in params.items())
+            print(f"{name:<16} {shown:<60} median {result['medianSecs'] * 1e3:9.3f} ms "
+                  f"p95 {result['p95Secs'] * 1e3:9.3f} ms")
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "grid": grid,
+        "repeats": repeats,
+        "wallSecs": time.perf_counter() - started,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks of filterbank, cca_reference and test_fbcca")
+    parser.add_argument("--channels", default=DEFAULT_CHANNELS)
+    parser.add_argument("--rates", default=DEFAULT_RATES)
+    parser.add_argument("--windows", default=DEFAULT_WINDOWS, help="Window lengths in seconds")
+    parser.add_argument("--subbands", default=DEFAULT_SUBBANDS)
+    parser.add_argument("--classes", default=DEFAULT_CLASSES)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="Timed samples per case")
+    parser.add_argument("--only", default=None, help=f"Regex on case names ({', '.join(CASES)})")
+    parser.add_argument("--json", default=None, help="Write the results to this file")
+    args = parser.parse_args()
+
+    grid = {
+        "channels": _parse_list(args.channels, int),
+        "rates": _parse_list(args.rates, float),
+        "windows": _parse_list(args.windows, float),
+        "subBands": _parse_list(args.subbands, int),
+        "classes": _parse_list(args.classes, int),
+    }
+    report = run(grid, args.repeats, args.only)
+    print(f"[INFO] {len(report['results'])} cases in {report['wallSecs']:.1f}s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Results written to {args.json}")
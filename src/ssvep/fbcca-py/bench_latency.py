@@ -0,0 +1,260 @@
+"""End-to-end sample-to-decision latency benchmark (headless).
+
+    python bench_latency.py [--decisions 20] [--scenario 0] [--snr -5] [--window SECS]
+                            [--replay session.bglrec] [--json out.json]
+
+Runs the path the app uses, without the app:
+  source       synthetic SSVEP (or a replayed recording, --replay) paced in real time
+  server       AcquisitionHub + websockets on an ephemeral localhost port, in a thread
+  client       WebSocket client collecting samples like eeg-pipeline.js (messageResult.data)
+  window       once gazeLengthInSecs of samples are in, organise them by channel and
+               serialise the run_fbcca request, like processDataWithFbcca/runPythonFbcca
+  worker       run_fbcca.py as a subprocess speaking its JSON-lines stdio protocol
+
+Hops, all measured per decision on the packet that completed the window:
+  acquisition  last sample's timestamp -> hub.publish (generation, filtering, pacing)
+  websocket    hub.publish -> client received the packet (queue, send, receive)
+  windowBuild  packet received -> request serialised (JSON decode, slicing, by-channel copy)
+  stdio        request written -> response read, minus the worker's own decode and classify
+  decode       worker parsing the request into an array (reported with FBCCA_TIMING=1)
+  classify     run_fbcca() in the worker
+  total        last sample's timestamp -> response read
+and p50/p95/p99 are reported for each. The acquisition and websocket hops are also
+summarised over every packet, not only the window-completing ones.
+
+Windows are classified as soon as they are complete (the app waits for its
+bciInterval tick, which adds up to one interval on top). Server and client share
+this process, so on a single core they compete for the GIL much like the servers
+and the app compete for the CPU.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import websockets
+
+from fbcca_config_service import fbcca_config
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Adding the sibling folder lsl to sys.path for the servers' building blocks.
+LSL_DIR = os.path.join(os.path.dirname(BASE_DIR), "lsl")
+if LSL_DIR not in sys.path:
+    sys.path.insert(0, LSL_DIR)
+
+from acquisition_hub import AcquisitionHub  # noqa: E402
+from synthetic_ssvep import DEFAULT_SNR_DB, GazeScript, scenario_stimuli  # noqa: E402
+
+# ---------- CONFIGS ----------
+DEFAULT_DECISIONS = 20
+PERCENTILES = (50, 95, 99)
+HOPS = ("acquisition", "websocket", "windowBuild", "stdio", "decode", "classify", "total")
+SERVER_START_TIMEOUT = 10.0     # Seconds to wait for the in-process server to listen
+# ---------- CONFIGS ----------
+
+
+class TimedHub(AcquisitionHub):
+    """AcquisitionHub that remembers when each sample packet (by its seq) was published."""
+
+    def __init__(self, producer, **kwargs):
+        super().__init__(producer, **kwargs)
+        self.publish_times = {}
+
+    def publish(self, packet):
+        if packet.startswith('{"seq": '):
+            self.publish_times[int(packet[8:packet.index(",", 8)])] = time.time()
+        super().publish(packet)
+
+
+def make_producer(args):
+    if args.replay:
+        from replay_websocket_server import make_replay_producer
+        return make_replay_producer(args.replay, speed=1.0, loop=True, restamp=True)
+
+    from synthetic_websocket_server import make_synthetic_producer
+    frequencies, phases = scenario_stimuli(args.scenario)
+    script = GazeScript.parse(",".join(f"{i}:{args.window}" for i in range(len(frequencies))))
+    return make_synthetic_producer(frequencies, phases, script, snr_db=args.snr, seed=0)
+
+
+def start_server(hub):
+    """Serve hub on an ephemeral port in a daemon thread. Returns (port, loop)."""
+    ready = threading.Event()
+    state = {}
+
+    async def serve():
+        return await websockets.serve(hub.serve_client, "localhost", 0)
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(serve())
+        state["port"] = server.sockets[0].getsockname()[1]
+        state["loop"] = loop
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    if not ready.wait(SERVER_START_TIMEOUT):
+        raise RuntimeError("The benchmark server did not start.")
+    return state["port"], state["loop"]
+
+
+class FbccaWorker:
+    """run_fbcca.py subprocess; request() returns (response {label, level}, sent time, response time, worker timing)."""
+
+    async def start(self):
+        env = dict(os.environ, FBCCA_TIMING="1")
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-u", os.path.join(BASE_DIR, "run_fbcca.py"), cwd=BASE_DIR, env=env,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+
+    async def request(self, payload):
+        started = time.time()
+        self.process.stdin.write(payload)
+        await self.process.stdin.drain()
+        response = json.loads(await self.process.stdout.readline())
+        finished = time.time()
+        while True:
+            # Skip warnings until the timing line that follows every response
+            line = await self.process.stderr.readline()
+            if not line:
+                raise RuntimeError("run_fbcca.py exited.")
+            message = json.loads(line) if line.startswith(b"{") else {}
+            if "error" in message:
+                raise RuntimeError(f"run_fbcca.py: {message['error']}")
+            if "timing" in message:
+                return response, started, finished, message["timing"]
+
+    async def close(self):
+        self.process.stdin.close()
+        await self.process.wait()
+
+
+def build_request(samples, required, channels, scenario_id):
+    """Latest `required` samples organised by channel, serialised as runPythonFbcca sends them."""
+    points = samples[-required:]
+    eeg_data = [[] for _ in range(channels)]
+    for point in points:
+        for i, value in enumerate(point["values"][:channels]):
+            eeg_data[i].append(value)
+    message = {"eegData": eeg_data, "scenario_id": scenario_id, "stim_freqs": None, "active_button_ids": None}
+    return (json.dumps(message) + "\n").encode()
+
+
+def percentiles(values):
+    if not values:
+        return None
+    array = np.asarray(values) * 1e3
+    summary = {f"p{p}Ms": float(np.percentile(array, p)) for p in PERCENTILES}
+    summary.update(meanMs=float(array.mean()), maxMs=float(array.max()), count=len(values))
+    return summary
+
+
+async def run_client(port, hub, args):
+    required = int(math.ceil(args.window * fbcca_config["samplingRate"]))
+    channels = fbcca_config["channels"]
+    worker = FbccaWorker()
+    await worker.start()
+    # An all-zero window is answered without classifying; it only waits for the worker's imports
+    await worker.request(build_request([{"values": [0.0] * channels}] * required, required, channels, args.scenario))
+
+    decisions, packets = [], {"acquisition": [], "websocket": []}
+    samples = []
+
+    async def classify(payload, last_time, published, received, built):
+        response, sent, finished, timing = await worker.request(payload)
+        roundtrip = finished - sent
+        hops = {
+            "acquisition": None if published is None else published - last_time,
+            "websocket": None if published is None else received - published,
+            "windowBuild": built - received,
+            "stdio": roundtrip - timing["decodeSecs"] - timing["classifySecs"],
+            "decode": timing["decodeSecs"],
+            "classify": timing["classifySecs"],
+            "total": finished - last_time,
+        }
+        decisions.append({"label": response["label"], "level": response["level"], "hops": hops})
+        print(f"[INFO] decision {len(decisions)}/{args.decisions}: label {response['label']}, level {response['level']}, "
+              f"total {hops['total'] * 1e3:.1f} ms, classify {hops['classify'] * 1e3:.1f} ms")
+
+    pending = None
+    try:
+        async with websockets.connect(f"ws://localhost:{port}", max_size=None) as websocket:
+            while len(decisions) < args.decisions:
+                message = await websocket.recv()
+                received = time.time()
+                data = json.loads(message)
+                if "samples" not in data or not data["samples"]:
+                    continue
+
+                last_time = data["samples"][-1]["time"]
+                published = hub.publish_times.pop(data.get("seq"), None)
+                if published is not None:
+                    packets["acquisition"].append(published - last_time)
+                    packets["websocket"].append(received - published)
+
+                samples.extend(data["samples"])
+                if len(samples) < required or (pending is not None and not pending.done()):
+                    continue
+
+                payload = build_request(samples, required, channels, args.scenario)
+                built = time.time()
+                samples = []
+                # Keep receiving while the worker runs, as the app does; one request at a time
+                pending = asyncio.create_task(classify(payload, last_time, published, received, built))
+            if pending is not None:
+                await pending
+    finally:
+        await worker.close()
+
+    summary = {hop: percentiles([d["hops"][hop] for d in decisions if d["hops"][hop] is not None]) for hop in HOPS}
+    return {
+        "windowSamples": required,
+        "decisions": decisions,
+        "hops": summary,
+        "perPacket": {hop: percentiles(values) for hop, values in packets.items()},
+    }
+
+
+def print_report(report):
+    print(f"{'hop':<12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for hop in HOPS:
+        s = report["hops"][hop]
+        if s is not None:
+            print(f"{hop:<12} {s['p50Ms']:>9.2f} {s['p95Ms']:>9.2f} {s['p99Ms']:>9.2f} {s['maxMs']:>9.2f}")
+    for hop, s in report["perPacket"].items():
+        if s is not None:
+            print(f"{hop + ' (all)':<12} {s['p50Ms']:>9.2f} {s['p95Ms']:>9.2f} {s['p99Ms']:>9.2f} {s['maxMs']:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end sample-to-decision latency benchmark")
+    parser.add_argument("--decisions", type=int, default=DEFAULT_DECISIONS, help="Windows to classify")
+    parser.add_argument("--scenario", type=int, default=0, help="Scenario sent to run_fbcca (and simulated)")
+    parser.add_argument("--snr", type=float, default=DEFAULT_SNR_DB, help="Synthetic SSVEP SNR in dB")
+    parser.add_argument("--window", type=float, default=None,
+                        help="Window length in seconds (default: gazeLengthInSecs)")
+    parser.add_argument("--replay", default=None, help="Replay this recording instead of synthetic EEG")
+    parser.add_argument("--json", default=None, help="Write the per-decision hops and summary to this file")
+    args = parser.parse_args()
+    if args.window is None:
+        args.window = fbcca_config["gazeLengthInSecs"]
+
+    hub = TimedHub(make_producer(args))
+    port, server_loop = start_server(hub)
+    report = asyncio.run(run_client(port, hub, args))
+    server_loop.call_soon_threadsafe(server_loop.stop)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Results written to {args.json}")
@@ -0,0 +1,311 @@
+"""Offline FBCCA evaluation over recorded sessions with gaze markers.
+
+    python evaluate_fbcca.py <session.bglrec> [<session.bglrec> ...] [--window 4] [--workers N]
+                             [--gaze-shift 1] [--cache-dir DIR | --no-cache] [--json]
+
+Trials are sliced from each recording's markers.jsonl (see recording.read_markers
+and src/ssvep/lsl/markers.py): a "gaze-start" marker opens a trial and the next
+"gaze-end" or "gaze-start" closes it. The target (class index, -1 for idle) comes
+from the marker's "target" or "buttonId", or from a "target" marker sent since the
+previous gaze-start (it labels only the one gaze that follows it).
+The classified window is the first --window seconds of the trial, i.e. what the
+app collects before it runs run_fbcca. Trials are classified in a process pool;
+the filtered sub-bands of each window are cached on disk, so re-running with
+other harmonics or thresholds only repeats the CCA.
+
+Reported per session and overall:
+  accuracy         correct / targeted (non-idle) trials
+  itrBitsPerMin    Wolpaw information transfer rate for window + gaze shift seconds per selection
+  idleFalsePositiveRate   idle trials that were classified as a target
+  decisionsPerSec  trials classified per second of wall-clock time (all workers)
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fbcca_config_service import fbcca_config
+from filterbank import filterbank
+from test_fbcca import fbcca_decision, fbcca_rho, subband_correlations
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Adding the sibling folder lsl to sys.path so it can read recordings.
+LSL_DIR = os.path.join(os.path.dirname(BASE_DIR), "lsl")
+if LSL_DIR not in sys.path:
+    sys.path.insert(0, LSL_DIR)
+
+from compressed_recording import open_recording  # noqa: E402
+from recording import META_FILE, load_markers  # noqa: E402
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "boggle-fbcca")
+CACHE_VERSION = 1   # Bump when filterbank() changes, to invalidate cached sub-bands
+
+# Recordings opened by this worker process, by path
+_RECORDINGS = {}
+
+
+def _recording(path):
+    recording = _RECORDINGS.get(path)
+    if recording is None:
+        recording = _RECORDINGS[path] = open_recording(path)
+    return recording
+
+
+def _marker_target(marker, label_marker, button_ids_for):
+    """Class index a gaze marker targets: its own "target"/"buttonId", else label_marker's (if any)."""
+    for source in (marker, label_marker):
+        if not source:
+            continue
+        if source.get("target") is not None:
+            return int(source["target"])
+        button_id = source.get("buttonId")
+        if button_id is not None:
+            button_ids = source.get("buttonIds") or marker.get("buttonIds") or button_ids_for(marker.get("scenarioId"))
+            return button_ids.index(button_id) if button_id in button_ids else fbcca_config["idleStateLabel"]
+    return None
+
+
+def extract_trials(path):
+    """Return the labelled gaze trials of a recording as dicts: start, end, target, scenarioId, frequencies.
+
+    Gaze windows marked by the app during normal use carry no target; they are
+    labelled by a "target" field on the marker itself or by a "target" marker
+    (sent by a calibration view) stamped after the previous gaze-start, and
+    skipped when neither exists. A "target" marker labels only the next gaze, so
+    one calibration prompt never becomes the ground truth of later free use.
+    """
+    from run_fbcca import get_stimuli_frequencies, scenario_config
+
+    def scenario_button_ids(scenario_id):
+        scenario = (scenario_config or {}).get(f"scenario_{scenario_id}", {})
+        return scenario.get("buttonIds", [])
+
+    markers = load_markers(path)
+    trials = []
+    current = None
+    pending_label = None   # "target" marker not yet consumed by a gaze-start
+    for marker in markers:
+        if marker["type"] == "target":
+            pending_label = marker
+            continue
+        if marker["type"] not in ("gaze-start", "gaze-end"):
+            continue
+        if current is not None:
+            current["end"] = marker["time"]
+            trials.append(current)
+            current = None
+        if marker["type"] == "gaze-start":
+            label_marker, pending_label = pending_label, None
+            target = _marker_target(marker, label_marker, scenario_button_ids)
+            if target is None:
+                continue
+            frequencies = marker.get("frequencies") or get_stimuli_frequencies(marker.get("scenarioId", -1))
+            current = {
+                "session": path,
+                "start": marker["time"],
+                "end": None,
+                "target": target,
+                "scenarioId": marker.get("scenarioId"),
+                "frequencies": list(frequencies) if frequencies else [],
+            }
+    if current is not None:
+        trials.append(current)
+    return [trial for trial in trials if trial["frequencies"]]
+
+
+def trial_window(trial, num_samples):
+    """(start index, eeg (channels, samples)) of the first num_samples of a trial, or (None, None) if too short."""
+    recording = _recording(trial["session"])
+    start = recording.index_at(trial["start"])
+    end = recording.index_at(trial["end"]) if trial["end"] is not None else len(recording)
+    if end - start < num_samples:
+        return None, None
+    channels = min(fbcca_config["channels"], recording.channels)
+    eeg = recording.samples_between(start, start + num_samples).T
+    return start, np.asarray(eeg[:channels], dtype=np.float64)
+
+
+def cached_subbands(trial, num_samples, num_subbands, cache_dir):
+    """Filtered sub-bands 1..num_subbands of a trial window, read from / written to the disk cache.
+
+    Returns (sub-bands, number served from cache) or (None, 0) if the trial is too short.
+    """
+    recording = _recording(trial["session"])
+    session = os.path.abspath(trial["session"])
+    start = recording.index_at(trial["start"])
+    stamp = os.path.getmtime(os.path.join(session, META_FILE))
+
+    subbands = [None] * num_subbands
+    paths = [None] * num_subbands
+    if cache_dir:
+        for i in range(num_subbands):
+            key = f"{CACHE_VERSION}|{session}|{stamp}|{start}|{num_samples}|{recording.sampling_rate}|" \
+                  f"{fbcca_config['channels']}|{i + 1}"
+            paths[i] = os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".npy")
+            if os.path.isfile(paths[i]):
+                try:
+                    subbands[i] = np.load(paths[i])
+                except (OSError, ValueError):
+                    subbands[i] = None
+
+    hits = sum(subband is not None for subband in subbands)
+    if hits < num_subbands:
+        _, eeg = trial_window(trial, num_samples)
+        if eeg is None:
+            return None, 0
+        for i in range(num_subbands):
+            if subbands[i] is None:
+                subbands[i] = filterbank(eeg, i + 1, fs=recording.sampling_rate)
+                if paths[i] is not None:
+                    tmp = paths[i] + f".{os.getpid()}.tmp.npy"
+                    np.save(tmp, subbands[i])
+                    os.replace(tmp, paths[i])
+    return subbands, hits
+
+
+def classify_trial(task):
+    """Worker: classify one trial. task = (trial, params). Returns a result dict (label None if skipped)."""
+    trial, params = task
+    recording = _recording(trial["session"])
+    num_samples = int(math.ceil(recording.sampling_rate * params["window"]))
+
+    started = time.perf_counter()
+    subbands, hits = cached_subbands(trial, num_samples, params["subBands"], params["cacheDir"])
+    if subbands is None:
+        return {"session": trial["session"], "target": trial["target"], "label": None}
+
+    rho = fbcca_rho(subband_correlations(subbands, trial["frequencies"], params["harmonics"]))
+    label = int(fbcca_decision(rho, params["threshold"]))
+    return {
+        "session": trial["session"],
+        "target": trial["target"],
+        "label": label,
+        "rho": float(np.max(rho)),
+        "classes": len(trial["frequencies"]),
+        "seconds": time.perf_counter() - started,
+        "cacheHits": hits,
+    }
+
+
+def wolpaw_itr(accuracy, num_classes, seconds_per_selection):
+    """Information transfer rate in bits/min (Wolpaw et al.)."""
+    n, p = num_classes, accuracy
+    if n < 2 or seconds_per_selection <= 0 or p <= 1.0 / n:
+        return 0.0
+    bits = math.log2(n) + p * math.log2(p)
+    if p < 1:
+        bits += (1 - p) * math.log2((1 - p) / (n - 1))
+    return bits * 60.0 / seconds_per_selection
+
+
+def summarise(results, window, gaze_shift, wall_seconds=None):
+    """Metrics over a list of classify_trial results."""
+    idle_label = fbcca_config["idleStateLabel"]
+    done = [r for r in results if r["label"] is not None]
+    targeted = [r for r in done if r["target"] != idle_label]
+    idle = [r for r in done if r["target"] == idle_label]
+
+    accuracy = sum(r["label"] == r["target"] for r in targeted) / len(targeted) if targeted else None
+    classes = int(round(np.mean([r["classes"] for r in targeted]))) if targeted else 0
+    summary = {
+        "trials": len(results),
+        "classified": len(done),
+        "skipped": len(results) - len(done),
+        "accuracy": accuracy,
+        "itrBitsPerMin": wolpaw_itr(accuracy, classes, window + gaze_shift) if accuracy is not None else None,
+        "idleTrials": len(idle),
+        "idleFalsePositiveRate": sum(r["label"] != idle_label for r in idle) / len(idle) if idle else None,
+        "meanDecisionSecs": float(np.mean([r["seconds"] for r in done])) if done else None,
+        "cacheHits": sum(r["cacheHits"] for r in done),
+    }
+    if wall_seconds is not None:
+        summary["decisionsPerSec"] = len(done) / wall_seconds if wall_seconds > 0 else None
+    return summary
+
+
+def run_trials(trials, params, workers=None, worker=classify_trial):
+    """Run worker((trial, params)) for every trial in a process pool.
+
+    Returns (results in trial order, wall-clock seconds).
+    """
+    tasks = [(trial, params) for trial in trials]
+    started = time.perf_counter()
+    if workers == 1:
+        results = [worker(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+            results = list(pool.map(worker, tasks, chunksize=chunksize))
+    return results, time.perf_counter() - started
+
+
+def evaluate(paths, window=None, subbands=None, harmonics=None, threshold=None, gaze_shift=0.0,
+             workers=None, cache_dir=DEFAULT_CACHE_DIR):
+    """Evaluate FBCCA over the sessions at `paths`. Returns {"params", "sessions", "overall"}."""
+    params = {
+        "window": float(fbcca_config["gazeLengthInSecs"] if window is None else window),
+        "subBands": int(fbcca_config["subBands"] if subbands is None else subbands),
+        "harmonics": int(fbcca_config["harmonics"] if harmonics is None else harmonics),
+        "threshold": float(fbcca_config["correlationThreshold"] if threshold is None else threshold),
+        "cacheDir": cache_dir,
+    }
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    trials = [trial for path in paths for trial in extract_trials(path)]
+    results, wall_seconds = run_trials(trials, params, workers)
+
+    sessions = {
+        path: summarise([r for r in results if r["session"] == path], params["window"], gaze_shift)
+        for path in paths
+    }
+    overall = summarise(results, params["window"], gaze_shift, wall_seconds)
+    return {"params": params, "sessions": sessions, "overall": overall}
+
+
+def _fmt(value, pattern="{:.3f}"):
+    return "-" if value is None else pattern.format(value)
+
+
+def print_report(report):
+    params = report["params"]
+    print(f"window {params['window']}s, subBands {params['subBands']}, harmonics {params['harmonics']}, "
+          f"threshold {params['threshold']}")
+    print(f"{'session':<48} {'trials':>6} {'acc':>6} {'ITR':>7} {'idleFP':>7}")
+    for path, s in list(report["sessions"].items()) + [("OVERALL", report["overall"])]:
+        print(f"{os.path.basename(path.rstrip(os.sep)):<48} {s['classified']:>6} {_fmt(s['accuracy']):>6} "
+              f"{_fmt(s['itrBitsPerMin'], '{:.1f}'):>7} {_fmt(s['idleFalsePositiveRate']):>7}")
+    overall = report["overall"]
+    print(f"{_fmt(overall.get('decisionsPerSec'), '{:.1f}')} decisions/s, "
+          f"{_fmt(overall['meanDecisionSecs'], '{:.4f}')} s per decision, "
+          f"{overall['skipped']} skipped, {overall['cacheHits']} cached sub-bands")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline FBCCA evaluation over recorded sessions")
+    parser.add_argument("sessions", nargs="+", help="Recording directories (*.bglrec) with markers.jsonl")
+    parser.add_argument("--window", type=float, default=None, help="Seconds classified per trial (gazeLengthInSecs)")
+    parser.add_argument("--subbands", type=int, default=None)
+    parser.add_argument("--harmonics", type=int, default=None)
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--gaze-shift", type=float, default=0.0, help="Seconds between selections added for ITR")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = evaluate(args.sessions, args.window, args.subbands, args.harmonics, args.threshold, args.gaze_shift,
+                      args.workers, None if args.no_cache else args.cache_dir)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
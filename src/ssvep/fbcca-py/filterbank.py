@@ -20,24 +20,28 @@ def downsample_eeg(eeg, original_fs, target_fs=256):
 
     return decimate(eeg, factor, axis=1, ftype='iir')  # Decimate along time axis
 
-def filterbank(eeg, idx_fb=1, target_fs=256):   
+def filterbank(eeg, idx_fb=1, target_fs=256, fs=None):   
     if eeg is None or idx_fb is None:
         raise ValueError('Not enough input arguments.')
 
     if idx_fb < 1 or idx_fb > 10:
         raise ValueError('The number of sub-bands must be 0 < idx_fb <= 10.')
 
+    # Accept any array-like, including memory-mapped recording windows, without copying
+    eeg = np.asarray(eeg)
     num_chans, _ = eeg.shape
-    fs_original = fbcca_config['samplingRate']
+    # The sampling rate can be given for recordings made at another rate than the configured one
+    fs_original = fbcca_config['samplingRate'] if fs is None else fs
     fs = fs_original / 2
 
-    if idx_fb not in _FILTER_COEFF_CACHE:
+    cache_key = (idx_fb, fs_original)
+    if cache_key not in _FILTER_COEFF_CACHE:
         Wp = [_PASSBAND[idx_fb - 1] / fs, 90 / fs]
         Ws = [_STOPBAND[idx_fb - 1] / fs, 100 / fs]
         N, Wn = cheb1ord(Wp, Ws, 3, 40)
-        _FILTER_COEFF_CACHE[idx_fb] = cheby1(N, 0.5, Wn, btype='band')
+        _FILTER_COEFF_CACHE[cache_key] = cheby1(N, 0.5, Wn, btype='band')
 
-    B, A = _FILTER_COEFF_CACHE[idx_fb]
+    B, A = _FILTER_COEFF_CACHE[cache_key]
 
     # Filter the EEG data
     y = np.zeros_like(eeg)
@@ -0,0 +1,121 @@
+"""Latency-budget governor for run_fbcca.py.
+
+On a slow machine a decision can take longer than the app's classification
+interval, and requests pile up in the app's queue. The governor keeps the
+durations of the last HISTORY decisions and compares their median with the
+budget (fbccaConfig "decisionBudgetMs"; 0 or missing turns the governor off,
+which is the default: the app classifies once every gazeLengthInSecs, so only a
+budget near gazeLengthInSecs * 1000 ms protects against a real backlog, and every
+step costs accuracy):
+  - over budget: step one level down the LEVELS ladder (cheaper, less accurate);
+  - every decision of a full history under HEADROOM x budget: step one level back up.
+The history is cleared on every change, so each step is judged on at least
+MIN_DECISIONS decisions made at the new level and a single slow decision (e.g.
+the first one after an idle period) never changes anything.
+
+Each level caps the configured values; a level never raises them:
+  subBands        fewer sub-bands (each one is a band-pass over all channels plus the CCA)
+  harmonics       fewer reference harmonics (smaller CCA)
+  decimate        keep every n-th input sample. Skipped below MIN_DECIMATED_RATE, since the
+                  filter bank's highest band needs a 100 Hz stopband. Nothing is filtered
+                  beforehand, so content above the new Nyquist frequency folds in.
+  windowFraction  classify only the most recent part of the window
+Levels are resolved against the configuration and sampling rate once, and a
+level whose effective settings equal the previous one's is dropped, so every
+step actually makes decisions cheaper. fbcca_rho is a weighted sum over the
+sub-bands, so a level with fewer sub-bands also scales correlationThreshold by
+the share of the filter bank weights it keeps.
+"""
+
+import collections
+import statistics
+
+from fbcca_config_service import fbcca_config
+from test_fbcca import fb_coefs
+
+# ---------- CONFIGS ----------
+LEVELS = [
+    {},
+    {"subBands": 3},
+    {"subBands": 3, "harmonics": 3},
+    {"subBands": 2, "harmonics": 2},
+    {"subBands": 2, "harmonics": 2, "decimate": 2},
+    {"subBands": 2, "harmonics": 2, "decimate": 2, "windowFraction": 0.75},
+    {"subBands": 1, "harmonics": 2, "decimate": 2, "windowFraction": 0.5},
+]
+HISTORY = 5                 # Decisions considered
+MIN_DECISIONS = 3           # Decisions at a level before it may change again
+HEADROOM = 0.5              # Step back up when every recent decision is below this fraction of the budget
+MIN_DECIMATED_RATE = 200.0  # Hz; the filter bank's top stopband edge is 100 Hz
+# ---------- CONFIGS ----------
+
+
+def effective_levels(sampling_rate=None):
+    """LEVELS resolved against fbcca_config, without levels that change nothing."""
+    sampling_rate = fbcca_config["samplingRate"] if sampling_rate is None else sampling_rate
+    full_weight = fb_coefs(fbcca_config["subBands"]).sum()
+    levels = []
+    for level in LEVELS:
+        sub_bands = min(fbcca_config["subBands"], level.get("subBands", fbcca_config["subBands"]))
+        decimate = level.get("decimate", 1)
+        if sampling_rate / decimate < MIN_DECIMATED_RATE:
+            decimate = 1
+        settings = {
+            "subBands": sub_bands,
+            "harmonics": min(fbcca_config["harmonics"], level.get("harmonics", fbcca_config["harmonics"])),
+            "decimate": decimate,
+            "windowFraction": level.get("windowFraction", 1.0),
+            "correlationThreshold": round(float(fbcca_config["correlationThreshold"]
+                                          * fb_coefs(sub_bands).sum() / full_weight), 4),
+        }
+        if not levels or settings != levels[-1]:
+            levels.append(settings)
+    return levels
+
+
+class LatencyGovernor:
+    def __init__(self, budget_ms=None, sampling_rate=None):
+        budget_ms = fbcca_config.get("decisionBudgetMs", 0) if budget_ms is None else budget_ms
+        self.budget = budget_ms / 1e3 if budget_ms else None
+        self.levels = effective_levels(sampling_rate)
+        self.level = 0
+        self._durations = collections.deque(maxlen=HISTORY)
+        self._trigger = []   # Durations behind the latest change
+
+    @property
+    def enabled(self):
+        return self.budget is not None
+
+    def settings(self):
+        """Parameters of the current level: subBands, harmonics, decimate, windowFraction, correlationThreshold."""
+        return dict(self.levels[self.level])
+
+    def record(self, seconds):
+        """Count one decision's duration. Returns the new level if it changed, else None."""
+        if not self.enabled:
+            return None
+        self._durations.append(seconds)
+        if len(self._durations) < MIN_DECISIONS:
+            return None
+
+        median = statistics.median(self._durations)
+        if median > self.budget and self.level < len(self.levels) - 1:
+            return self._set_level(self.level + 1)
+        if (self.level > 0 and len(self._durations) == HISTORY
+                and max(self._durations) < HEADROOM * self.budget):
+            return self._set_level(self.level - 1)
+        return None
+
+    def _set_level(self, level):
+        self.level = level
+        self._trigger = list(self._durations)
+        self._durations.clear()
+        return level
+
+    def stats(self):
+        return {
+            "level": self.level,
+            "budgetMs": None if self.budget is None else self.budget * 1e3,
+            "triggeredByMs": [round(d * 1e3, 1) for d in self._trigger],
+            "settings": self.settings(),
+        }
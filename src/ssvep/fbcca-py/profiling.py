@@ -0,0 +1,179 @@
+"""On-demand cProfile sessions for run_fbcca.py and the acquisition servers.
+
+A session profiles either the next N calls (run_fbcca.py: one call per request)
+or the next T seconds of a server's event loop, then writes
+    <dir>/<name>-<timestamp>.pstats          for python -m pstats, snakeviz, ...
+    <dir>/<name>-<timestamp>.collapsed.txt   "caller;callee microseconds" lines for flame graph tools
+and announces both paths with a "profile-written" event. <dir> is
+BOGGLE_PROFILE_DIR, or boggle-profiles in the system temp directory.
+
+cProfile records caller/callee pairs rather than whole stacks, so the collapsed
+file holds two-frame stacks: the self time each function spent when called from
+each of its callers.
+
+Starting a session, without restarting the process:
+  run_fbcca.py   FBCCA_PROFILE=<calls> at startup, or a {"profile": {"calls": N}} line on stdin
+  servers        BOGGLE_PROFILE=<seconds> at startup, or {"profile": {"seconds": T}} from a WebSocket client
+cProfile only sees the thread it was enabled in: the servers' event loop
+(acquisition, filtering, fan-out), not e.g. the Emotiv Cortex thread. Log lines
+go to stderr, since run_fbcca.py's stdout carries only responses.
+"""
+
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import sys
+import tempfile
+import time
+
+DEFAULT_PROFILE_DIR = os.path.join(tempfile.gettempdir(), "boggle-profiles")
+
+
+def profile_dir():
+    return os.environ.get("BOGGLE_PROFILE_DIR") or DEFAULT_PROFILE_DIR
+
+
+def _env_number(var):
+    try:
+        value = float(os.environ.get(var, ""))
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+
+def _label(func):
+    filename, line, name = func
+    if not line:
+        return name  # Built-ins: ('~', 0, "<built-in method ...>")
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def write_collapsed(stats, path):
+    """Write caller;callee self-time pairs (microseconds) of a pstats.Stats."""
+    with open(path, "w") as f:
+        for func, (_, _, tottime, _, callers) in stats.stats.items():
+            if not callers:
+                if int(tottime * 1e6):
+                    f.write(f"{_label(func)} {int(tottime * 1e6)}\n")
+                continue
+            for caller, (_, _, caller_tottime, _) in callers.items():
+                if int(caller_tottime * 1e6):
+                    f.write(f"{_label(caller)};{_label(func)} {int(caller_tottime * 1e6)}\n")
+
+
+class Profiler:
+    """One profiling session at a time, bounded by a number of calls or by seconds.
+
+    `announce` is an emit_event-style callable used for the "profile-written" event.
+    """
+
+    def __init__(self, name, announce=None):
+        self.name = name
+        self.announce = announce
+        self._profile = None
+        self._calls_left = None
+        self._timer = None
+        self._started = None
+
+    @property
+    def active(self):
+        return self._profile is not None
+
+    def start_calls(self, calls):
+        """Profile the next `calls` calls made through call()."""
+        if self.active or calls < 1:
+            return False
+        self._profile = cProfile.Profile()
+        self._calls_left = int(calls)
+        self._started = time.time()
+        print(f"[INFO] Profiling the next {self._calls_left} calls.", file=sys.stderr, flush=True)
+        return True
+
+    def start_seconds(self, seconds):
+        """Profile everything on this thread for `seconds`; must be called on the running event loop."""
+        if self.active or seconds <= 0:
+            return False
+        self._profile = cProfile.Profile()
+        self._started = time.time()
+        self._timer = asyncio.get_running_loop().call_later(seconds, self.finish)
+        self._profile.enable()
+        print(f"[INFO] Profiling for {seconds} s.", file=sys.stderr, flush=True)
+        return True
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs), profiled while a calls session is active."""
+        if self._calls_left is None:
+            return fn(*args, **kwargs)
+        self._profile.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._profile.disable()
+            self._calls_left -= 1
+            if self._calls_left <= 0:
+                self.finish()
+
+    def finish(self):
+        """Stop the session and write its files. Returns the .pstats path (None if nothing was active)."""
+        if not self.active:
+            return None
+        profile = self._profile
+        profile.disable()
+        self._profile = None
+        self._calls_left = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        out_dir = profile_dir()
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}")
+        stats_path, collapsed_path = base + ".pstats", base + ".collapsed.txt"
+        stats = pstats.Stats(profile)
+        stats.dump_stats(stats_path)
+        write_collapsed(stats, collapsed_path)
+
+        print(f"[INFO] Profile written to {stats_path}", file=sys.stderr, flush=True)
+        if self.announce is not None:
+            self.announce("profile-written", path=stats_path, collapsed=collapsed_path,
+                          seconds=round(time.time() - self._started, 3))
+        return stats_path
+
+    def handle_request(self, request, kind):
+        """Start a session from a {kind: N} dict, kind being "calls" or "seconds". Returns True if one started.
+
+        Each process accepts one kind: run_fbcca.py "calls" (it has no event loop for a
+        seconds timer), the servers "seconds" (nothing there goes through call(), so a
+        calls session would never finish and would block every later request).
+        """
+        if not isinstance(request, dict):
+            return False
+        other = "seconds" if kind == "calls" else "calls"
+        if request.get(other) and not request.get(kind):
+            print(f"[WARN] Profile request ignored: this process only accepts {{\"{kind}\": N}}.",
+                  file=sys.stderr, flush=True)
+            return False
+        try:
+            value = float(request.get(kind) or 0)
+        except (TypeError, ValueError):
+            return False
+        if not value:
+            return False
+        return self.start_calls(int(value)) if kind == "calls" else self.start_seconds(value)
+
+    def handle_message(self, message):
+        """Hub on_message handler for {"profile": {"seconds": T}} client messages. Returns True if a session started."""
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            return False
+        return isinstance(data, dict) and self.handle_request(data.get("profile"), "seconds")
+
+    def start_from_env(self, var, seconds=False):
+        """Start a session if the environment variable `var` holds a positive number of calls (or seconds)."""
+        value = _env_number(var)
+        if value is None:
+            return False
+        return self.start_seconds(value) if seconds else self.start_calls(int(value))
@@ -0,0 +1,77 @@
+"""Frozen reference implementation of FBCCA, for verify_fbcca.py.
+
+A copy of filterbank.filterbank and the test_fbcca stages (filter_subbands,
+subband_correlations with scikit-learn's CCA, fbcca_rho) as they were when the
+equivalence harness was added. Faster paths are written in filterbank.py /
+test_fbcca.py and checked against this file, so this file itself must not be
+optimised or "fixed": changing it moves the reference. Only the configuration
+(fbcca_config) is shared with the live code.
+"""
+
+import numpy as np
+from scipy.signal import cheb1ord, cheby1, decimate, filtfilt, resample
+from sklearn.cross_decomposition import CCA
+
+from fbcca_config_service import fbcca_config
+
+_PASSBAND = [6, 14, 22, 30, 38, 46, 54, 62, 70, 78]
+_STOPBAND = [4, 10, 16, 24, 32, 40, 48, 56, 64, 72]
+_FILTER_COEFF_CACHE = {}
+
+
+def reference_filterbank(eeg, idx_fb=1, target_fs=256, fs=None):
+    """Chebyshev type I band-pass of sub-band idx_fb (filtfilt per channel), then down- or resampled to 256 Hz."""
+    eeg = np.asarray(eeg)
+    fs_original = fbcca_config['samplingRate'] if fs is None else fs
+    nyquist = fs_original / 2
+
+    cache_key = (idx_fb, fs_original)
+    if cache_key not in _FILTER_COEFF_CACHE:
+        Wp = [_PASSBAND[idx_fb - 1] / nyquist, 90 / nyquist]
+        Ws = [_STOPBAND[idx_fb - 1] / nyquist, 100 / nyquist]
+        N, Wn = cheb1ord(Wp, Ws, 3, 40)
+        _FILTER_COEFF_CACHE[cache_key] = cheby1(N, 0.5, Wn, btype='band')
+    B, A = _FILTER_COEFF_CACHE[cache_key]
+
+    y = np.zeros_like(eeg)
+    for ch_i in range(eeg.shape[0]):
+        y[ch_i, :] = filtfilt(B, A, eeg[ch_i, :], padtype=None)
+
+    if fs_original == target_fs:
+        return y
+    if fs_original % target_fs == 0:
+        return decimate(y, int(fs_original // target_fs), axis=1, ftype='iir')
+    return resample(y, int(y.shape[1] * target_fs / fs_original), axis=1)
+
+
+def reference_cca_reference(list_freqs, num_smpls, fs=256, harmonics=None):
+    harmonics = fbcca_config['harmonics'] if harmonics is None else harmonics
+    tidx = np.arange(1, num_smpls + 1) / fs
+    y_ref = np.zeros((len(list_freqs), 2 * harmonics, num_smpls))
+    for freq_i, stim_freq in enumerate(list_freqs):
+        tmp = []
+        for harm_i in range(1, harmonics + 1):
+            tmp.append(np.sin(2 * np.pi * tidx * harm_i * stim_freq))
+            tmp.append(np.cos(2 * np.pi * tidx * harm_i * stim_freq))
+        y_ref[freq_i, :, :] = np.array(tmp)
+    return y_ref
+
+
+def reference_rho(eeg, list_freqs, fs=None, num_subbands=None, harmonics=None):
+    """Weighted FBCCA correlation per class (the rho test_fbcca takes its decision on)."""
+    num_subbands = fbcca_config['subBands'] if num_subbands is None else num_subbands
+    subbands = [reference_filterbank(eeg, fb_idx + 1, fs=fs) for fb_idx in range(num_subbands)]
+    y_ref = reference_cca_reference(list_freqs, subbands[0].shape[1], fs=256, harmonics=harmonics)
+
+    r = np.zeros((num_subbands, len(list_freqs)))
+    for fb_i, testdata in enumerate(subbands):
+        for class_i in range(len(list_freqs)):
+            refdata = y_ref[class_i, :, :]
+            n_components = min(testdata.shape[0], refdata.shape[0])
+            cca = CCA(n_components=n_components)
+            cca.fit(testdata.T, refdata.T)
+            testdata_c, refdata_c = cca.transform(testdata.T, refdata.T)
+            r[fb_i, class_i] = np.corrcoef(testdata_c[:, 0], refdata_c[:, 0])[0, 1]
+
+    fb_coefs = np.arange(1, num_subbands + 1) ** (-1.25) + 0.25
+    return np.dot(fb_coefs, r)
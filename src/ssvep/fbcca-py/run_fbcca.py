@@ -1,9 +1,12 @@
 import sys
 import json
 import os
+import time
 import numpy as np
 from test_fbcca import test_fbcca
 from fbcca_config_service import fbcca_config, total_data_point_count
+from latency_governor import LatencyGovernor
+from profiling import Profiler
 
 
 def _find_scenario_config_path():
@@ -59,8 +62,36 @@ def load_scenario_config():
 # Load the scenario config at module level
 scenario_config = load_scenario_config()
 
-def run_fbcca(eeg, scenario_id, stim_freqs=None, active_button_ids=None):
-    eeg_data = eeg[:, :total_data_point_count()]
+# With FBCCA_TIMING=1 every response is followed by {"timing": {"decodeSecs", "classifySecs"}} on stderr
+# (used by bench_latency.py to split the worker's share of the decision latency)
+REPORT_TIMING = os.environ.get("FBCCA_TIMING") == "1"
+
+
+def emit_event(event_type, **params):
+    """JSON-RPC style event on stderr (stdout carries only responses)."""
+    payload = {"jsonrpc": "2.0", "method": "event", "params": dict(params, type=event_type)}
+    print(json.dumps(payload), file=sys.stderr)
+    sys.stderr.flush()
+
+
+# cProfile of the next N requests: FBCCA_PROFILE=N at startup or a {"profile": {"calls": N}} line (see profiling.py)
+profiler = Profiler("run_fbcca", announce=emit_event)
+
+# Steps FBCCA cost down when decisions exceed fbccaConfig "decisionBudgetMs" (see latency_governor.py)
+governor = LatencyGovernor()
+
+def run_fbcca(eeg, scenario_id, stim_freqs=None, active_button_ids=None, settings=None):
+    # eeg may be a list, an array or a (channels, samples) view of a memory-mapped recording
+    eeg_data = np.asarray(eeg)[:, :total_data_point_count()]
+
+    # Reduced-cost settings from the latency governor: most recent part of the window, decimated input
+    fs = None
+    if settings is not None:
+        keep = int(eeg_data.shape[1] * settings['windowFraction'])
+        eeg_data = eeg_data[:, eeg_data.shape[1] - keep:]
+        if settings['decimate'] > 1:
+            eeg_data = eeg_data[:, ::settings['decimate']]
+            fs = fbcca_config['samplingRate'] / settings['decimate']
 
     # The stimuli frequencies can be provided directly or fetched from the scenario config
     # Provided = if using an adaptive switch; Fetched = normal operation
@@ -70,7 +101,11 @@ def run_fbcca(eeg, scenario_id, stim_freqs=None, active_button_ids=None):
         stimuli_frequencies = get_stimuli_frequencies(scenario_id)
 
     if np.any(eeg_data != 0) and np.all(stimuli_frequencies != 0):
-        freq_idx = test_fbcca(eeg_data, stimuli_frequencies)
+        if settings is not None:
+            freq_idx = test_fbcca(eeg_data, stimuli_frequencies, settings['subBands'], settings['harmonics'], fs,
+                                  settings['correlationThreshold'])
+        else:
+            freq_idx = test_fbcca(eeg_data, stimuli_frequencies)
 
         # Determining the selected button ID
         # If active_button_ids is provided, use it to map freq_idx to button ID. Provided = if using an adaptive switch
@@ -119,10 +154,17 @@ def get_selected_button_id(freq_idx, scenario_id):
     return selected_button_id
 
 if __name__ == "__main__":
+    profiler.start_from_env("FBCCA_PROFILE")
     for line in sys.stdin:
         try:
+            started = time.perf_counter()
             # Parse incoming JSON message
             message = json.loads(line)
+
+            # Control message: start profiling, no response
+            if 'profile' in message:
+                profiler.handle_request(message['profile'], 'calls')
+                continue
             
             # Check message content for required keys
             if 'eegData' in message and 'scenario_id' in message:             
@@ -140,11 +182,23 @@ if __name__ == "__main__":
                     active_button_ids = message.get('active_button_ids')
                                 
                 # Run the fbcca process
-                label = run_fbcca(eeg_array, scenario_id, stim_freqs, active_button_ids)
-                
-                # Output the result as a JSON string
-                print(json.dumps(label))
+                decoded = time.perf_counter()
+                settings = governor.settings() if governor.enabled else None
+                label = profiler.call(run_fbcca, eeg_array, scenario_id, stim_freqs, active_button_ids, settings)
+                classified = time.perf_counter()
+
+                # Output the result and the governor's cost level (0 = full FBCCA) as a JSON string
+                print(json.dumps({"label": label, "level": governor.level}))
                 sys.stdout.flush()
+
+                if governor.record(classified - started) is not None:
+                    print(f"[INFO] FBCCA level {governor.level}: {governor.settings()}", file=sys.stderr)
+                    emit_event("fbcca-level", **governor.stats())
+
+                if REPORT_TIMING:
+                    timing = {"decodeSecs": decoded - started, "classifySecs": classified - decoded}
+                    print(json.dumps({"timing": timing}), file=sys.stderr)
+                    sys.stderr.flush()
             else:
                 raise ValueError("JSON input must contain 'eegData' and 'scenario_id' fields.")
                 
@@ -0,0 +1,211 @@
+"""Parameter sweep of subBands, harmonics, correlationThreshold and gazeLengthInSecs over recorded sessions.
+
+    python sweep_fbcca.py <session.bglrec> [...] --subbands 1,2,3,4,5 --harmonics 1,2,3,4,5
+                          --thresholds 0.5,0.6,0.7,0.8,0.9 --windows 1,2,3,4 [--workers N] [--json out.json]
+
+Work is shared across the grid. Per trial and window length, sub-bands are
+filtered once (up to the largest subBands, through the disk cache of
+evaluate_fbcca.py); for each harmonic count the CCA runs once per sub-band and
+class. Every smaller subBands value is then a prefix of the same correlation
+matrix, and every threshold is a comparison on the same rho, so neither costs
+any filtering or CCA. Window lengths are not shared: filtfilt is zero-phase
+(non-causal), so a shorter window is not a prefix of a longer window's output
+and is filtered separately.
+
+Latency of a configuration is the window length plus the measured compute time
+(filtering the sub-bands plus their CCA), and the script prints the configurations
+on the Pareto front of accuracy, latency and idle false positive rate. Idle FP is
+an objective because a low threshold always maximises accuracy by never returning
+idle, i.e. by selecting a button on every idle window. Configurations above
+--max-idle-fp are left out of the front; those that would otherwise be on it are
+listed separately as rejected for idle FP.
+"""
+
+import argparse
+import json
+import math
+import time
+
+import numpy as np
+
+from evaluate_fbcca import (DEFAULT_CACHE_DIR, _recording, cached_subbands, extract_trials, run_trials,
+                            wolpaw_itr)
+from fbcca_config_service import fbcca_config
+from filterbank import filterbank
+from test_fbcca import fbcca_rho, subband_correlations
+
+# ---------- CONFIGS ----------
+DEFAULT_MAX_IDLE_FP = 0.1        # Idle windows that may select a button (1 = no cap)
+# ---------- CONFIGS ----------
+
+
+def _parse_list(text, cast):
+    return sorted({cast(value) for value in text.split(",") if value.strip()})
+
+
+def sweep_trial(task):
+    """Worker: correlations of one trial at one window length for every harmonic count.
+
+    Returns {"target", "classes", "r": {harmonics: (subBands x classes) array}, "ccaSecs": {harmonics: [secs per sub-band]}}
+    or None if the trial is too short for the window.
+    """
+    trial, params = task
+    recording = _recording(trial["session"])
+    num_samples = int(math.ceil(recording.sampling_rate * params["window"]))
+    subbands, _ = cached_subbands(trial, num_samples, params["maxSubBands"], params["cacheDir"])
+    if subbands is None:
+        return None
+
+    r_by_harmonics, secs_by_harmonics = {}, {}
+    for harmonics in params["harmonics"]:
+        rows, secs = [], []
+        for subband in subbands:
+            started = time.perf_counter()
+            rows.append(subband_correlations([subband], trial["frequencies"], harmonics)[0])
+            secs.append(time.perf_counter() - started)
+        r_by_harmonics[harmonics] = np.array(rows)
+        secs_by_harmonics[harmonics] = secs
+    return {"target": trial["target"], "classes": len(trial["frequencies"]),
+            "r": r_by_harmonics, "ccaSecs": secs_by_harmonics}
+
+
+def filter_seconds(window, max_subbands, channels, fs, repeats=3):
+    """Median time to filter each sub-band of one window (same for every trial, so measured once)."""
+    num_samples = int(math.ceil(fs * window))
+    eeg = np.random.default_rng(0).normal(size=(channels, num_samples))
+    secs = []
+    for idx in range(1, max_subbands + 1):
+        runs = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            filterbank(eeg, idx, fs=fs)
+            runs.append(time.perf_counter() - started)
+        secs.append(float(np.median(runs)))
+    return secs
+
+
+def score_grid(per_window, grid, gaze_shift):
+    """Apply every (subBands, harmonics, threshold) to the shared correlations. Returns a list of grid points."""
+    idle_label = fbcca_config["idleStateLabel"]
+    points = []
+    for window, (results, filter_secs) in per_window.items():
+        results = [r for r in results if r is not None]
+        if not results:
+            continue
+        for harmonics in grid["harmonics"]:
+            cca_secs = np.mean([r["ccaSecs"][harmonics] for r in results], axis=0)
+            for subbands in grid["subBands"]:
+                rhos = [fbcca_rho(r["r"][harmonics][:subbands]) for r in results]
+                best = np.array([int(np.argmax(rho)) for rho in rhos])
+                peak = np.array([float(np.max(rho)) for rho in rhos])
+                targets = np.array([r["target"] for r in results])
+                targeted = targets != idle_label
+                classes = int(round(np.mean([r["classes"] for r in results])))
+                compute = float(np.sum(filter_secs[:subbands]) + np.sum(cca_secs[:subbands]))
+
+                for threshold in grid["thresholds"]:
+                    labels = np.where(peak < threshold, idle_label, best)
+                    accuracy = float(np.mean(labels[targeted] == targets[targeted])) if targeted.any() else None
+                    idle_fp = float(np.mean(labels[~targeted] != idle_label)) if (~targeted).any() else None
+                    points.append({
+                        "window": window,
+                        "subBands": subbands,
+                        "harmonics": harmonics,
+                        "threshold": threshold,
+                        "trials": len(results),
+                        "accuracy": accuracy,
+                        "idleFalsePositiveRate": idle_fp,
+                        "itrBitsPerMin": wolpaw_itr(accuracy, classes, window + gaze_shift) if accuracy is not None else None,
+                        "computeSecs": compute,
+                        "latencySecs": window + compute,
+                    })
+    return points
+
+
+def _objectives(point):
+    # All minimised; sessions without idle trials cannot measure idle FP and count as 0
+    return (-point["accuracy"], point["latencySecs"], point["idleFalsePositiveRate"] or 0.0)
+
+
+def _non_dominated(points):
+    scores = [_objectives(p) for p in points]
+    front = []
+    for i, score in enumerate(scores):
+        if not any(all(o <= s for o, s in zip(other, score)) and other != score for other in scores):
+            front.append(points[i])
+    return sorted(front, key=lambda p: (p["latencySecs"], -p["accuracy"], p["idleFalsePositiveRate"] or 0.0))
+
+
+def pareto_front(points, max_idle_fp=DEFAULT_MAX_IDLE_FP):
+    """Points not dominated in (higher accuracy, lower latency, lower idle FP rate), sorted by latency.
+
+    Returns (front, rejected): rejected are the points that would be on the front without the
+    max_idle_fp cap but exceed it. Both are marked with "idleFpRejected".
+    """
+    candidates = [p for p in points if p["accuracy"] is not None]
+    front = _non_dominated([p for p in candidates
+                            if max_idle_fp is None or (p["idleFalsePositiveRate"] or 0.0) <= max_idle_fp])
+    kept = {id(p) for p in front}
+    rejected = [p for p in _non_dominated(candidates) if id(p) not in kept]
+    for point in front:
+        point["idleFpRejected"] = False
+    for point in rejected:
+        point["idleFpRejected"] = True
+    return front, rejected
+
+
+def sweep(paths, windows, subbands, harmonics, thresholds, gaze_shift=0.0, workers=None, cache_dir=DEFAULT_CACHE_DIR):
+    """Run the sweep. Returns {"grid", "points"}; see pareto_front() for the front."""
+    grid = {"windows": windows, "subBands": subbands, "harmonics": harmonics, "thresholds": thresholds}
+    trials = [trial for path in paths for trial in extract_trials(path)]
+    if not trials:
+        raise ValueError("No gaze trials found in the given sessions.")
+    first = _recording(trials[0]["session"])
+    channels = min(fbcca_config["channels"], first.channels)
+
+    per_window = {}
+    for window in windows:
+        params = {"window": window, "maxSubBands": max(subbands), "harmonics": harmonics, "cacheDir": cache_dir}
+        results, wall = run_trials(trials, params, workers, worker=sweep_trial)
+        per_window[window] = (results, filter_seconds(window, max(subbands), channels, first.sampling_rate))
+        print(f"[INFO] window {window}s: {len(trials)} trials in {wall:.1f}s")
+
+    points = score_grid(per_window, grid, gaze_shift)
+    return {"grid": grid, "points": points}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FBCCA parameter sweep with an accuracy/latency Pareto front")
+    parser.add_argument("sessions", nargs="+", help="Recording directories (*.bglrec) with markers.jsonl")
+    parser.add_argument("--subbands", default="1,2,3,4,5")
+    parser.add_argument("--harmonics", default="1,2,3,4,5")
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9")
+    parser.add_argument("--windows", default="1,2,3,4", help="Window lengths in seconds")
+    parser.add_argument("--gaze-shift", type=float, default=0.0, help="Seconds between selections added for ITR")
+    parser.add_argument("--max-idle-fp", type=float, default=DEFAULT_MAX_IDLE_FP,
+                        help="Only consider configs up to this idle FP rate (1 = no cap)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--json", default=None, help="Also write every grid point and the front to this file")
+    args = parser.parse_args()
+
+    result = sweep(args.sessions, _parse_list(args.windows, float), _parse_list(args.subbands, int),
+                   _parse_list(args.harmonics, int), _parse_list(args.thresholds, float), args.gaze_shift,
+                   args.workers, None if args.no_cache else args.cache_dir)
+    front, rejected = pareto_front(result["points"], args.max_idle_fp)
+    result["front"], result["idleFpRejected"] = front, rejected
+
+    if all(p["idleFalsePositiveRate"] is None for p in result["points"]):
+        print("[WARN] No idle trials in the sessions: idle false positives cannot be measured.")
+    print(f"{len(result['points'])} configurations; Pareto front (accuracy, latency, idle FP <= {args.max_idle_fp:g}):")
+    print(f"{'window':>6} {'subB':>4} {'harm':>4} {'thr':>5} {'acc':>6} {'idleFP':>6} {'ITR':>6} {'latency':>8}")
+    for p in front + rejected:
+        idle_fp = "-" if p["idleFalsePositiveRate"] is None else f"{p['idleFalsePositiveRate']:.3f}"
+        print(f"{p['window']:>6} {p['subBands']:>4} {p['harmonics']:>4} {p['threshold']:>5} {p['accuracy']:>6.3f} "
+              f"{idle_fp:>6} {p['itrBitsPerMin']:>6.1f} {p['latencySecs']:>8.3f}"
+              f"{'  rejected: idle FP' if p['idleFpRejected'] else ''}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
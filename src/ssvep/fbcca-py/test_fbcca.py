@@ -3,24 +3,41 @@ from fbcca_config_service import fbcca_config
 from sklearn.cross_decomposition import CCA
 from filterbank import filterbank  # Make sure it downsample to 256 Hz internally
 
-def test_fbcca(eeg, list_freqs):
+def test_fbcca(eeg, list_freqs, num_subbands=None, harmonics=None, fs=None, threshold=None):
+    # num_subbands/harmonics/fs/threshold default to fbcca_config (run_fbcca's latency governor lowers them under load)
     if eeg is None or list_freqs is None:
         raise ValueError('Not enough input arguments.')
 
-    # Filter bank coefficients
-    fb_coefs = np.array([i for i in range(1, fbcca_config['subBands'] + 1)])**(-1.25) + 0.25
+    # Accept any (channels, samples) array-like, e.g. a Recording.eeg_window() view
+    eeg = np.asarray(eeg)
 
     # Compute all sub-bands once per invocation to avoid redundant filtering
-    filtered_subbands = [filterbank(eeg, fb_idx + 1) for fb_idx in range(fbcca_config['subBands'])]
+    filtered_subbands = filter_subbands(eeg, num_subbands, fs=fs)
+    rho = fbcca_rho(subband_correlations(filtered_subbands, list_freqs, harmonics))
+    return fbcca_decision(rho, threshold)
+
+
+# The stages of test_fbcca, exposed separately so offline tools (evaluate_fbcca.py, sweep_fbcca.py)
+# can cache filtered sub-bands and vary harmonics/threshold without refiltering.
+# Arguments left as None fall back to fbcca_config.
+
+def filter_subbands(eeg, num_subbands=None, fs=None):
+    """Return the list of filtered (and resampled to 256 Hz) sub-bands 1..num_subbands."""
+    num_subbands = fbcca_config['subBands'] if num_subbands is None else num_subbands
+    filtered_subbands = [filterbank(eeg, fb_idx + 1, fs=fs) for fb_idx in range(num_subbands)]
     if not filtered_subbands:
         raise ValueError('No sub-bands computed; check fbcca_config.subBands.')
+    return filtered_subbands
 
+
+def subband_correlations(filtered_subbands, list_freqs, harmonics=None):
+    """Return r (sub-bands x classes): first canonical correlation of each sub-band with each reference."""
     num_smpls_resampled = filtered_subbands[0].shape[1]
 
     # Generate reference signals to match downsampled EEG length
-    y_ref = cca_reference(list_freqs, num_smpls_resampled, fs=256)  # <-- updated
+    y_ref = cca_reference(list_freqs, num_smpls_resampled, fs=256, harmonics=harmonics)  # <-- updated
 
-    r = np.zeros((fbcca_config['subBands'], len(list_freqs)))
+    r = np.zeros((len(filtered_subbands), len(list_freqs)))
 
     for fb_i, testdata in enumerate(filtered_subbands):
         for class_i in range(len(list_freqs)):
@@ -34,12 +51,26 @@ def test_fbcca(eeg, list_freqs):
             r_tmp = [np.corrcoef(testdata_c[:, i], refdata_c[:, i])[0, 1] for i in range(n_components)]
             r[fb_i, class_i] = r_tmp[0]
 
-    # Weighted sum of correlations
-    rho = np.dot(fb_coefs, r)
+    return r
+
+
+def fb_coefs(num_subbands):
+    """Filter bank coefficients of sub-bands 1..num_subbands."""
+    return np.array([i for i in range(1, num_subbands + 1)])**(-1.25) + 0.25
+
+
+def fbcca_rho(r):
+    """Weighted sum of correlations over the sub-bands in r."""
+    return np.dot(fb_coefs(r.shape[0]), r)
+
+
+def fbcca_decision(rho, threshold=None):
+    """Index of the strongest class, or the idle label if its rho is below the threshold."""
+    threshold = fbcca_config['correlationThreshold'] if threshold is None else threshold
     correlation = np.max(rho)
     tau = np.argmax(rho)
 
-    if correlation < fbcca_config['correlationThreshold']:
+    if correlation < threshold:
         estimated_label = fbcca_config['idleStateLabel']
     else:
         estimated_label = tau
@@ -47,21 +78,22 @@ def test_fbcca(eeg, list_freqs):
     return estimated_label
 
 
-def cca_reference(list_freqs, num_smpls, fs=256):  # fs parameter added
+def cca_reference(list_freqs, num_smpls, fs=256, harmonics=None):  # fs parameter added
     if list_freqs is None or num_smpls is None:
         raise ValueError('Not enough input arguments.')
 
+    harmonics = fbcca_config['harmonics'] if harmonics is None else harmonics
     num_freqs = len(list_freqs)
     tidx = np.arange(1, num_smpls + 1) / fs  # <-- use fs, not fbcca_config['samplingRate']
 
-    y_ref = np.zeros((num_freqs, 2 * fbcca_config['harmonics'], num_smpls))
+    y_ref = np.zeros((num_freqs, 2 * harmonics, num_smpls))
 
     for freq_i in range(num_freqs):
         tmp = []
-        for harm_i in range(1, fbcca_config['harmonics'] + 1):
+        for harm_i in range(1, harmonics + 1):
             stim_freq = list_freqs[freq_i]
             tmp.append(np.sin(2 * np.pi * tidx * harm_i * stim_freq))
             tmp.append(np.cos(2 * np.pi * tidx * harm_i * stim_freq))
         y_ref[freq_i, :, :] = np.array(tmp)
 
-    return y_ref
\ No newline at end of file
+    return y_ref
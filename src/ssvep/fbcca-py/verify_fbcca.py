@@ -0,0 +1,226 @@
+"""Differential check of FBCCA engines against the frozen reference implementation.
+
+    python verify_fbcca.py [--engines current,qr] [--synthetic 60] [--snrs -15,-10,-5]
+                           [--recording session.bglrec ...] [--max-windows 50] [--window SECS]
+                           [--rho-tol 1e-3] [--json out.json]
+
+Every engine computes rho (the weighted per-class correlation test_fbcca decides
+on) for the same corpus of windows as reference_fbcca.reference_rho:
+  synthetic   --synthetic windows from lsl/synthetic_ssvep.py, cycling through the
+              scenario's targets and idle (no SSVEP) over the --snrs
+  recorded    gaze trials of each --recording (see evaluate_fbcca.extract_trials),
+              or consecutive windows when it has no usable markers
+and the report gives, per engine and corpus:
+  labelAgreement   fraction of windows where fbcca_decision(rho) equals the reference's
+  maxRhoDiff       largest |rho - reference rho| over all windows and classes
+  speedup          reference seconds per window / engine seconds per window
+The exit status is 1 when any engine disagrees on a label or exceeds --rho-tol,
+so a faster path can be switched on once this passes on representative data.
+
+Engines are functions (eeg (channels, samples), frequencies, fs) -> rho, listed in
+ENGINES; add the candidate there. "current" is the live filterbank/test_fbcca code,
+so optimising those modules in place is covered too. "qr" is the closed-form
+CCA (QR decompositions and one SVD per sub-band and class, as in the
+MATLAB canoncorr) on the current filter bank. It finds the largest canonical
+correlation exactly where scikit-learn's iterative CCA converges to it, so
+expect small rho differences rather than none.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from fbcca_config_service import fbcca_config
+from reference_fbcca import reference_rho
+from test_fbcca import cca_reference, fbcca_decision, fbcca_rho, filter_subbands, subband_correlations
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Adding the sibling folder lsl to sys.path for the synthetic SSVEP generator.
+LSL_DIR = os.path.join(os.path.dirname(BASE_DIR), "lsl")
+if LSL_DIR not in sys.path:
+    sys.path.insert(0, LSL_DIR)
+
+from synthetic_ssvep import scenario_stimuli, synthetic_trial  # noqa: E402
+
+# ---------- CONFIGS ----------
+DEFAULT_SYNTHETIC_WINDOWS = 60
+DEFAULT_SNRS = "-15,-10,-5"      # dB; low enough that some windows fall below the idle threshold
+DEFAULT_MAX_WINDOWS = 50         # Per recording
+DEFAULT_RHO_TOL = 1e-3
+# ---------- CONFIGS ----------
+
+
+def current_rho(eeg, list_freqs, fs):
+    return fbcca_rho(subband_correlations(filter_subbands(eeg, fs=fs), list_freqs))
+
+
+def _orthonormal_basis(data):
+    """Orthonormal basis of the centred columns of data (samples, variables)."""
+    q, _ = np.linalg.qr(data - data.mean(axis=0))
+    return q
+
+
+def qr_rho(eeg, list_freqs, fs):
+    subbands = filter_subbands(eeg, fs=fs)
+    y_ref = cca_reference(list_freqs, subbands[0].shape[1], fs=256)
+    ref_bases = [_orthonormal_basis(y_ref[class_i].T) for class_i in range(len(list_freqs))]
+    r = np.zeros((len(subbands), len(list_freqs)))
+    for fb_i, testdata in enumerate(subbands):
+        q_eeg = _orthonormal_basis(testdata.T)
+        for class_i, q_ref in enumerate(ref_bases):
+            # Canonical correlations are the singular values of Qx' Qy
+            r[fb_i, class_i] = np.linalg.svd(q_eeg.T @ q_ref, compute_uv=False)[0]
+    return fbcca_rho(r)
+
+
+ENGINES = {
+    "current": current_rho,
+    "qr": qr_rho,
+}
+
+
+def synthetic_corpus(count, snrs, scenario_id, seconds):
+    """[(name, eeg, frequencies, fs)] cycling through the scenario's targets plus idle, over the SNRs."""
+    frequencies, phases = scenario_stimuli(scenario_id)
+    fs = fbcca_config["samplingRate"]
+    targets = list(range(len(frequencies))) + [None]
+    corpus = []
+    for i in range(count):
+        target, snr = targets[i % len(targets)], snrs[(i // len(targets)) % len(snrs)]
+        eeg = synthetic_trial(frequencies, phases, target=target, seconds=seconds, channels=fbcca_config["channels"],
+                              sampling_rate=fs, snr_db=snr, seed=i).astype(np.float64)
+        corpus.append((f"synthetic target={target} snr={snr:g} seed={i}", eeg, list(frequencies), fs))
+    return corpus
+
+
+def recorded_corpus(path, max_windows, scenario_id, seconds):
+    """[(name, eeg, frequencies, fs)] from the gaze trials of a recording, or its consecutive windows."""
+    from evaluate_fbcca import _recording, extract_trials, trial_window
+
+    recording = _recording(path)
+    fs = recording.sampling_rate
+    num_samples = int(math.ceil(seconds * fs))
+    corpus = []
+    for trial in extract_trials(path):
+        start, eeg = trial_window(trial, num_samples)
+        if eeg is not None:
+            corpus.append((f"{os.path.basename(path)}@{start}", eeg, trial["frequencies"], fs))
+        if len(corpus) >= max_windows:
+            return corpus
+    if corpus:
+        return corpus
+
+    frequencies, _ = scenario_stimuli(scenario_id)
+    channels = min(fbcca_config["channels"], recording.channels)
+    for start in range(0, len(recording) - num_samples + 1, num_samples):
+        eeg = np.asarray(recording.samples_between(start, start + num_samples).T[:channels], dtype=np.float64)
+        corpus.append((f"{os.path.basename(path)}@{start}", eeg, list(frequencies), fs))
+        if len(corpus) >= max_windows:
+            break
+    return corpus
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def verify(corpus, engines):
+    """Run the reference and every engine on the corpus. Returns {engine: summary} plus per-window rows."""
+    rows = []
+    reference_secs = 0.0
+    totals = {name: {"secs": 0.0, "agree": 0, "maxRhoDiff": 0.0, "worst": None} for name in engines}
+    for name, eeg, frequencies, fs in corpus:
+        rho, secs = timed(reference_rho, eeg, frequencies, fs)
+        reference_secs += secs
+        label = int(fbcca_decision(rho))
+        row = {"window": name, "referenceLabel": label, "engines": {}}
+        for engine, fn in engines.items():
+            engine_rho, engine_secs = timed(fn, eeg, frequencies, fs)
+            engine_label = int(fbcca_decision(engine_rho))
+            diff = float(np.max(np.abs(np.asarray(engine_rho) - rho)))
+            total = totals[engine]
+            total["secs"] += engine_secs
+            total["agree"] += engine_label == label
+            if diff >= total["maxRhoDiff"]:
+                total["maxRhoDiff"], total["worst"] = diff, name
+            row["engines"][engine] = {"label": engine_label, "maxRhoDiff": diff}
+        rows.append(row)
+
+    n = len(corpus)
+    summary = {
+        engine: {
+            "windows": n,
+            "labelAgreement": total["agree"] / n if n else None,
+            "maxRhoDiff": total["maxRhoDiff"],
+            "worstWindow": total["worst"],
+            "msPerWindow": total["secs"] / n * 1e3 if n else None,
+            "referenceMsPerWindow": reference_secs / n * 1e3 if n else None,
+            "speedup": reference_secs / total["secs"] if total["secs"] else None,
+        }
+        for engine, total in totals.items()
+    }
+    return summary, rows
+
+
+def print_report(corpus_name, summary, rho_tol):
+    print(f"{corpus_name}:")
+    print(f"  {'engine':<10} {'windows':>7} {'labels':>8} {'max |drho|':>11} {'ms/window':>10} {'ref ms':>8} "
+          f"{'speedup':>8}  result")
+    for engine, s in summary.items():
+        ok = s["labelAgreement"] == 1.0 and s["maxRhoDiff"] <= rho_tol
+        print(f"  {engine:<10} {s['windows']:>7} {s['labelAgreement'] * 100:>7.1f}% {s['maxRhoDiff']:>11.2e} "
+              f"{s['msPerWindow']:>10.2f} {s['referenceMsPerWindow']:>8.2f} {s['speedup']:>7.2f}x  "
+              f"{'ok' if ok else 'MISMATCH (worst: ' + s['worstWindow'] + ')'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check FBCCA engines against the frozen reference implementation")
+    parser.add_argument("--engines", default=",".join(ENGINES), help=f"Comma-separated, from {', '.join(ENGINES)}")
+    parser.add_argument("--synthetic", type=int, default=DEFAULT_SYNTHETIC_WINDOWS, help="Synthetic windows (0 = none)")
+    parser.add_argument("--snrs", default=DEFAULT_SNRS, help="Synthetic SNRs in dB")
+    parser.add_argument("--scenario", type=int, default=0, help="Scenario whose frequencies are used")
+    parser.add_argument("--recording", nargs="*", default=[], help="Recordings (*.bglrec) to take windows from")
+    parser.add_argument("--max-windows", type=int, default=DEFAULT_MAX_WINDOWS, help="Windows per recording")
+    parser.add_argument("--window", type=float, default=None, help="Window length in seconds (default: gazeLengthInSecs)")
+    parser.add_argument("--rho-tol", type=float, default=DEFAULT_RHO_TOL, help="Largest accepted |rho difference|")
+    parser.add_argument("--json", default=None, help="Write the summaries and per-window results to this file")
+    args = parser.parse_args()
+
+    seconds = args.window if args.window is not None else fbcca_config["gazeLengthInSecs"]
+    unknown = [name for name in args.engines.split(",") if name not in ENGINES]
+    if unknown:
+        parser.error(f"Unknown engines: {', '.join(unknown)}")
+    engines = {name: ENGINES[name] for name in args.engines.split(",")}
+
+    corpora = {}
+    if args.synthetic:
+        snrs = [float(value) for value in args.snrs.split(",") if value.strip()]
+        corpora["synthetic"] = synthetic_corpus(args.synthetic, snrs, args.scenario, seconds)
+    for path in args.recording:
+        corpora[os.path.basename(os.path.normpath(path))] = recorded_corpus(path, args.max_windows, args.scenario, seconds)
+
+    report = {"rhoTol": args.rho_tol, "corpora": {}}
+    passed = True
+    for corpus_name, corpus in corpora.items():
+        if not corpus:
+            print(f"[WARN] {corpus_name}: no windows")
+            continue
+        summary, rows = verify(corpus, engines)
+        print_report(corpus_name, summary, args.rho_tol)
+        report["corpora"][corpus_name] = {"summary": summary, "windows": rows}
+        passed = passed and all(s["labelAgreement"] == 1.0 and s["maxRhoDiff"] <= args.rho_tol
+                                for s in summary.values())
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Results written to {args.json}")
+    sys.exit(0 if passed else 1)
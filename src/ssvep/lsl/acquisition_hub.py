@@ -0,0 +1,293 @@
+"""Single acquisition producer with fan-out to any number of WebSocket clients.
+
+Each server owns exactly one AcquisitionHub. The hub starts the server's
+producer coroutine when the first client connects and keeps it running for the
+lifetime of the process, so a second client (a visualiser, a recorder or the
+app after a reload) never opens a second inlet or fights over the device.
+
+Every client gets its own bounded queue (and a small socket send buffer, so a
+slow client's backlog collects there). When a queue is full the configured
+overflow policy decides what happens:
+  - "drop-oldest": discard the oldest queued packet and count it as dropped.
+  - "disconnect":  close the slow client so it cannot hold back the others.
+
+Packets are published already encoded (JSON strings), so each packet is
+serialised once no matter how many clients are attached. Slow-changing
+stream metadata (e.g. channel names) is published with `set_state` instead:
+the hub keeps the latest packet per key and replays it to clients that
+connect later, so it never has to ride along in every sample packet.
+
+Messages sent by clients (e.g. the app's stimulus markers, see markers.py)
+are passed to the optional `on_message` callback with the raw message text.
+
+If the producer returns or raises (stream lost, device error, replay finished),
+every connected client is closed with code 1011, so clients reconnect and the
+next connect starts the producer again instead of waiting on a silent socket.
+"""
+
+import asyncio
+import collections
+import socket
+import time
+
+import websockets
+
+from jitter_histogram import JitterHistogram
+
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DISCONNECT)
+
+DEFAULT_QUEUE_SIZE = 1024
+# Kernel send buffer per client socket. Left to autotuning it grows to megabytes, which hide a slow
+# client's backlog from its queue (and the overflow policy) for minutes.
+CLIENT_SEND_BUFFER = 64 * 1024
+CLOSE_SLOW_CLIENT = (1013, "client too slow")
+CLOSE_PRODUCER_STOPPED = (1011, "acquisition stopped")
+
+
+class ClientQueue:
+    """Bounded per-client packet queue with lag counters."""
+
+    def __init__(self, websocket, maxsize=DEFAULT_QUEUE_SIZE, overflow_policy=OVERFLOW_DROP_OLDEST):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow_policy}'. Expected one of {OVERFLOW_POLICIES}.")
+
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.overflow_policy = overflow_policy
+        self.overflowed = False
+        self.close_frame = None   # (code, reason) the client must be closed with, see end()
+
+        self._packets = collections.deque()
+        self._enqueued_at = collections.deque()   # perf_counter() per queued packet, for send latency
+        self._sending_since = None
+        self._ready = asyncio.Event()
+
+        # Counters
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.max_lag = 0
+        # Interval counters (see interval_stats)
+        self._dropped_reported = 0
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self._latency_count = 0
+        self.send_intervals = JitterHistogram()
+        self._last_sent = None
+
+    @property
+    def lag(self):
+        """Number of packets published but not yet sent to this client."""
+        return len(self._packets)
+
+    def put(self, packet):
+        """Queue a packet. Returns False if the client must be disconnected."""
+        if len(self._packets) >= self.maxsize:
+            if self.overflow_policy == OVERFLOW_DISCONNECT:
+                self.overflowed = True
+                self.end(*CLOSE_SLOW_CLIENT)
+                return False
+            self._packets.popleft()
+            self._enqueued_at.popleft()
+            self.dropped += 1
+
+        self._packets.append(packet)
+        self._enqueued_at.append(time.perf_counter())
+        self.enqueued += 1
+        if len(self._packets) > self.max_lag:
+            self.max_lag = len(self._packets)
+        self._ready.set()
+        return True
+
+    def end(self, code, reason):
+        """Make get() return None, so the client is closed with (code, reason)."""
+        if self.close_frame is None:
+            self.close_frame = (code, reason)
+        self._ready.set()
+
+    async def get(self):
+        """Wait for the next packet. Returns None once the client must be closed (see close_frame).
+
+        An overflowed client is closed at once; otherwise the packets already queued are sent first.
+        """
+        while not self._packets:
+            if self.close_frame is not None:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        if self.overflowed:
+            return None
+        self._sending_since = self._enqueued_at.popleft()
+        return self._packets.popleft()
+
+    def mark_sent(self):
+        """Count the packet returned by the last get() as sent and record its queue-to-socket latency."""
+        self.sent += 1
+        now = time.perf_counter()
+        if self._last_sent is not None:
+            self.send_intervals.record(now - self._last_sent)
+        self._last_sent = now
+        latency = now - self._sending_since
+        self._latency_sum += latency
+        self._latency_count += 1
+        if latency > self._latency_max:
+            self._latency_max = latency
+
+    def stats(self):
+        return {
+            "lag": self.lag,
+            "maxLag": self.max_lag,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+    def interval_stats(self, send_intervals=None):
+        """Queue depth, drops, send latency and send intervals since the previous call (for stream_metrics).
+
+        The send interval counts are also merged into the `send_intervals` histogram, if given.
+        """
+        stats = {
+            "lag": self.lag,
+            "maxLag": self.max_lag,
+            "droppedInInterval": self.dropped - self._dropped_reported,
+            "sendLatencyMs": {
+                "mean": round(self._latency_sum / self._latency_count * 1e3, 3) if self._latency_count else None,
+                "max": round(self._latency_max * 1e3, 3),
+            },
+            "sendIntervalMs": self.send_intervals.take_interval(into=send_intervals),
+            "sent": self.sent,
+        }
+        self._dropped_reported = self.dropped
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self._latency_count = 0
+        return stats
+
+
+class AcquisitionHub:
+    """Runs one producer coroutine and broadcasts its packets to all clients.
+
+    `producer` is an async callable taking the hub as its only argument. It
+    acquires samples and calls `hub.publish(packet)` for every encoded packet.
+    If it returns or raises, the hub closes every client (code 1011) and starts it
+    again on the next client connect.
+    `on_message`, if given, is called on the event loop with every message a client sends.
+    """
+
+    def __init__(self, producer, queue_size=DEFAULT_QUEUE_SIZE, overflow_policy=OVERFLOW_DROP_OLDEST,
+                 on_message=None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow_policy}'. Expected one of {OVERFLOW_POLICIES}.")
+
+        self.producer = producer
+        self.on_message = on_message
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.clients = set()
+        self.published = 0
+        self.states = {}
+        self._producer_task = None
+
+    def ensure_producer(self):
+        """Start the producer task if it is not already running."""
+        if self._producer_task is None or self._producer_task.done():
+            self._producer_task = asyncio.get_running_loop().create_task(self._run_producer())
+        return self._producer_task
+
+    async def _run_producer(self):
+        try:
+            await self.producer(self)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] Acquisition producer stopped: {e}")
+        else:
+            print("[INFO] Acquisition producer finished.")
+        # Nothing will be published any more: close the clients so they reconnect (and restart the producer)
+        for client in tuple(self.clients):
+            client.end(*CLOSE_PRODUCER_STOPPED)
+
+    def publish(self, packet):
+        """Queue an encoded packet for every connected client."""
+        self.published += 1
+        for client in tuple(self.clients):
+            if not client.put(packet):
+                print(f"[WARN] Client queue overflowed ({client.maxsize} packets); disconnecting slow client.")
+                self.clients.discard(client)
+
+    def set_state(self, key, packet):
+        """Publish an encoded state packet and remember it for clients that connect later.
+
+        Publishing the same packet again for a key is a no-op.
+        """
+        if self.states.get(key) == packet:
+            return
+        self.states[key] = packet
+        self.publish(packet)
+
+    async def wait_for_capacity(self, fraction=0.5, poll_interval=0.001):
+        """Wait until every client has less than `fraction` of its queue pending.
+
+        Producers without a real-time source (replay, synthetic) await this to
+        run as fast as the slowest client instead of overflowing its queue.
+        """
+        limit = max(1, int(self.queue_size * fraction))
+        while self.clients and max(client.lag for client in self.clients) >= limit:
+            await asyncio.sleep(poll_interval)
+
+    async def serve_client(self, websocket):
+        """WebSocket handler: register the client and forward packets until it goes away."""
+        client = ClientQueue(websocket, self.queue_size, self.overflow_policy)
+        sock = websocket.transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, CLIENT_SEND_BUFFER)
+        for packet in self.states.values():
+            client.put(packet)
+        self.clients.add(client)
+        self.ensure_producer()
+        reader = asyncio.get_running_loop().create_task(self._read_client(websocket)) if self.on_message else None
+
+        try:
+            while True:
+                packet = await client.get()
+                if packet is None:
+                    code, reason = client.close_frame
+                    await websocket.close(code=code, reason=reason)
+                    break
+                await websocket.send(packet)
+                client.mark_sent()
+        except websockets.exceptions.ConnectionClosed:
+            print("[INFO] WebSocket client disconnected.")
+        finally:
+            self.clients.discard(client)
+            if reader is not None:
+                reader.cancel()
+
+    async def _read_client(self, websocket):
+        try:
+            async for message in websocket:
+                try:
+                    self.on_message(message)
+                except Exception as e:
+                    print(f"[WARN] Failed to handle client message: {e}")
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    def stats(self):
+        return {
+            "clients": len(self.clients),
+            "published": self.published,
+            "perClient": [client.stats() for client in self.clients],
+        }
+
+    async def close(self):
+        """Stop the producer (used on shutdown)."""
+        if self._producer_task is not None and not self._producer_task.done():
+            self._producer_task.cancel()
+            try:
+                await self._producer_task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,96 @@
+"""tracemalloc-backed allocation self-check for the acquisition loops.
+
+Enable with the environment variable BOGGLE_ALLOC_CHECK=<seconds> (or 1 for
+the default 10 s interval). Every interval the probe reports, through the
+server's emit_event:
+  - netBytesPerSec:   growth of traced memory per second of streaming
+  - peakBytes:        transient high-water mark above the interval's baseline
+  - samplesPerSec:    samples streamed during the interval, for context
+
+A steady-state loop should report netBytesPerSec close to zero.
+
+tracemalloc is shared with memory_monitor.py (BOGGLE_MEMORY): the probe only
+stops tracing it started itself, and while a monitor is running it does not
+reset the traced peak (the monitor reports it), so peakBytes is None then.
+"""
+
+import os
+import time
+import tracemalloc
+
+from memory_monitor import monitor_running
+
+DEFAULT_INTERVAL = 10.0
+
+
+def interval_from_env(var="BOGGLE_ALLOC_CHECK"):
+    """Return the probe interval in seconds, or None when the check is disabled."""
+    raw = os.environ.get(var)
+    if not raw or raw == "0":
+        return None
+    try:
+        value = float(raw)
+    except ValueError:
+        return None
+    return DEFAULT_INTERVAL if value == 1 else value
+
+
+class AllocationProbe:
+    def __init__(self, emit, interval=DEFAULT_INTERVAL):
+        self.emit = emit
+        self.interval = interval
+        self._last_time = None
+        self._last_current = 0
+        self._samples = 0
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._last_time = time.perf_counter()
+        self._last_current, _ = tracemalloc.get_traced_memory()
+        self._reset_peak()
+
+    def _reset_peak(self):
+        # The peak is process-wide; a running MemoryMonitor reports it as tracedPeakMb
+        if not monitor_running():
+            tracemalloc.reset_peak()
+
+    def tick(self, samples=0):
+        """Count streamed samples and report once per interval. Cheap when nothing is due."""
+        self._samples += samples
+        now = time.perf_counter()
+        elapsed = now - self._last_time
+        if elapsed < self.interval or not tracemalloc.is_tracing():
+            return
+
+        current, peak = tracemalloc.get_traced_memory()
+        self.emit(
+            "alloc-check",
+            netBytesPerSec=round((current - self._last_current) / elapsed, 1),
+            peakBytes=None if monitor_running() else peak - self._last_current,
+            samplesPerSec=round(self._samples / elapsed, 1),
+        )
+
+        self._last_time = now
+        self._last_current = current
+        self._samples = 0
+        self._reset_peak()
+
+    def stop(self):
+        """Stop tracing if this probe started it."""
+        if self._started_tracing:
+            self._started_tracing = False
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+
+def create_probe(emit):
+    """Return a started AllocationProbe if BOGGLE_ALLOC_CHECK is set, otherwise None."""
+    interval = interval_from_env()
+    if interval is None:
+        return None
+    probe = AllocationProbe(emit, interval)
+    probe.start()
+    return probe
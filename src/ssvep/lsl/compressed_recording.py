@@ -0,0 +1,315 @@
+"""Chunk-compressed EEG recordings (optional alternative to the raw container in recording.py).
+
+A compressed recording is a directory (conventionally *.bglrec, like the raw one) holding:
+    meta.json    channels, samplingRate, codec, chunkSamples and free-form metadata ("format": "chunked")
+    chunks.bin   compressed chunks, back to back
+    chunks.idx   one record per chunk: first time, last time, sample offset, count, byte offset, byte length
+    markers.jsonl  optional stimulus markers, as in recording.py
+
+Each chunk covers a fixed duration (chunk_seconds). Its timestamps and values
+are stored losslessly: the float bit patterns are delta-encoded per channel
+(as wrapping integers), split into byte planes and compressed with zlib or
+lzma from the standard library. Random access decompresses only the chunks
+that overlap the requested window.
+
+Benchmark write throughput and compression ratio against the raw format with:
+    python compressed_recording.py bench [--seconds 600] [--channels 8] [--rate 250]
+"""
+
+import argparse
+import json
+import lzma
+import os
+import shutil
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+from recording import META_FILE, Recording, RecordingWriter, load_markers
+
+CHUNKS_FILE = "chunks.bin"
+CHUNK_INDEX_FILE = "chunks.idx"
+
+CODECS = ("zlib", "lzma")
+DEFAULT_CODEC = "zlib"
+DEFAULT_CHUNK_SECONDS = 10.0
+
+CHUNK_INDEX_DTYPE = np.dtype([("first", "<f8"), ("last", "<f8"), ("offset", "<u8"), ("count", "<u4"),
+                              ("byteOffset", "<u8"), ("byteLength", "<u4")])
+
+
+def _compress(codec, payload, level):
+    if codec == "zlib":
+        return zlib.compress(payload, 6 if level is None else level)
+    return lzma.compress(payload, preset=6 if level is None else level)
+
+
+def _decompress(codec, payload):
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    return lzma.decompress(payload)
+
+
+def _encode_deltas(bits):
+    """(n, columns) integer bit patterns -> byte planes of the per-column deltas."""
+    deltas = np.empty_like(bits)
+    deltas[0] = bits[0]
+    np.subtract(bits[1:], bits[:-1], out=deltas[1:])     # wraps on overflow, which decoding undoes
+    planes = deltas.T.copy().view(np.uint8).reshape(bits.shape[1], bits.shape[0], bits.itemsize)
+    return planes.transpose(2, 0, 1).tobytes()
+
+
+def _decode_deltas(payload, count, columns, int_dtype):
+    itemsize = np.dtype(int_dtype).itemsize
+    planes = np.frombuffer(payload, dtype=np.uint8).reshape(itemsize, columns, count)
+    deltas = planes.transpose(1, 2, 0).copy().view(int_dtype).reshape(columns, count).T
+    return np.cumsum(deltas, axis=0, dtype=int_dtype)
+
+
+def encode_chunk(timestamps, values):
+    """Losslessly encode a chunk of f64 timestamps and (n, channels) f32 values as bytes."""
+    time_bits = np.ascontiguousarray(timestamps, dtype="<f8").view("<i8").reshape(-1, 1)
+    value_bits = np.ascontiguousarray(values, dtype="<f4").view("<i4")
+    return _encode_deltas(time_bits) + _encode_deltas(value_bits)
+
+
+def decode_chunk(payload, count, channels):
+    split = count * 8
+    times = _decode_deltas(payload[:split], count, 1, "<i8").view("<f8").reshape(count)
+    values = _decode_deltas(payload[split:], count, channels, "<i4").view("<f4")
+    return times, values
+
+
+class CompressedRecordingWriter:
+    """Appender with the same interface as RecordingWriter, buffering samples into fixed-duration chunks."""
+
+    def __init__(self, path, channels, sampling_rate, metadata=None, codec=DEFAULT_CODEC,
+                 chunk_seconds=DEFAULT_CHUNK_SECONDS, level=None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}'. Expected one of {CODECS}.")
+
+        self.path = path
+        self.channels = channels
+        self.sampling_rate = float(sampling_rate)
+        self.codec = codec
+        self.level = level
+        self.chunk_samples = max(1, int(round(chunk_seconds * self.sampling_rate)))
+        self.num_samples = 0
+        self.bytes_written = 0
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump({"format": "chunked", "channels": channels, "samplingRate": self.sampling_rate,
+                       "codec": codec, "chunkSamples": self.chunk_samples, "metadata": metadata or {}}, f, indent=2)
+
+        self._chunks = open(os.path.join(path, CHUNKS_FILE), "wb")
+        self._index = open(os.path.join(path, CHUNK_INDEX_FILE), "wb")
+        self._entry = np.zeros(1, dtype=CHUNK_INDEX_DTYPE)
+
+        self._times = np.zeros(self.chunk_samples, dtype="<f8")
+        self._values = np.zeros((self.chunk_samples, channels), dtype="<f4")
+        self._staged = 0
+
+    def append(self, timestamps, values):
+        """Append a block: timestamps (n,) and values (n, channels)."""
+        values = np.asarray(values)[:, :self.channels]
+        start, total = 0, len(timestamps)
+        while start < total:
+            take = min(self.chunk_samples - self._staged, total - start)
+            self._times[self._staged:self._staged + take] = timestamps[start:start + take]
+            self._values[self._staged:self._staged + take] = values[start:start + take]
+            self._staged += take
+            start += take
+            if self._staged == self.chunk_samples:
+                self._write_chunk()
+
+    def _write_chunk(self):
+        count = self._staged
+        if not count:
+            return
+        payload = _compress(self.codec, encode_chunk(self._times[:count], self._values[:count]), self.level)
+        self._chunks.write(payload)
+
+        entry = self._entry
+        entry["first"] = self._times[0]
+        entry["last"] = self._times[count - 1]
+        entry["offset"] = self.num_samples
+        entry["count"] = count
+        entry["byteOffset"] = self.bytes_written
+        entry["byteLength"] = len(payload)
+        self._index.write(entry.tobytes())
+
+        self.num_samples += count
+        self.bytes_written += len(payload)
+        self._staged = 0
+
+    def flush(self):
+        # Partial chunks are only written on close; flushing keeps complete chunks on disk
+        self._chunks.flush()
+        self._index.flush()
+
+    def close(self):
+        self._write_chunk()
+        self.flush()
+        self._chunks.close()
+        self._index.close()
+
+
+class CompressedRecording:
+    """Read-only chunked recording with the same query methods as Recording.
+
+    Windows are decoded copies rather than views; only the chunks overlapping a
+    window are decompressed, and the most recently used chunk is cached.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        self.channels = int(meta["channels"])
+        self.sampling_rate = float(meta["samplingRate"])
+        self.codec = meta["codec"]
+        self.metadata = meta.get("metadata", {})
+
+        index = np.fromfile(os.path.join(path, CHUNK_INDEX_FILE), dtype=CHUNK_INDEX_DTYPE)
+        chunks_size = os.path.getsize(os.path.join(path, CHUNKS_FILE))
+        complete = (index["byteOffset"] + index["byteLength"]) <= chunks_size
+        self.index = index[:int(np.argmin(complete)) if not complete.all() else len(index)]
+        self._chunk_last = np.ascontiguousarray(self.index["last"])
+        self._chunk_ends = np.ascontiguousarray(self.index["offset"] + self.index["count"])
+        self.num_samples = int(self._chunk_ends[-1]) if len(self.index) else 0
+        self._cache = (None, None, None)
+
+    def __len__(self):
+        return self.num_samples
+
+    @property
+    def start_time(self):
+        return float(self.index["first"][0]) if len(self.index) else None
+
+    @property
+    def end_time(self):
+        return float(self.index["last"][-1]) if len(self.index) else None
+
+    def chunk(self, i):
+        """Decode chunk i. Returns (timestamps, values)."""
+        if self._cache[0] == i:
+            return self._cache[1], self._cache[2]
+        entry = self.index[i]
+        with open(os.path.join(self.path, CHUNKS_FILE), "rb") as f:
+            f.seek(int(entry["byteOffset"]))
+            payload = _decompress(self.codec, f.read(int(entry["byteLength"])))
+        times, values = decode_chunk(payload, int(entry["count"]), self.channels)
+        self._cache = (i, times, values)
+        return times, values
+
+    def index_at(self, t):
+        """Position of the first sample stamped at or after t (num_samples if none)."""
+        i = int(np.searchsorted(self._chunk_last, t, side="left"))
+        if i >= len(self.index):
+            return self.num_samples
+        times, _ = self.chunk(i)
+        return int(self.index["offset"][i]) + int(np.searchsorted(times, t, side="left"))
+
+    def samples_between(self, start, end):
+        """Sample rows [start, end) as a (samples, channels) array."""
+        if end <= start:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        first = int(np.searchsorted(self._chunk_ends, start, side="right"))
+        last = int(np.searchsorted(self._chunk_ends, end - 1, side="right"))
+        parts = []
+        for i in range(first, last + 1):
+            offset = int(self.index["offset"][i])
+            _, values = self.chunk(i)
+            parts.append(values[max(start - offset, 0):end - offset])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def window(self, t_start, t_end):
+        return self.samples_between(self.index_at(t_start), self.index_at(t_end))
+
+    def eeg_window(self, t_start, t_end):
+        return self.window(t_start, t_end).T
+
+    def eeg_window_before(self, t_end, num_samples):
+        end = self.index_at(t_end)
+        return self.samples_between(max(0, end - int(num_samples)), end).T
+
+    def markers(self):
+        return load_markers(self.path)
+
+    def blocks(self):
+        for i in range(len(self.index)):
+            yield self.chunk(i)
+
+
+def open_recording(path):
+    """Open a raw or chunk-compressed recording, whichever `path` holds."""
+    with open(os.path.join(path, META_FILE), "r") as f:
+        fmt = json.load(f).get("format", "raw")
+    return CompressedRecording(path) if fmt == "chunked" else Recording(path)
+
+
+def _synthetic_eeg(num_samples, channels, sampling_rate, seed=0):
+    """EEG-like test signal: per-channel random walk plus noise and a 10 Hz rhythm, quantised like a 24-bit ADC."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_samples) / sampling_rate
+    drift = np.cumsum(rng.normal(0, 0.5, (num_samples, channels)), axis=0)
+    signal = drift + rng.normal(0, 5, (num_samples, channels)) + 10 * np.sin(2 * np.pi * 10 * t)[:, None]
+    lsb = 0.02235174  # uV per bit of a typical 24-bit EEG amplifier
+    return 1_700_000_000.0 + t, (np.round(signal / lsb) * lsb).astype(np.float32)
+
+
+def benchmark(seconds=600, channels=8, sampling_rate=250, block_size=32):
+    """Compare write throughput and size of the raw container against zlib/lzma chunked recordings."""
+    num_samples = int(seconds * sampling_rate)
+    times, values = _synthetic_eeg(num_samples, channels, sampling_rate)
+    raw_bytes = values.nbytes + times.nbytes
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="bglrec-bench-")
+    try:
+        candidates = [("raw", lambda p: RecordingWriter(p, channels, sampling_rate))]
+        for codec in CODECS:
+            candidates.append((codec, lambda p, c=codec: CompressedRecordingWriter(p, channels, sampling_rate, codec=c)))
+
+        for name, make_writer in candidates:
+            path = os.path.join(workdir, f"{name}.bglrec")
+            start = time.perf_counter()
+            writer = make_writer(path)
+            for i in range(0, num_samples, block_size):
+                writer.append(times[i:i + block_size], values[i:i + block_size])
+            writer.close()
+            elapsed = time.perf_counter() - start
+
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if f != META_FILE)
+            start = time.perf_counter()
+            decoded = open_recording(path).eeg_window(times[0], times[-1] + 1)
+            read_elapsed = time.perf_counter() - start
+            assert np.array_equal(decoded.T, values), f"{name} round trip mismatch"
+
+            results.append({
+                "format": name,
+                "bytes": size,
+                "ratio": round(raw_bytes / size, 2),
+                "writeMBps": round(raw_bytes / elapsed / 1e6, 1),
+                "samplesPerSec": round(num_samples / elapsed),
+                "readAllSecs": round(read_elapsed, 3),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk-compressed EEG recordings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Compare raw and compressed recording formats")
+    bench.add_argument("--seconds", type=float, default=600)
+    bench.add_argument("--channels", type=int, default=8)
+    bench.add_argument("--rate", type=float, default=250)
+    args = parser.parse_args()
+
+    for row in benchmark(args.seconds, args.channels, args.rate):
+        print(json.dumps(row))
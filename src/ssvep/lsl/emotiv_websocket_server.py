@@ -57,13 +57,20 @@
 # Data flow and success path
 # A) on_message() routes:
 #    - 'eeg' -> handle_eeg_data()  (updates last_data_time and forwards to browser clients)
-#    - 'dev' -> handle_device_data()
-#    - 'eq'  -> handle_quality_data()
+#    - 'dev' -> handle_device_data()  (state_callback("deviceData", ...) when the values change)
+#    - 'eq'  -> handle_quality_data()  (state_callback("qualityData", ...) when the values change)
 #
 # B) handle_eeg_data()
 #    - Updates last_data_time, clears disconnection flags, resets resubscribe_attempts.
-#    - Extracts EEG channel values (SSVEP-only or all electrodes), applies optional filtering,
+#    - Extracts EEG channel values (SSVEP-only or all electrodes) with a single np.take over the
+#      index array resolved by configure_channel_layout(), applies optional filtering,
 #      and pushes to browser WebSocket clients via data_callback().
+#    - configure_channel_layout() runs once per subscribe ACK from the Cortex 'cols' metadata and
+#      reports the channel names through layout_callback(), which the server sends to browser
+#      clients once at connection time ({"channelNames": [...]}) rather than in every packet.
+#    - Sample packets carry only {time, values}. Device and quality data are sent as separate
+#      {"deviceData": {...}} / {"qualityData": {...}} messages, only when their values change
+#      (about twice a second), and replayed to clients that connect later.
 #
 # Guards and recovery
 # G1) start_post_subscribe_guard()
@@ -83,8 +90,12 @@
 # - -32007 "session does not exist": full restart via hard_reset().
 #
 # Browser/WebSocket server (ws://localhost:8765)
-# - websockets.serve(emotiv_to_websocket, "localhost", 8765) broadcasts EEG/dev/eq to all connected clients.
-# - emotiv_to_websocket() sets a thread-safe callback that schedules async sends in the main asyncio loop.
+# - websockets.serve(hub.serve_client, "localhost", 8765) broadcasts EEG/dev/eq to all connected clients.
+# - The Cortex thread only appends packets to a bounded ring (push_sample). A single asyncio sender
+#   coroutine (emotiv_sender) drains it every SEND_INTERVAL, encodes each batch once as
+#   {"seq": N, "samples": [packet, ...]} and hands it to the AcquisitionHub for per-client fan-out.
+#   Each batch first passes a SampleRing (sample_ring.py): gaps in the COUNTER column are
+#   counted (short ones filled), rate drift is measured and seq numbers every sample.
 #
 # Typical sequence on success
 # - {"event":"server-ready"}
@@ -106,17 +117,34 @@
 # =========================================================================================
 
 import asyncio
+import collections
 import os
+import sys
 import time
 import websockets
 import json
 import ssl
 import threading
 import numpy as np
-from scipy.signal import butter, lfilter, iirnotch
+from scipy.signal import lfilter
 import websocket
 from dotenv import load_dotenv
 
+from acquisition_hub import AcquisitionHub
+from markers import MarkerSink
+from memory_monitor import MemoryMonitor
+from raw_recorder import RawRecorder, session_filename
+from sample_blocks import design_filters, filter_settings
+from sample_ring import SampleRing
+from stream_metrics import StreamMetrics
+
+# Adding the sibling folder fbcca-py to sys.path for the shared profiling helper.
+FBCCA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fbcca-py")
+if FBCCA_DIR not in sys.path:
+    sys.path.insert(0, FBCCA_DIR)
+
+from profiling import Profiler  # noqa: E402
+
 # Load credentials from a path provided by the Electron app when available.
 _ENV_PATH = os.getenv("EMOTIV_ENV_PATH")
 if _ENV_PATH and os.path.isfile(_ENV_PATH):
@@ -138,66 +166,33 @@ FILTER_ORDER = 5
 NOTCH_Q = 30.0
 EMOTIV_CHANNEL_NAMES = ["AF3", "F7", "F3", "FC5", "T7", "P7", "O1", "O2", "P8", "T8", "FC6", "F4", "F8", "AF4"] # Emotiv Epoc X channel names always in this order
 APPLY_FILTERING = False      # Set to True/False to enable/disable bandpass and notch filters
-SAVE_RAW_DATA = False        # Set to True/False to enable/disable saving raw data to JSON files
+FILTER_SETTINGS = filter_settings(APPLY_FILTERING, LOWCUT, HIGHCUT, FILTER_ORDER, NOTCH_FREQ, NOTCH_Q)
+SAVE_RAW_DATA = False        # Set to True/False to enable/disable recording raw data (raw_recorder.py)
 RECONNECT_INTERVAL = 3.0     # Seconds between reconnect/retry attempts
+SAMPLE_RING_SIZE = 2048      # Max EEG packets held between the Cortex thread and the sender coroutine
+SEND_INTERVAL = 0.02         # Seconds between batch sends to browser clients
+CLIENT_QUEUE_SIZE = 256      # Max batches buffered per WebSocket client before the overflow policy applies
+CLIENT_OVERFLOW_POLICY = "drop-oldest"  # "drop-oldest" or "disconnect" for clients that fall behind
 
 # === ELECTRODE CONFIGURATION ===
 # Epoc X electrode layout: AF3, F7, F3, FC5, T7, P7, O1, O2, P8, T8, FC6, F4, F8, AF4
 # For SSVEP applications, occipital and parietal channels are most relevant
 USE_SSVEP_CHANNELS_ONLY = True  # Set to False to use all channels
+SSVEP_CHANNEL_NAMES = ["P7", "O1", "O2", "P8"]                              # --> HEADSET NORMAL
+# SSVEP_CHANNEL_NAMES = ["AF3", "AF4", "F7", "F8", "F3", "F4", "FC5", "FC6"]  # --> HEADSET UPSIDE DOWN
+# Cortex 'eeg' columns that precede the electrodes when no 'cols' metadata is available
+EEG_LEADING_COLUMNS = ["COUNTER", "INTERPOLATED"]
 
-# Function to save raw EEG sample to JSON in the format:
-# { "eegData": [ [], [], ... ] }
-RAW_JSON_FILENAME = "datasets/RAW-eeg-data.json"
-
-# Buffer for raw samples
-RAW_SAMPLE_BUFFER = []
-RAW_SAMPLE_BUFFER_SIZE = 1000
-
-def save_raw_sample_to_json(sample, filename=RAW_JSON_FILENAME):
-    """
-    Buffer raw EEG samples and write to JSON file once every 1000 samples.
-    """
-    global RAW_SAMPLE_BUFFER
-    RAW_SAMPLE_BUFFER.append(sample)
-    if len(RAW_SAMPLE_BUFFER) >= RAW_SAMPLE_BUFFER_SIZE:
-        try:
-            folder = os.path.dirname(filename)
-            if folder and not os.path.exists(folder):
-                os.makedirs(folder, exist_ok=True)
-            try:
-                with open(filename, "r") as f:
-                    file_data = json.load(f)
-                eeg_data = file_data.get("eegData", [])
-            except (FileNotFoundError, json.JSONDecodeError):
-                eeg_data = [[] for _ in range(len(sample))]
-            # Append buffered samples
-            for buffered_sample in RAW_SAMPLE_BUFFER:
-                for i, value in enumerate(buffered_sample):
-                    eeg_data[i].append(value)
-            with open(filename, "w") as f:
-                json.dump({"eegData": eeg_data}, f, indent=2)
-            RAW_SAMPLE_BUFFER = []
-        except Exception as e:
-            print(f"Error saving raw EEG samples: {e}")
+# Raw recordings are written append-only on a background thread (see raw_recorder.py);
+# convert with `python raw_recorder.py to-json <file> <out.json>` for the { "eegData": [...] } layout.
+RAW_RECORDING_PREFIX = "datasets/RAW-eeg-data"
+RAW_RECORDING_COMPRESSION = None   # None (raw, memory-mapped), "zlib" or "lzma" (chunk-compressed, see compressed_recording.py)
 
 # Design filters
-def butter_bandpass(lowcut, highcut, fs, order=5):
-    nyq = 0.5 * fs
-    low = lowcut / nyq
-    high = highcut / nyq
-    return butter(order, [low, high], btype='band')
-
-def notch_filter(freq, fs, quality=30):
-    nyq = 0.5 * fs
-    norm_freq = freq / nyq
-    return iirnotch(norm_freq, quality)
-
 def apply_filter(data, b, a):
     return lfilter(b, a, data)
 
-b_band, a_band = butter_bandpass(LOWCUT, HIGHCUT, FS, FILTER_ORDER)
-b_notch, a_notch = notch_filter(NOTCH_FREQ, FS, NOTCH_Q)
+(b_band, a_band), (b_notch, a_notch) = design_filters(FILTER_SETTINGS, FS)
 
 
 # === JSON-RPC event emitter to stdout (for Node consumer) ===
@@ -213,9 +208,11 @@ def emit_event(event_type: str, **params):
 
 
 class EmotivEEGClient:
-    def __init__(self, data_callback=None):
+    def __init__(self, data_callback=None, layout_callback=None, state_callback=None):
         self.ws = None
         self.data_callback = data_callback
+        self.layout_callback = layout_callback
+        self.state_callback = state_callback
         self.auth_token = None
         self.headset_id = None
         self.session_id = None
@@ -232,6 +229,16 @@ class EmotivEEGClient:
         self.max_resubscribe_attempts = 3
         self.access_granted = False
 
+        # Raw recorder (SAVE_RAW_DATA), reopened when the channel layout changes
+        self.recorder = None
+
+        # EEG channel layout (resolved once per subscription)
+        self.channel_names = None
+        self.channel_index = None
+        self.channel_span = 0
+        self.counter_index = None   # COUNTER column: the device's sample counter, for gap detection
+        self.configure_channel_layout(None)
+
         # Start watchdog once for lifetime
         threading.Thread(target=self.watchdog_loop, daemon=True).start()
 
@@ -522,6 +529,7 @@ class EmotivEEGClient:
             if 'result' in data:
                 self.subscribed = True
                 print(f"[INFO] Subscription confirmed: {data['result']}")
+                self.configure_channel_layout(self.find_stream_cols(data.get('result'), 'eeg'))
                 try:
                     # Include minimal streams info if available
                     streams = None
@@ -541,6 +549,51 @@ class EmotivEEGClient:
                 print("[ERROR] Subscribe failed or returned no result; will retry")
                 self.schedule_headset_search()
 
+    @staticmethod
+    def find_stream_cols(result, stream_name):
+        """Return the 'cols' list Cortex reported for a subscribed stream, if any."""
+        try:
+            for stream in (result or {}).get('success') or []:
+                if stream.get('streamName') == stream_name and isinstance(stream.get('cols'), list):
+                    return stream['cols']
+        except Exception:
+            pass
+        return None
+
+    def configure_channel_layout(self, cols):
+        """Resolve which positions of each 'eeg' sample hold the channels we forward.
+
+        Uses the Cortex 'cols' metadata when available, otherwise assumes the Epoc X
+        layout [COUNTER, INTERPOLATED, AF3 ... AF4, ...].
+        """
+        if not cols:
+            cols = EEG_LEADING_COLUMNS + EMOTIV_CHANNEL_NAMES
+
+        wanted = SSVEP_CHANNEL_NAMES if USE_SSVEP_CHANNELS_ONLY else EMOTIV_CHANNEL_NAMES
+        names = [name for name in wanted if name in cols]
+        missing = [name for name in wanted if name not in cols]
+        if missing:
+            print(f"[WARNING] EEG channels not reported by Cortex: {missing}")
+
+        if SAVE_RAW_DATA and names != self.channel_names:
+            # One recording per channel layout
+            if self.recorder is not None:
+                self.recorder.close()
+            self.recorder = RawRecorder(session_filename(RAW_RECORDING_PREFIX), len(names), FS,
+                                        metadata={"source": "emotiv", "channelNames": names,
+                                                  "filter": FILTER_SETTINGS},
+                                        compression=RAW_RECORDING_COMPRESSION)
+
+        self.channel_names = names
+        self.channel_index = np.array([cols.index(name) for name in names], dtype=np.intp)
+        # Samples are sliced up to the last wanted column so trailing list-valued columns are never converted
+        self.channel_span = int(self.channel_index.max()) + 1 if len(names) else 0
+        self.counter_index = cols.index("COUNTER") if "COUNTER" in cols else None
+        print(f"[INFO] EEG channel layout: {names} at columns {self.channel_index.tolist()}")
+
+        if self.layout_callback:
+            self.layout_callback(names)
+
     def handle_eeg_data(self, data):
         try:
             eeg_data = data.get('eeg', None)
@@ -550,75 +603,39 @@ class EmotivEEGClient:
             self.disconnected = False
             self.subscribed = True
             self.resubscribe_attempts = 0  # reset on first EEG
-            
-            if eeg_data and len(eeg_data) > 2 and timestamp:
-                # Skip the first two elements (sequence number and unknown)
-                # Take all EEG channels (excluding the last few elements which might be quality indicators)
-                # Typically the structure is: [sequence, unknown, ...EEG_channels..., quality_indicators, metadata]
-                
-                if USE_SSVEP_CHANNELS_ONLY:
-                    # === SSVEP-SPECIFIC ELECTRODES ONLY ===
-                    # Epoc X electrode order: AF3, F7, F3, FC5, T7, P7, O1, O2, P8, T8, FC6, F4, F8, AF4
-                    # SSVEP optimal channels: P7(5), O1(6), O2(7), P8(8) - using 0-based indexing after skipping first 2 elements
-                    # These channels are positioned over occipital and parietal regions, optimal for SSVEP signal detection
-                    
-                    ssvep_channel_indices = [5, 6, 7, 8]                # P7, O1, O2, P8  --> HEADSET NORMAL
-                    # ssvep_channel_indices = [0, 13, 1, 12, 2, 11, 3, 10]  # AF3, AF4, F7, F8, F3, F4, FC5, FC6  --> HEADSET UPSIDE DOWN
-
-                    eeg_channels = []
-                    for idx in ssvep_channel_indices:
-                        channel_pos = idx + 2  # Add 2 to account for sequence number and unknown at start
-                        if channel_pos < len(eeg_data) and isinstance(eeg_data[channel_pos], (int, float)):
-                            eeg_channels.append(eeg_data[channel_pos])
-                    
-                    # print(f"[DEBUG] Using SSVEP channels only: {len(eeg_channels)} channels (P7, O1, O2, P8)")
-                else:
-                    # === ORIGINAL CODE - ALL ELECTRODES ===
-                    # Find the actual EEG channels (exclude non-numeric values at the end)
-                    eeg_channels = []
-                    for i in range(2, len(eeg_data)):
-                        if isinstance(eeg_data[i], (int, float)) and eeg_data[i] != 0.0:
-                            eeg_channels.append(eeg_data[i])
-                        elif isinstance(eeg_data[i], list):  # Stop when we hit arrays/lists (metadata)
-                            break
-                    
-                    # print(f"[DEBUG] Using all available channels: {len(eeg_channels)} channels")
-                
-                if len(eeg_channels) > 0:
-                    raw_values = np.array(eeg_channels)
 
-                    # Select channel names corresponding to SSVEP indices
-                    if USE_SSVEP_CHANNELS_ONLY:
-                        channel_names = [EMOTIV_CHANNEL_NAMES[idx] for idx in ssvep_channel_indices]
-                    else:
-                        channel_names = EMOTIV_CHANNEL_NAMES
+            if eeg_data and timestamp and self.channel_span and len(eeg_data) >= self.channel_span:
+                # One gather over the precomputed column indices (see configure_channel_layout)
+                raw_values = np.take(np.asarray(eeg_data[:self.channel_span], dtype=np.float64), self.channel_index)
 
-                    # Save raw data before filtering
-                    if SAVE_RAW_DATA:
-                        save_raw_sample_to_json(raw_values.tolist())
+                # Record raw data before filtering
+                if self.recorder is not None:
+                    self.recorder.write_sample(timestamp, raw_values)
 
-                    # Apply filters
-                    if APPLY_FILTERING:
-                        filtered_values = apply_filter(raw_values, b_band, a_band)
-                        filtered_values = apply_filter(filtered_values, b_notch, a_notch)
-                    else:
-                        filtered_values = raw_values.copy()
-
-                    data_packet = {
-                        "time": timestamp,
-                        "values": filtered_values.tolist(),
-                        "deviceData": self.latest_device_data,
-                        "qualityData": self.latest_quality_data,
-                        "channelNames": channel_names
-                    }
-                    
-                    # print(f"[DEBUG] Sending filtered data: time={timestamp}, channels={len(filtered_values)}")
-                    
-                    if self.data_callback:
-                        self.data_callback(data_packet)
+                # Apply filters
+                filter_started = time.perf_counter()
+                if APPLY_FILTERING:
+                    filtered_values = apply_filter(raw_values, b_band, a_band)
+                    filtered_values = apply_filter(filtered_values, b_notch, a_notch)
                 else:
-                    print(f"[WARNING] No valid EEG channels found in data: {eeg_data}")
-                    
+                    filtered_values = raw_values
+                filter_secs = time.perf_counter() - filter_started
+
+                data_packet = {
+                    "time": timestamp,
+                    "values": filtered_values.tolist()
+                }
+
+                # print(f"[DEBUG] Sending filtered data: time={timestamp}, channels={len(filtered_values)}")
+
+                if self.data_callback:
+                    counter = None
+                    if self.counter_index is not None and len(eeg_data) > self.counter_index:
+                        counter = int(eeg_data[self.counter_index])
+                    self.data_callback(data_packet, counter, filter_secs)
+            elif eeg_data:
+                print(f"[WARNING] No valid EEG channels found in data: {eeg_data}")
+
         except Exception as e:
             print(f"[ERROR] EEG data handling failed: {e}")
             import traceback
@@ -631,10 +648,13 @@ class EmotivEEGClient:
             timestamp = data.get('time', None)
             
             if dev_data and timestamp:
+                changed = self.latest_device_data is None or self.latest_device_data["data"] != dev_data
                 self.latest_device_data = {
                     "timestamp": timestamp,
                     "data": dev_data
                 }
+                if changed and self.state_callback:
+                    self.state_callback("deviceData", self.latest_device_data)
                 # Debug visibility for initial troubleshooting
                 # print(f"[DEVICE] Time: {timestamp}, Device data: {dev_data}")
                 
@@ -648,10 +668,13 @@ class EmotivEEGClient:
             timestamp = data.get('time', None)
             
             if eq_data and timestamp:
+                changed = self.latest_quality_data is None or self.latest_quality_data["data"] != eq_data
                 self.latest_quality_data = {
                     "timestamp": timestamp,
                     "data": eq_data
                 }
+                if changed and self.state_callback:
+                    self.state_callback("qualityData", self.latest_quality_data)
                 # Debug visibility for initial troubleshooting
                 # print(f"[QUALITY] Time: {timestamp}, EEG Quality: {eq_data}")
                 
@@ -791,61 +814,123 @@ class EmotivEEGClient:
 
 # Global variable to store the EEG client
 emotiv_client = None
-connected_websockets = set()
-main_loop = None  # Store reference to main event loop
-
-# === WebSocket Server Handler (For browser clients) ===
-async def emotiv_to_websocket(websocket):
-    global emotiv_client, connected_websockets, main_loop
-    
-    print("[INFO] Browser WebSocket client connected")
-    connected_websockets.add(websocket)
-    
-    # Store the main event loop reference
-    if main_loop is None:
-        main_loop = asyncio.get_event_loop()
-    
-    def send_to_browser(data_packet):
-        # Send data to all connected WebSocket clients using thread-safe method
-        if main_loop and not main_loop.is_closed():
-            for ws in connected_websockets.copy():  # Use copy to avoid modification during iteration
-                try:
-                    # Use call_soon_threadsafe for thread-safe scheduling
-                    main_loop.call_soon_threadsafe(
-                        asyncio.create_task,
-                        send_data_to_client(ws, data_packet)
-                    )
-                except Exception as e:
-                    print(f"[ERROR] Failed to schedule data send: {e}")
-                    connected_websockets.discard(ws)
+
+# Ring between the Cortex thread (producer) and the sender coroutine (consumer).
+# deque.append/popleft are atomic, so neither side takes a lock. Everything the sender needs
+# from the Cortex thread (including the seconds spent filtering) rides in the queued tuples.
+sample_ring = collections.deque(maxlen=SAMPLE_RING_SIZE)
+sender_stats = {
+    "pushed": 0,         # packets appended by the Cortex thread
+    "dropped": 0,        # packets evicted because the ring was full
+    "sent": 0,           # packets handed to the hub
+    "batches": 0,        # encoded batches handed to the hub
+    "backlog": 0,        # ring depth at the last drain
+    "maxBacklog": 0,     # highest ring depth seen at a drain
+}
+
+
+def push_sample(data_packet, counter=None, filter_secs=0.0):
+    """Cortex-thread callback: queue one EEG packet (its COUNTER value, filter seconds) for the sender coroutine."""
+    if len(sample_ring) == SAMPLE_RING_SIZE:
+        sender_stats["dropped"] += 1
+    sample_ring.append((data_packet, counter, filter_secs))
+    sender_stats["pushed"] += 1
+
+
+# === Sender coroutine (single producer for all browser clients) ===
+# Cortex sample times are Unix epoch seconds, so markers use the wall clock
+marker_sink = MarkerSink(time.time)
+
+# cProfile of the event loop on request: BOGGLE_PROFILE=<seconds> or {"profile": {"seconds": T}} (see profiling.py)
+profiler = Profiler("emotiv_server", announce=emit_event)
+
+
+def handle_client_message(message):
+    """Hub on_message: stimulus markers (markers.py), otherwise profiling requests."""
+    if marker_sink.handle_message(message) is None:
+        profiler.handle_message(message)
+
+
+async def emotiv_sender(hub):
+    global emotiv_client
+
+    main_loop = asyncio.get_running_loop()
+
+    def publish_channel_names(channel_names):
+        # Called from the Cortex thread after the layout (and the recorder) changed
+        if emotiv_client is not None:
+            marker_sink.recorder = emotiv_client.recorder
+        # Sent to each browser client once on connect and on change
+        packet = json.dumps({"channelNames": channel_names})
+        main_loop.call_soon_threadsafe(hub.set_state, "channelNames", packet)
+
+    def publish_state(key, value):
+        # Called from the Cortex thread only when device/quality values change
+        packet = json.dumps({key: value})
+        main_loop.call_soon_threadsafe(hub.set_state, key, packet)
 
     # Start Emotiv client if not already started
     if emotiv_client is None:
-        emotiv_client = EmotivEEGClient(data_callback=send_to_browser)
+        emotiv_client = EmotivEEGClient(data_callback=push_sample, layout_callback=publish_channel_names,
+                                        state_callback=publish_state)
+        marker_sink.recorder = emotiv_client.recorder
         threading.Thread(target=emotiv_client.start, daemon=True).start()
-    else:
-        # Update the callback for existing client
-        emotiv_client.data_callback = send_to_browser
 
-    # Keep connection alive
-    try:
-        while True:
-            await asyncio.sleep(1)
-    except websockets.exceptions.ConnectionClosed:
-        print("[INFO] Browser WebSocket client disconnected")
-        connected_websockets.discard(websocket)
+    stream = None  # SampleRing, recreated when the channel count changes
+
+    def stream_stats():
+        return dict(sender_stats, **(stream.stats() if stream is not None else {}))
 
-# Helper function to send data to a specific client
-async def send_data_to_client(websocket, data_packet):
+    metrics = StreamMetrics(hub, emit_event, FS, extra=stream_stats).start()
+    reported_drops = 0
     try:
-        if websocket in connected_websockets:  # Check if still connected
-            await websocket.send(json.dumps(data_packet))
-    except websockets.exceptions.ConnectionClosed:
-        print("[INFO] WebSocket client disconnected during send")
-        connected_websockets.discard(websocket)
-    except Exception as e:
-        print(f"[ERROR] Failed to send data to WebSocket client: {e}")
-        connected_websockets.discard(websocket)
+        while True:
+            await asyncio.sleep(SEND_INTERVAL)
+
+            backlog = len(sample_ring)
+            sender_stats["backlog"] = backlog
+            if backlog > sender_stats["maxBacklog"]:
+                sender_stats["maxBacklog"] = backlog
+            if not backlog:
+                continue
+
+            # Drain only what is there now; anything appended meanwhile goes in the next batch
+            queued = [sample_ring.popleft() for _ in range(backlog)]
+            batch = [packet for packet, _, _ in queued]
+            counters = [counter for _, counter, _ in queued]
+            if None in counters:
+                counters = None
+            try:
+                values = np.array([packet["values"] for packet in batch], dtype=np.float64)
+            except ValueError:
+                # Layout changed inside this batch; start a new stream with the next one
+                stream = None
+                hub.publish(json.dumps({"samples": batch}))
+                continue
+            times = np.fromiter((packet["time"] for packet in batch), dtype=np.float64, count=backlog)
+            if stream is None or stream.channels != values.shape[1]:
+                if stream is not None:
+                    print(f"[INFO] Stream: {stream.stats()}")
+                stream = SampleRing(values.shape[1], FS, emit=emit_event)
+
+            seq, written, clean = stream.append(times, values, counters)
+            if not clean:
+                # Short gaps filled / duplicates dropped: send what the ring holds
+                ring_times, values = stream.read(seq, written)
+                batch = [{"time": t, "values": v} for t, v in zip(ring_times.tolist(), values.tolist())]
+            hub.publish(json.dumps({"seq": seq, "samples": batch}))
+            sender_stats["sent"] += backlog
+            sender_stats["batches"] += 1
+
+            # Filtering runs per sample on the Cortex thread; each queued sample carries its own time
+            filter_secs = sum(secs for _, _, secs in queued)
+            metrics.record_block(backlog, written, filter_secs, times)
+
+            if sender_stats["dropped"] != reported_drops:
+                print(f"[WARN] Sample ring full; dropped {sender_stats['dropped'] - reported_drops} EEG packets.")
+                reported_drops = sender_stats["dropped"]
+    finally:
+        metrics.stop()
 
 
 # === Start WebSocket Server ===
@@ -853,15 +938,22 @@ def main():
     print("Starting Emotiv EEG WebSocket server at ws://localhost:8765")
 
     async def start():
-        server = await websockets.serve(emotiv_to_websocket, "localhost", 8765)
+        hub = AcquisitionHub(emotiv_sender, queue_size=CLIENT_QUEUE_SIZE, overflow_policy=CLIENT_OVERFLOW_POLICY,
+                             on_message=handle_client_message)
+        server = await websockets.serve(hub.serve_client, "localhost", 8765)
         print("READY")
         try:
             emit_event("server-ready")
         except Exception:
             pass
-        await server.wait_closed()
+        profiler.start_from_env("BOGGLE_PROFILE", seconds=True)
+        memory = MemoryMonitor(emit_event).start()  # BOGGLE_MEMORY=<seconds>, see memory_monitor.py
+        try:
+            await server.wait_closed()
+        finally:
+            memory.stop()
 
     asyncio.run(start())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
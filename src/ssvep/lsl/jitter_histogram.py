@@ -0,0 +1,163 @@
+"""Fixed-bin interval histogram (HDR-style) for sample and send timing jitter.
+
+Intervals are counted in whole microseconds in log-linear buckets: values below
+2**SUB_BUCKET_BITS get one bucket each, and every power of two above that is
+split into 2**(SUB_BUCKET_BITS - 1) equal buckets, so any value is known to
+within about 1 / 2**(SUB_BUCKET_BITS - 1) of itself (3 % with the default 5 bits)
+from 1 us up to max_secs. Values above max_secs land in the last bucket; the
+exact maximum is kept separately.
+
+All storage is allocated up front: recording a value is a few integer
+operations on a fixed counts array (record), and recording a block of sample
+timestamps reuses scratch arrays that only grow when a larger block arrives
+(record_times). Percentiles are read from the counts:
+  summary()        since the histogram was created (e.g. dumped at shutdown)
+  take_interval()  since the previous take_interval() (e.g. the metrics event)
+"""
+
+import numpy as np
+
+SUB_BUCKET_BITS = 5
+DEFAULT_MAX_SECS = 60.0
+SUMMARY_PERCENTILES = {"p50Ms": 50, "p90Ms": 90, "p99Ms": 99, "p999Ms": 99.9}
+
+
+class JitterHistogram:
+    def __init__(self, max_secs=DEFAULT_MAX_SECS, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.bits = sub_bucket_bits
+        self.half = 1 << (sub_bucket_bits - 1)
+        self.max_us = int(max_secs * 1e6)
+        self.counts = np.zeros(self._index(self.max_us) + 1, dtype=np.int64)
+        self.total = 0
+        self.max_us_seen = 0
+        self.sum_us = 0
+
+        # Interval bookkeeping (take_interval)
+        self._reported = np.zeros_like(self.counts)
+        self._delta = np.zeros_like(self.counts)
+        self._reported_total = 0
+        self._reported_sum = 0
+        self._interval_max = 0
+
+        # Scratch for record_times
+        self._diffs = np.empty(0, dtype=np.float64)
+        self._us = np.empty(0, dtype=np.int64)
+        self._shift = np.empty(0, dtype=np.int64)
+        self._mantissa = np.empty(0, dtype=np.float64)
+        self._exponent = np.empty(0, dtype=np.int32)
+        self._last_time = None
+
+        # Lower bound and width of every bucket, in microseconds
+        index = np.arange(len(self.counts))
+        shift = np.maximum((index - 2 * self.half) // self.half + 1, 0)
+        self.bucket_low = (index - shift * self.half) << shift
+        self.bucket_width = np.ones_like(index) << shift
+
+    def _index(self, us):
+        shift = max(us.bit_length() - self.bits, 0)
+        return shift * self.half + (us >> shift)
+
+    def record(self, seconds):
+        """Count one interval."""
+        us = int(seconds * 1e6)
+        if us < 0:
+            us = 0
+        if us > self.max_us_seen:
+            self.max_us_seen = us
+        if us > self._interval_max:
+            self._interval_max = us
+        self.sum_us += us
+        self.total += 1
+        self.counts[self._index(min(us, self.max_us))] += 1
+
+    def record_times(self, times):
+        """Count the intervals between consecutive timestamps, continuing from the previous call's last one."""
+        n = len(times)
+        if not n:
+            return
+        if len(self._diffs) < n:
+            self._diffs = np.empty(n, dtype=np.float64)
+            self._us = np.empty(n, dtype=np.int64)
+            self._shift = np.empty(n, dtype=np.int64)
+            self._mantissa = np.empty(n, dtype=np.float64)
+            self._exponent = np.empty(n, dtype=np.int32)
+
+        first = 0 if self._last_time is not None else 1
+        self._last_time, previous = float(times[-1]), self._last_time
+        count = n - first
+        if not count:
+            return
+        diffs, us, shift = self._diffs[:count], self._us[:count], self._shift[:count]
+        if first == 0:
+            diffs[0] = times[0] - previous
+            np.subtract(times[1:], times[:-1], out=diffs[1:])
+        else:
+            np.subtract(times[1:], times[:-1], out=diffs)
+
+        np.multiply(diffs, 1e6, out=diffs)
+        np.maximum(diffs, 0, out=diffs)
+        np.copyto(us, diffs, casting="unsafe")
+        # Max and sum from the exact values; only the bucket index is capped at max_us
+        largest = int(us.max())
+        if largest > self.max_us_seen:
+            self.max_us_seen = largest
+        if largest > self._interval_max:
+            self._interval_max = largest
+        self.sum_us += int(us.sum())
+        self.total += count
+        np.minimum(diffs, self.max_us, out=diffs)
+        np.minimum(us, self.max_us, out=us)
+
+        # Bucket index = shift * half + (us >> shift), shift = max(bit_length(us) - bits, 0)
+        np.frexp(diffs, out=(self._mantissa[:count], self._exponent[:count]))
+        np.subtract(self._exponent[:count], self.bits, out=shift, casting="unsafe")
+        np.maximum(shift, 0, out=shift)
+        np.right_shift(us, shift, out=us)
+        np.multiply(shift, self.half, out=shift)
+        np.add(us, shift, out=us)
+        np.add.at(self.counts, us, 1)
+
+    def _summary(self, counts, total, sum_us, max_us):
+        if not total:
+            return {"count": 0}
+        cumulative = np.cumsum(counts)
+        summary = {"count": int(total), "meanMs": round(sum_us / total / 1e3, 4)}
+        for key, p in SUMMARY_PERCENTILES.items():
+            i = int(np.searchsorted(cumulative, total * p / 100.0))
+            # Middle of the bucket, never above the largest value seen
+            value = min(int(self.bucket_low[i]) + int(self.bucket_width[i]) / 2.0, max_us)
+            summary[key] = round(value / 1e3, 4)
+        summary["maxMs"] = round(max_us / 1e3, 4)
+        return summary
+
+    def summary(self):
+        """Count, mean, percentiles and max (ms) of everything recorded."""
+        return self._summary(self.counts, self.total, self.sum_us, self.max_us_seen)
+
+    def take_interval(self, into=None):
+        """Summary of what was recorded since the previous call; the new counts are also added to `into`."""
+        np.subtract(self.counts, self._reported, out=self._delta)
+        total = self.total - self._reported_total
+        summary = self._summary(self._delta, total, self.sum_us - self._reported_sum, self._interval_max)
+        if into is not None and total:
+            into.merge(self._delta, total, self.sum_us - self._reported_sum, self._interval_max)
+        self._reported[:] = self.counts
+        self._reported_total = self.total
+        self._reported_sum = self.sum_us
+        self._interval_max = 0
+        return summary
+
+    def merge(self, counts, total, sum_us, max_us):
+        """Add another histogram's counts (same bucket layout)."""
+        self.counts += counts
+        self.total += total
+        self.sum_us += sum_us
+        if max_us > self.max_us_seen:
+            self.max_us_seen = max_us
+        if max_us > self._interval_max:
+            self._interval_max = max_us
+
+    def buckets(self):
+        """Non-empty buckets as [lowMs, highMs, count], for dumping the whole distribution."""
+        low, width = self.bucket_low.tolist(), self.bucket_width.tolist()
+        return [[low[i] / 1e3, (low[i] + width[i]) / 1e3, int(self.counts[i])] for i in np.flatnonzero(self.counts)]
@@ -0,0 +1,477 @@
+"""Multi-client load generator for the acquisition servers.
+
+    python load_test.py [--url ws://localhost:8765] [--clients 4] [--slow 1] [--slow-rate 5]
+                        [--rate 0] [--duration SECS] [--until-overflow] [--queue-size 1024]
+                        [--pid PID | --spawn "synthetic_websocket_server.py ..."] [--json out.json]
+
+Opens --clients concurrent WebSocket clients against a running server (or one
+started with --spawn, e.g. the synthetic or replay server). Fast clients read
+packets as quickly as they arrive, or at most --rate packets per second; the
+last --slow clients read at --slow-rate packets per second, so the server's
+per-client queue for them grows by (server packet rate - slow rate) packets per
+second while the other clients keep streaming.
+
+The queue only overflows (exercising the overflow policy, see acquisition_hub.py)
+once --queue-size packets are pending, which at the servers' defaults takes about
+a minute. Without --duration the run therefore measures the server's packet rate
+for WARMUP_SECS and then lasts long enough for a slow client to fill its queue
+(FILL_MARGIN x the fill time, at most MAX_DURATION); --until-overflow ends it as
+soon as every slow client has overflowed. A client overflowed when seq shows lost
+samples (drop-oldest) or the server closed it with 1013 (disconnect); the report
+warns when no slow client did.
+
+Reported per client:
+  packetsPerSec, samplesPerSec   what the client actually consumed
+  lagMs (p50/p95/max)            arrival time of a packet minus the first arrival of the
+                                 same packet at any client, i.e. how far the client is
+                                 behind the fastest one (sample timestamps are on the
+                                 device clock, so they cannot be compared with ours)
+  samplesLost, lossRatio         from seq continuity: each packet should start at the
+                                 previous packet's seq + its sample count
+  outOfOrder                     packets whose seq went backwards
+  disconnected                   whether the server closed the connection
+  overflowed                     whether the server's queue for the client overflowed
+and for the server process (--pid, or the one started with --spawn) the CPU use
+from /proc/<pid>/stat, as mean and peak percent of one core over
+CPU_SAMPLE_INTERVAL. Linux only for the CPU figures.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import shlex
+import socket
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+import websockets
+
+from acquisition_hub import CLIENT_SEND_BUFFER, CLOSE_SLOW_CLIENT, DEFAULT_QUEUE_SIZE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ---------- CONFIGS ----------
+DEFAULT_URL = "ws://localhost:8765"
+DEFAULT_CLIENTS = 4
+DEFAULT_SLOW_CLIENTS = 1
+DEFAULT_SLOW_RATE = 5.0          # Packets per second a slow client reads
+DEFAULT_DURATION = 30.0          # Seconds, when no slow client has to overflow
+WARMUP_SECS = 3.0                # Seconds spent measuring the server's packet rate before deriving the duration
+FILL_MARGIN = 1.5                # Derived duration = warm-up + FILL_MARGIN x the slow clients' queue fill time
+MAX_DURATION = 600.0             # Seconds, cap for the derived duration and for --until-overflow
+CPU_SAMPLE_INTERVAL = 1.0        # Seconds between /proc/<pid>/stat reads
+SERVER_START_TIMEOUT = 30.0      # Seconds to wait for server-ready from --spawn
+FIRST_ARRIVALS_KEPT = 100000     # seq -> first arrival entries kept for the lag figures
+SLOW_RECEIVE_BUFFER = 4096       # Bytes, SO_RCVBUF of a slow client so unread packets back up into the server queue
+# Bytes a slow client's unread packets can occupy between the server queue and the client: the kernel
+# doubles both socket buffers, plus the WebSocket library's 32 KiB write limit
+TRANSPORT_BUFFER_BYTES = 2 * CLIENT_SEND_BUFFER + 2 * SLOW_RECEIVE_BUFFER + 32 * 1024
+DRAIN_TIMEOUT = 10.0             # Seconds a slow client may spend reading its backlog after the run
+# ---------- CONFIGS ----------
+
+
+class ClientStats:
+    def __init__(self, index, rate):
+        self.index = index
+        self.rate = rate
+        self.packets = 0
+        self.samples = 0
+        self.bytes = 0
+        self.samples_lost = 0
+        self.out_of_order = 0
+        self.unsequenced = 0
+        self.expected_seq = None
+        self.drained = 0
+        self.lags = []
+        self.disconnected = False
+        self.close_code = None
+        self.error = None
+        self.connected_at = None
+        self.finished_at = None
+
+    def track_seq(self, seq, count):
+        """Count lost and out-of-order samples from seq continuity."""
+        if self.expected_seq is not None:
+            if seq > self.expected_seq:
+                self.samples_lost += seq - self.expected_seq
+            elif seq < self.expected_seq:
+                self.out_of_order += 1
+        self.expected_seq = seq + count
+
+    def backlog_packets(self, arrivals):
+        """Packets sent to other clients that this client has not read yet (queued for it, or dropped)."""
+        if self.expected_seq is None or not self.packets:
+            return 0.0
+        return (arrivals.newest_end - self.expected_seq) / (self.samples / self.packets)
+
+    @property
+    def overflowed(self):
+        """The server dropped packets for this client (drop-oldest) or closed it as too slow (disconnect)."""
+        return self.samples_lost > 0 or self.close_code == CLOSE_SLOW_CLIENT[0]
+
+    def report(self):
+        elapsed = (self.finished_at or time.time()) - (self.connected_at or time.time())
+        lags = np.asarray(self.lags) * 1e3
+        received = self.samples + self.drained + self.samples_lost
+        return {
+            "client": self.index,
+            "rateLimit": self.rate or None,
+            "packets": self.packets,
+            "samples": self.samples,
+            "packetsPerSec": round(self.packets / elapsed, 2) if elapsed > 0 else None,
+            "samplesPerSec": round(self.samples / elapsed, 1) if elapsed > 0 else None,
+            "kbPerSec": round(self.bytes / elapsed / 1024, 1) if elapsed > 0 else None,
+            "lagMs": {
+                "p50": round(float(np.percentile(lags, 50)), 2),
+                "p95": round(float(np.percentile(lags, 95)), 2),
+                "max": round(float(lags.max()), 2),
+            } if len(lags) else None,
+            "samplesLost": self.samples_lost,
+            "drainedSamples": self.drained,
+            "lossRatio": round(self.samples_lost / received, 4) if received else 0.0,
+            "outOfOrder": self.out_of_order,
+            "unsequenced": self.unsequenced,
+            "disconnected": self.disconnected,
+            "closeCode": self.close_code,
+            "overflowed": self.overflowed,
+            "error": self.error,
+        }
+
+
+class Deadline:
+    """End time shared by the clients; run() moves it once the duration is known or every slow client overflowed."""
+
+    def __init__(self, at):
+        self.at = at
+
+    def remaining(self):
+        return self.at - time.time()
+
+
+class FirstArrivals:
+    """seq -> time the first client received that packet (bounded)."""
+
+    def __init__(self, maxlen=FIRST_ARRIVALS_KEPT):
+        self.maxlen = maxlen
+        self.newest_end = 0   # seq after the newest packet any client received
+        self._times = collections.OrderedDict()
+
+    def lag(self, seq, count, arrived):
+        self.newest_end = max(self.newest_end, seq + count)
+        first = self._times.get(seq)
+        if first is None:
+            self._times[seq] = arrived
+            if len(self._times) > self.maxlen:
+                self._times.popitem(last=False)
+            return 0.0
+        return arrived - first
+
+
+async def open_throttled_socket(url):
+    """TCP socket to the server with a small receive buffer (set before connecting, so the window stays small).
+
+    Otherwise megabytes of unread packets wait in the kernel buffers instead of the server's queue.
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or (443 if parts.scheme == "wss" else 80)
+    family, kind, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+    sock = socket.socket(family, kind, proto)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SLOW_RECEIVE_BUFFER)
+    sock.setblocking(False)
+    try:
+        await asyncio.get_running_loop().sock_connect(sock, address)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+async def drain_backlog(websocket, stats, newest_end):
+    """Read a slow client's backlog at full speed after the run, up to seq newest_end.
+
+    The packets the server dropped from its queue sit behind everything already
+    buffered for the client, so only reading through the backlog shows the seq gap.
+    Drained samples count towards samplesLost/lossRatio but not the rates or lags.
+    """
+    drain_until = time.time() + DRAIN_TIMEOUT
+    while stats.expected_seq is None or stats.expected_seq < newest_end:
+        try:
+            message = await asyncio.wait_for(websocket.recv(), timeout=max(0.001, drain_until - time.time()))
+        except asyncio.TimeoutError:
+            print(f"[WARN] client {stats.index}: backlog not drained within {DRAIN_TIMEOUT:g}s; samplesLost may be low.")
+            return
+        data = json.loads(message)
+        samples = data.get("samples") if isinstance(data, dict) else None
+        if not samples or data.get("seq") is None:
+            continue
+        stats.drained += len(samples)
+        stats.track_seq(data["seq"], len(samples))
+
+
+async def run_client(url, stats, arrivals, deadline):
+    interval = 1.0 / stats.rate if stats.rate else 0.0
+    next_read = time.time()
+    try:
+        # Throttled clients also keep at most one frame queued in the client library and skip compression,
+        # so buffered bytes match packets; without keepalive pings, since their pongs wait behind the backlog
+        options = {"sock": await open_throttled_socket(url), "max_queue": 1, "compression": None,
+                   "ping_interval": None} if interval else {}
+        # A slow client's close handshake waits behind its unread packets, so keep it short
+        async with websockets.connect(url, max_size=None, close_timeout=1, **options) as websocket:
+            stats.connected_at = time.time()
+            while True:
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    break
+                if interval:
+                    # Throttled reader: the server's queue for this client fills while we sleep
+                    await asyncio.sleep(max(0.0, min(next_read - time.time(), remaining)))
+                    next_read = max(next_read + interval, time.time())
+                try:
+                    message = await asyncio.wait_for(websocket.recv(), timeout=max(0.001, deadline.remaining()))
+                except asyncio.TimeoutError:
+                    break
+                arrived = time.time()
+                data = json.loads(message)
+                samples = data.get("samples") if isinstance(data, dict) else None
+                if not samples:
+                    continue  # State packets (channel names, device info)
+
+                count = len(samples)
+                stats.packets += 1
+                stats.samples += count
+                stats.bytes += len(message)
+                seq = data.get("seq")
+                if seq is None:
+                    stats.unsequenced += 1
+                    continue
+                stats.track_seq(seq, count)
+                stats.lags.append(arrivals.lag(seq, count, arrived))
+            stats.finished_at = time.time()
+            if interval:
+                await drain_backlog(websocket, stats, arrivals.newest_end)
+    except websockets.exceptions.ConnectionClosed as e:
+        stats.disconnected = True
+        stats.close_code = e.rcvd.code if e.rcvd is not None else None
+    except OSError as e:
+        stats.error = str(e)
+    if stats.finished_at is None:
+        stats.finished_at = time.time()
+
+
+class CpuSampler:
+    """CPU use of one process from /proc/<pid>/stat (utime + stime)."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.samples = []
+        self._first = self._last = None
+
+    def _cpu_secs(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            # The command name may contain spaces; the fields after it are fixed
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    async def run(self, deadline):
+        try:
+            last_cpu, last_time = self._cpu_secs(), time.time()
+            self._first = (last_cpu, last_time)
+            while deadline.remaining() > 0:
+                await asyncio.sleep(min(CPU_SAMPLE_INTERVAL, max(0.0, deadline.remaining())))
+                cpu, now = self._cpu_secs(), time.time()
+                if now > last_time:
+                    self.samples.append((cpu - last_cpu) / (now - last_time) * 100)
+                last_cpu, last_time = cpu, now
+                self._last = (last_cpu, last_time)
+        except (OSError, IndexError, ValueError) as e:
+            print(f"[WARN] Cannot read CPU use of process {self.pid}: {e}")
+
+    def report(self):
+        if self._last is None:
+            return None
+        (first_cpu, first_time), (last_cpu, last_time) = self._first, self._last
+        return {
+            "pid": self.pid,
+            "meanPercent": round((last_cpu - first_cpu) / (last_time - first_time) * 100, 1),
+            "peakPercent": round(max(self.samples), 1),
+            "cpuSecs": round(last_cpu - first_cpu, 3),
+        }
+
+
+async def spawn_server(command):
+    """Start a server script from this folder and wait for its server-ready event. Returns (process, events)."""
+    argv = shlex.split(command)
+    if argv and argv[0].endswith(".py"):
+        argv = [sys.executable, "-u", os.path.join(BASE_DIR, argv[0])] + argv[1:]
+    process = await asyncio.create_subprocess_exec(*argv, cwd=BASE_DIR, stdout=asyncio.subprocess.PIPE)
+    events = {"metrics": None}
+    ready = asyncio.get_running_loop().create_future()
+
+    async def read_events():
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                if not ready.done():
+                    ready.set_exception(RuntimeError(f"Server exited with code {await process.wait()}."))
+                return
+            try:
+                params = json.loads(line).get("params", {})
+            except ValueError:
+                continue  # READY and log lines
+            if params.get("type") == "server-ready" and not ready.done():
+                ready.set_result(True)
+            elif params.get("type") == "metrics":
+                events["metrics"] = params
+
+    events["reader"] = asyncio.get_running_loop().create_task(read_events())
+    await asyncio.wait_for(ready, SERVER_START_TIMEOUT)
+    return process, events
+
+
+def overflow_backlog(args, stats):
+    """Packets a slow client must fall behind before its server queue overflows (queue + transport buffers)."""
+    packet_bytes = stats.bytes / stats.packets if stats.packets else 1024
+    return args.queue_size + TRANSPORT_BUFFER_BYTES / packet_bytes
+
+
+def derive_duration(args, packet_rate, backlog):
+    """Seconds a run needs for a slow client to fall `backlog` packets behind, or None if it never will."""
+    fill_rate = packet_rate - args.slow_rate
+    if fill_rate <= 0:
+        return None
+    return WARMUP_SECS + FILL_MARGIN * backlog / fill_rate
+
+
+async def control_duration(args, clients, arrivals, started, deadline):
+    """Set the deadline from the measured packet rate (no --duration) and end early with --until-overflow."""
+    slow_clients = clients[len(clients) - args.slow:] if args.slow else []
+    if not args.duration:
+        if not slow_clients:
+            deadline.at = started + DEFAULT_DURATION
+        else:
+            await asyncio.sleep(WARMUP_SECS)
+            # The fastest client sees (nearly) every packet the server sends
+            fastest = max(clients, key=lambda stats: stats.packets)
+            packet_rate = fastest.packets / max(time.time() - started, 1e-9)
+            backlog = overflow_backlog(args, fastest)
+            duration = derive_duration(args, packet_rate, backlog)
+            if duration is None:
+                print(f"[WARN] The server sends {packet_rate:.1f} packets/s, no more than --slow-rate "
+                      f"{args.slow_rate:g}: slow clients will not overflow. Running for {DEFAULT_DURATION:g}s.")
+                duration = DEFAULT_DURATION
+            else:
+                duration = min(duration, MAX_DURATION)
+                print(f"[INFO] The server sends {packet_rate:.1f} packets/s; a slow client fills its "
+                      f"{args.queue_size}-packet queue and socket buffers in "
+                      f"~{backlog / (packet_rate - args.slow_rate):.0f}s. Running for {duration:.0f}s.")
+            deadline.at = min(deadline.at, started + duration)
+    if not args.until_overflow or not slow_clients:
+        return
+    while deadline.remaining() > 0:
+        # Confirmed once the slow clients drain their backlog (see drain_backlog)
+        if all(stats.overflowed or stats.backlog_packets(arrivals) > overflow_backlog(args, stats)
+               for stats in slow_clients):
+            print(f"[INFO] Every slow client fell behind by more than its queue after {time.time() - started:.1f}s.")
+            deadline.at = time.time()
+            return
+        await asyncio.sleep(min(0.1, max(0.0, deadline.remaining())))
+
+
+async def run(args):
+    process, events = None, {}
+    pid = args.pid
+    if args.spawn:
+        process, events = await spawn_server(args.spawn)
+        pid = process.pid
+        print(f"[INFO] Server started (pid {pid}).")
+
+    try:
+        arrivals = FirstArrivals()
+        clients = []
+        for i in range(args.clients):
+            slow = i >= args.clients - args.slow
+            clients.append(ClientStats(i, args.slow_rate if slow else args.rate))
+        started = time.time()
+        deadline = Deadline(started + (args.duration or MAX_DURATION))
+        tasks = [run_client(args.url, stats, arrivals, deadline) for stats in clients]
+        cpu = CpuSampler(pid) if pid else None
+        if cpu is not None:
+            tasks.append(cpu.run(deadline))
+        tasks.append(control_duration(args, clients, arrivals, started, deadline))
+        duration = f"{args.duration:g}s" if args.duration else "a derived duration"
+        print(f"[INFO] {args.clients} clients ({args.slow} slow) against {args.url} for {duration}"
+              f"{' or until every slow client overflowed' if args.until_overflow else ''}")
+        await asyncio.gather(*tasks)
+        elapsed = time.time() - started
+    finally:
+        if process is not None:
+            process.terminate()
+            await process.wait()
+            events["reader"].cancel()
+
+    slow_clients = clients[len(clients) - args.slow:] if args.slow else []
+    return {
+        "url": args.url,
+        "durationSecs": round(elapsed, 3),
+        "queueSize": args.queue_size,
+        "slowClients": args.slow,
+        "slowClientsOverflowed": sum(stats.overflowed for stats in slow_clients),
+        "clients": [stats.report() for stats in clients],
+        "serverCpu": cpu.report() if cpu is not None else None,
+        "serverMetrics": events.get("metrics"),
+    }
+
+
+def print_report(report):
+    print(f"{'client':>6} {'rate':>6} {'pkt/s':>8} {'smp/s':>8} {'lag p50':>8} {'lag p95':>8} "
+          f"{'lag max':>8} {'lost':>7} {'loss %':>7} {'closed':>6} {'ovfl':>5}")
+    for c in report["clients"]:
+        lag = c["lagMs"] or {"p50": float("nan"), "p95": float("nan"), "max": float("nan")}
+        print(f"{c['client']:>6} {c['rateLimit'] or '-':>6} {c['packetsPerSec'] or 0:>8.1f} {c['samplesPerSec'] or 0:>8.1f} "
+              f"{lag['p50']:>8.1f} {lag['p95']:>8.1f} {lag['max']:>8.1f} {c['samplesLost']:>7} "
+              f"{c['lossRatio'] * 100:>7.2f} {'yes' if c['disconnected'] else 'no':>6} "
+              f"{'yes' if c['overflowed'] else 'no':>5}")
+        if c["error"]:
+            print(f"[WARN] client {c['client']}: {c['error']}")
+    if report["slowClients"] and not report["slowClientsOverflowed"]:
+        print(f"[WARN] No slow client overflowed its {report['queueSize']}-packet server queue, so the overflow "
+              f"policy was not exercised. Run longer, lower --slow-rate or use --until-overflow.")
+    cpu = report["serverCpu"]
+    if cpu is not None:
+        print(f"server cpu: mean {cpu['meanPercent']:.1f}% peak {cpu['peakPercent']:.1f}% "
+              f"({cpu['cpuSecs']:.2f}s over {report['durationSecs']:.1f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-client load test for the acquisition WebSocket servers")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS, help="Concurrent clients")
+    parser.add_argument("--slow", type=int, default=DEFAULT_SLOW_CLIENTS, help="How many of them are slow")
+    parser.add_argument("--slow-rate", type=float, default=DEFAULT_SLOW_RATE, help="Packets per second a slow client reads")
+    parser.add_argument("--rate", type=float, default=0.0, help="Packets per second the other clients read (0 = unlimited)")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Seconds (default: long enough for a slow client to overflow its queue, "
+                             f"or {DEFAULT_DURATION:g} without slow clients)")
+    parser.add_argument("--until-overflow", action="store_true",
+                        help="Stop as soon as every slow client has overflowed (--duration, if given, is the cap)")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="The server's CLIENT_QUEUE_SIZE, to derive the default duration")
+    parser.add_argument("--pid", type=int, default=None, help="Server process to measure CPU use of")
+    parser.add_argument("--spawn", default=None,
+                        help="Start this server script (and its arguments) from this folder, e.g. 'synthetic_websocket_server.py'")
+    parser.add_argument("--json", default=None, help="Write the report to this file")
+    args = parser.parse_args()
+    args.slow = max(0, min(args.slow, args.clients))
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Results written to {args.json}")
@@ -317,11 +317,20 @@ import asyncio
 import websockets
 import json
 import gc  # Garbage collector interface
-from pylsl import StreamInlet, resolve_stream
-from scipy.signal import butter, lfilter, iirnotch
+import numpy as np
+from pylsl import StreamInlet, resolve_stream, cf_float32, cf_double64, local_clock, proc_dejitter
+from scipy.signal import lfilter
 
 import os
 import sys
+from acquisition_hub import AcquisitionHub
+from alloc_probe import create_probe
+from markers import MarkerSink
+from memory_monitor import MemoryMonitor
+from raw_recorder import RawRecorder, session_filename
+from sample_blocks import SampleBlockEncoder, design_filters, filter_settings, per_sample_filter_matrix
+from sample_ring import SampleRing, publish_ring_rows
+from stream_metrics import StreamMetrics
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Adding the sibling folder fbcca-py to sys.path so it can import fbcca_config_service.fbcca_config.
@@ -331,6 +340,7 @@ try:
         sys.path.insert(0, FBCCA_DIR)
 
     from fbcca_config_service import fbcca_config
+    from profiling import Profiler
 except Exception as e:
     print(f"[ERROR] Failed to import fbcca_config_service.fbcca_config: {e}")
     # Stop here so the rest of the script doesn't run with missing config
@@ -341,8 +351,12 @@ CHANNELS = fbcca_config["channels"]              # Default number of EEG channel
 SAMPLING_RATE = fbcca_config["samplingRate"]
 
 SAMPLES_PER_SECOND = 20000     # Adjust as needed
+CHUNK_SIZE = 32                # Max samples pulled from the inlet (and sent as one packet) per loop iteration
 APPLY_FILTERING = True         # Set to True/False to enable/disable bandpass and notch filters
-SAVE_RAW_DATA = False          # Set to True/False to enable/disable saving raw data to JSON files
+FILTER_SETTINGS = filter_settings(APPLY_FILTERING, lowcut=2.0, highcut=100.0, order=10, notch_freq=50.0)
+SAVE_RAW_DATA = False          # Set to True/False to enable/disable recording raw data (raw_recorder.py)
+CLIENT_QUEUE_SIZE = 1024       # Max packets buffered per WebSocket client before the overflow policy applies
+CLIENT_OVERFLOW_POLICY = "drop-oldest"  # "drop-oldest" or "disconnect" for clients that fall behind
 # -----------------------------
 
 
@@ -373,93 +387,83 @@ def initialize_lsl_inlet():
     if not streams:
         raise RuntimeError("No suitable EEG LSL stream found (neither Unicorn by name nor type='EEG').")
    
-    inlet = StreamInlet(streams[0])
+    # Dejittered timestamps (still in the sender's clock) let the SampleRing tell lost samples from jitter
+    inlet = StreamInlet(streams[0], processing_flags=proc_dejitter)
     print("Connected to EEG stream.")
     return inlet
 
-# Function to save raw EEG sample to JSON in the format:
-# { "eegData": [ [], [], ... ] }
-RAW_JSON_FILENAME = "datasets/RAW-eeg-data.json"
-
-# Buffer for raw samples
-RAW_SAMPLE_BUFFER = []
-RAW_SAMPLE_BUFFER_SIZE = 1000
-
-def save_raw_sample_to_json(sample, filename=RAW_JSON_FILENAME):
-    """
-    Buffer raw EEG samples and write to JSON file once every 1000 samples.
-    """
-    global RAW_SAMPLE_BUFFER
-    RAW_SAMPLE_BUFFER.append(sample)
-    if len(RAW_SAMPLE_BUFFER) >= RAW_SAMPLE_BUFFER_SIZE:
-        try:
-            folder = os.path.dirname(filename)
-            if folder and not os.path.exists(folder):
-                os.makedirs(folder, exist_ok=True)
-            try:
-                with open(filename, "r") as f:
-                    file_data = json.load(f)
-                eeg_data = file_data.get("eegData", [])
-            except (FileNotFoundError, json.JSONDecodeError):
-                eeg_data = [[] for _ in range(len(sample))]
-            # Append buffered samples
-            for buffered_sample in RAW_SAMPLE_BUFFER:
-                for i, value in enumerate(buffered_sample):
-                    eeg_data[i].append(value)
-            with open(filename, "w") as f:
-                json.dump({"eegData": eeg_data}, f, indent=2)
-            RAW_SAMPLE_BUFFER = []
-        except Exception as e:
-            print(f"Error saving raw EEG samples: {e}")
-
-# Bandpass filter
-def butter_bandpass(lowcut, highcut, fs, order=10):
-    nyquist = 0.5 * fs
-    low = lowcut / nyquist
-    high = highcut / nyquist
-    return butter(order, [low, high], btype='band')
-
-# Notch filter
-def notch_filter(freq, fs, quality=30):
-    nyquist = 0.5 * fs
-    freq = freq / nyquist
-    return iirnotch(freq, quality)
+# Raw recordings are written append-only on a background thread (see raw_recorder.py);
+# convert with `python raw_recorder.py to-json <file> <out.json>` for the { "eegData": [...] } layout.
+RAW_RECORDING_PREFIX = "datasets/RAW-eeg-data"
+RAW_RECORDING_COMPRESSION = None   # None (raw, memory-mapped), "zlib" or "lzma" (chunk-compressed, see compressed_recording.py)
 
 # Apply filter
 def apply_filter(data, b, a):
     return lfilter(b, a, data)
 
-# Fetch EEG sample from LSL
-def fetch_eeg_sample(inlet, b_bandpass, a_bandpass, b_notch, a_notch):
-    sample, timestamp = inlet.pull_sample(timeout=0.0)
-    if sample:
-        # Save raw sample before filtering
-        if SAVE_RAW_DATA:
-            save_raw_sample_to_json(sample)
-
-        if APPLY_FILTERING:
-            filtered_sample = apply_filter(sample[:CHANNELS], b_bandpass, a_bandpass)
-            filtered_sample = apply_filter(filtered_sample, b_notch, a_notch)        
-            return {"time": timestamp, "values": filtered_sample.tolist()}
-        else:
-            return {"time": timestamp, "values": sample[:CHANNELS]}
-    return None
-
-# Main streaming function
-async def lsl_to_websocket(websocket):
-    inlet = initialize_lsl_inlet()
+# Preallocated receive buffer matching the inlet's channel format (None if pylsl can't fill it in place)
+def create_receive_buffer(inlet):
+    info = inlet.info()
+    dtype = {cf_float32: np.float32, cf_double64: np.float64}.get(info.channel_format())
+    if dtype is None:
+        return None
+    return np.zeros((CHUNK_SIZE, info.channel_count()), dtype=dtype)
 
-    fs = SAMPLING_RATE
-    lowcut = 2.0
-    highcut = 100.0
-    notch_freq = 50.0
+# Fetch up to max_samples EEG samples from LSL as (timestamps, raw block view)
+def fetch_eeg_chunk(inlet, receive_buffer, max_samples):
+    if receive_buffer is not None:
+        _, timestamps = inlet.pull_chunk(timeout=0.0, max_samples=max_samples, dest_obj=receive_buffer)
+        return timestamps, receive_buffer[:len(timestamps)]
+    samples, timestamps = inlet.pull_chunk(timeout=0.0, max_samples=max_samples)
+    return timestamps, np.asarray(samples, dtype=np.float64).reshape(len(timestamps), -1)
+
+# Markers from the app, stamped in the stream's clock once the inlet is open (see markers.py)
+marker_sink = MarkerSink(local_clock)
+
+# cProfile of the event loop on request: BOGGLE_PROFILE=<seconds> or {"profile": {"seconds": T}} (see profiling.py)
+profiler = Profiler("lsl_server", announce=emit_event)
+
+
+def handle_client_message(message):
+    """Hub on_message: stimulus markers (markers.py), otherwise profiling requests."""
+    if marker_sink.handle_message(message) is None:
+        profiler.handle_message(message)
 
-    b_bandpass, a_bandpass = butter_bandpass(lowcut, highcut, fs)
-    b_notch, a_notch = notch_filter(notch_freq, fs)
+# Main acquisition loop. Runs once per process and publishes to every connected client through the hub.
+async def lsl_producer(hub):
+    # resolve_stream blocks until a stream appears, so keep it off the event loop
+    inlet = await asyncio.to_thread(initialize_lsl_inlet)
+
+    # Sample timestamps are in the sender's clock; stamp markers in the same clock
+    time_correction = await asyncio.to_thread(inlet.time_correction)
+    marker_sink.clock = lambda: local_clock() - time_correction
+
+    fs = SAMPLING_RATE
+    (b_bandpass, a_bandpass), (b_notch, a_notch) = design_filters(FILTER_SETTINGS, fs)
+
+    # Everything the loop touches is allocated once here
+    channels = min(CHANNELS, inlet.info().channel_count())
+    recorder = None
+    if SAVE_RAW_DATA:
+        recorder = RawRecorder(session_filename(RAW_RECORDING_PREFIX), inlet.info().channel_count(), fs,
+                               metadata={"source": "lsl", "stream": inlet.info().name(), "filter": FILTER_SETTINGS},
+                               compression=RAW_RECORDING_COMPRESSION)
+        marker_sink.recorder = recorder
+    receive_buffer = create_receive_buffer(inlet)
+    encoder = SampleBlockEncoder(channels, CHUNK_SIZE)
+    ring = SampleRing(channels, fs, trust_timestamps=True, emit=emit_event)
+    metrics = StreamMetrics(hub, emit_event, fs, extra=ring.stats)
+    # Bandpass + notch over each sample's channel vector, folded into one matrix
+    filter_matrix_t = per_sample_filter_matrix(channels, (b_bandpass, a_bandpass), (b_notch, a_notch)).T
+
+    # Startup objects (modules, filters, buffers) never become garbage: move them out of the collector's way
+    gc.collect()
+    gc.freeze()
+    probe = create_probe(emit_event)
+    metrics.start()
 
     count = 0
     start_time = time.time()
-    gc_timer = time.time()  # For periodic GC
 
     # Track first data arrival to emit headset-connected only once
     first_data_sent = False
@@ -473,42 +477,71 @@ async def lsl_to_websocket(websocket):
                 start_time = now
                 count = 0
 
-            # Fetch and send up to SAMPLES_PER_SECOND
+            # Fetch and publish up to SAMPLES_PER_SECOND
             if count < SAMPLES_PER_SECOND:
-                sample = fetch_eeg_sample(inlet, b_bandpass, a_bandpass, b_notch, a_notch)
-                if sample:
+                timestamps, raw_block = fetch_eeg_chunk(inlet, receive_buffer, min(CHUNK_SIZE, SAMPLES_PER_SECOND - count))
+                n = len(timestamps)
+                if n:
+                    # Record raw samples before filtering
+                    if recorder is not None:
+                        recorder.write_block(timestamps, raw_block)
+
+                    encoder.times[:n] = timestamps
+                    filter_started = time.perf_counter()
+                    if APPLY_FILTERING:
+                        np.matmul(raw_block[:, :channels], filter_matrix_t, out=encoder.values[:n])
+                    else:
+                        encoder.values[:n] = raw_block[:, :channels]
+                    filter_secs = time.perf_counter() - filter_started
+
                     # Emit headset-connected once when data begins flowing
                     if not first_data_sent:
                         first_data_sent = True
                         emit_event("headset-connected")
-                    await websocket.send(json.dumps(sample))
-                    count += 1
-
-            # Run garbage collection every 5 seconds
-            if now - gc_timer >= 5:
-                gc.collect()
-                gc_timer = now
+                    # Gap/drift check; short gaps come back filled and are published from the ring
+                    seq, written, clean = ring.append(encoder.times[:n], encoder.values[:n])
+                    if clean:
+                        hub.publish(encoder.encode(n, seq))
+                    else:
+                        publish_ring_rows(hub, ring, encoder, seq, written)
+                    metrics.record_block(n, written, filter_secs, timestamps)
+                    count += n
+
+                if probe is not None:
+                    probe.tick(n)
 
             await asyncio.sleep(0.0001)
 
-    except websockets.exceptions.ConnectionClosed:
-        print("WebSocket closed")
-        emit_event("headset-disconnected")
     except Exception as e:
         print(f"Error: {e}")
         emit_event("error", message=str(e))
     finally:
+        metrics.stop()
+        marker_sink.recorder = None
+        if recorder is not None:
+            recorder.close()
+        print(f"[INFO] Stream: {ring.stats()}")
         del inlet  # Help GC by removing references
+        gc.unfreeze()
         gc.collect()
+        if probe is not None:
+            probe.stop()
         if first_data_sent:
             # If we had data and are exiting, ensure disconnect is signaled
             emit_event("headset-disconnected")
 
 # Start the WebSocket server
 async def main():
-    async with websockets.serve(lsl_to_websocket, "localhost", 8765):
+    hub = AcquisitionHub(lsl_producer, queue_size=CLIENT_QUEUE_SIZE, overflow_policy=CLIENT_OVERFLOW_POLICY,
+                         on_message=handle_client_message)
+    async with websockets.serve(hub.serve_client, "localhost", 8765):
         print("READY")
         emit_event("server-ready")
-        await asyncio.Future()
+        profiler.start_from_env("BOGGLE_PROFILE", seconds=True)
+        memory = MemoryMonitor(emit_event).start()  # BOGGLE_MEMORY=<seconds>, see memory_monitor.py
+        try:
+            await asyncio.Future()
+        finally:
+            memory.stop()
 
 asyncio.run(main())
\ No newline at end of file
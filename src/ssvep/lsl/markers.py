@@ -0,0 +1,48 @@
+"""Stimulus markers sent by the app over the EEG WebSocket connection.
+
+The app sends
+    {"marker": {"type": "gaze-start", "scenarioId": 3, "buttonId": "readBtn", ...}}
+at gaze start/end, scenario changes and decisions (see sendMarker in
+eeg-pipeline.js). The server stamps each marker with its acquisition clock, the
+same clock as the sample timestamps, so markers line up with the samples without
+trusting the app's clock (kept as "clientTime"), and stores it in the active
+recording's markers.jsonl (see recording.read_markers / MarkerIndex).
+"""
+
+import json
+
+
+class MarkerSink:
+    """Hub on_message handler that stamps markers and writes them to the current recorder.
+
+    `clock` returns the current time in the acquisition clock. `recorder` is the
+    RawRecorder to store into; producers set it when they open one (None when not
+    recording, in which case markers are only counted).
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.recorder = None
+        self.received = 0
+        self.stored = 0
+        self.last_marker = None
+
+    def handle_message(self, message):
+        """Parse a client message; stamp and store it if it is a marker. Returns the stamped marker or None."""
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            return None
+        marker = data.get("marker") if isinstance(data, dict) else None
+        if not isinstance(marker, dict) or not marker.get("type"):
+            return None
+
+        stamped = dict(marker, time=self.clock())
+        self.received += 1
+        self.last_marker = stamped
+
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write_marker(stamped)
+            self.stored += 1
+        return stamped
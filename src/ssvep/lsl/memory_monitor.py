@@ -0,0 +1,191 @@
+"""Optional memory growth monitor for the long-running servers (tracemalloc).
+
+Enabled with BOGGLE_MEMORY=<seconds between snapshots> (off by default:
+tracing every allocation costs CPU and memory). Every interval the monitor
+takes a tracemalloc snapshot, compares it with the previous one and emits a
+"memory" event:
+  rssMb             resident set size of the process (None where it cannot be read)
+  tracedMb          memory allocated by Python since the monitor started, and its peak (tracedPeakMb)
+  growthMb          change of tracedMb since the previous event
+  top               the TOP_SITES allocation sites that grew the most:
+                    {site: "file.py:line", growthKb, countGrowth, sizeKb}
+
+Sustained growth raises a "memory-growth" event: when memory (traced or RSS)
+grew in at least ALARM_INTERVALS consecutive intervals, by ALARM_MB or more in
+total, the event lists the sites that grew the most over that whole run. The
+run then starts over, so a steady leak is reported once every few intervals
+rather than every interval.
+
+Allocations made before the monitor started are not traced (they cannot grow
+anyway), and memory allocated by C libraries without Python's allocator (e.g.
+liblsl, the Unicorn driver) only shows up in rssMb. Snapshots are taken on the
+event loop; with a few thousand live allocation sites that takes some
+milliseconds, visible as loop lag in the metrics event.
+
+tracemalloc is process-wide and also used by alloc_probe.py (BOGGLE_ALLOC_CHECK):
+whoever starts tracing stops it, and the probe leaves the peak alone while a
+monitor is running (monitor_running). If tracing is stopped under the monitor
+anyway, it stops reporting.
+"""
+
+import asyncio
+import os
+import sys
+import tracemalloc
+
+# ---------- CONFIGS ----------
+TOP_SITES = 10                  # Allocation sites listed per event
+TRACE_FRAMES = 1                # Frames kept per allocation (1 = the allocating line)
+ALARM_INTERVALS = 6             # Consecutive growing intervals before the alarm
+ALARM_MB = 16.0                 # ...with at least this much growth in total
+# ---------- CONFIGS ----------
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_running = set()
+
+
+def monitor_running():
+    """True while a MemoryMonitor is reporting (other tracemalloc users must not reset its peak)."""
+    return bool(_running)
+
+
+def interval_from_env(var="BOGGLE_MEMORY"):
+    """Snapshot interval in seconds, or None when the monitor is off."""
+    try:
+        value = float(os.environ.get(var, ""))
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+
+def rss_bytes():
+    """Current resident set size, or None if the platform does not expose it cheaply."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak rather than current RSS, in KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def top_growth(snapshot, previous, limit=TOP_SITES):
+    """The `limit` allocation sites whose size grew the most between two snapshots."""
+    rows = []
+    for stat in snapshot.compare_to(previous, "lineno"):
+        if stat.size_diff <= 0:
+            continue
+        frame = stat.traceback[0]
+        rows.append({
+            "site": f"{frame.filename}:{frame.lineno}",
+            "growthKb": round(stat.size_diff / 1024, 1),
+            "countGrowth": stat.count_diff,
+            "sizeKb": round(stat.size / 1024, 1),
+        })
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def _mb(value):
+    return None if value is None else round(value / 1024 / 1024, 2)
+
+
+class MemoryMonitor:
+    def __init__(self, emit, interval=None):
+        self.emit = emit
+        self.interval = interval_from_env() if interval is None else interval
+        self._task = None
+        self._started_tracing = False
+        self._previous = None
+        self._last_sizes = None
+        # Start of the current run of growing intervals: snapshot, (traced, rss), length
+        self._streak_snapshot = None
+        self._streak_sizes = None
+        self._streak = 0
+        self.alarms = 0
+
+    def start(self):
+        """Start tracing and reporting on the running loop (no-op when disabled)."""
+        if self.interval is not None and self._task is None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACE_FRAMES)
+                self._started_tracing = True
+            print(f"[INFO] Memory monitor: tracemalloc snapshot every {self.interval:g}s.")
+            _running.add(self)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def stop(self):
+        """Stop reporting, and stop tracing if this monitor started it."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        _running.discard(self)
+        if self._started_tracing:
+            self._started_tracing = False
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    async def _run(self):
+        try:
+            if not tracemalloc.is_tracing():
+                return
+            self._previous = self._streak_snapshot = self._snapshot()
+            self._last_sizes = self._streak_sizes = (tracemalloc.get_traced_memory()[0], rss_bytes())
+            while True:
+                await asyncio.sleep(self.interval)
+                if not tracemalloc.is_tracing():
+                    print("[WARN] Memory monitor: tracemalloc was stopped elsewhere; no more memory events.")
+                    return
+                self.check()
+        finally:
+            _running.discard(self)
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def check(self):
+        """Take a snapshot, emit the "memory" event and check for sustained growth."""
+        snapshot = self._snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+        rss = rss_bytes()
+        last_traced, last_rss = self._last_sizes
+        self.emit("memory", rssMb=_mb(rss), tracedMb=_mb(traced), tracedPeakMb=_mb(peak),
+                  growthMb=_mb(traced - last_traced), top=top_growth(snapshot, self._previous))
+
+        grew = traced > last_traced or (rss is not None and last_rss is not None and rss > last_rss)
+        self._previous, self._last_sizes = snapshot, (traced, rss)
+        if not grew:
+            self._start_streak(snapshot)
+            return
+
+        self._streak += 1
+        start_traced, start_rss = self._streak_sizes
+        traced_growth = traced - start_traced
+        rss_growth = None if rss is None or start_rss is None else rss - start_rss
+        limit = ALARM_MB * 1024 * 1024
+        if self._streak >= ALARM_INTERVALS and (traced_growth >= limit or (rss_growth or 0) >= limit):
+            self.alarms += 1
+            print(f"[WARN] Memory grew for {self._streak} intervals: traced {_mb(traced_growth)} MB, "
+                  f"RSS {_mb(rss_growth)} MB.")
+            self.emit("memory-growth", intervals=self._streak, intervalSecs=self.interval,
+                      tracedGrowthMb=_mb(traced_growth), rssGrowthMb=_mb(rss_growth),
+                      top=top_growth(snapshot, self._streak_snapshot))
+            self._start_streak(snapshot)
+
+    def _start_streak(self, snapshot):
+        self._streak_snapshot = snapshot
+        self._streak_sizes = self._last_sizes
+        self._streak = 0
@@ -0,0 +1,195 @@
+"""Append-only raw EEG recorder used by the acquisition servers when SAVE_RAW_DATA is on.
+
+Samples are written on a background thread, so recording never blocks
+acquisition, and every block costs the same no matter how long the session is.
+Recordings use the memory-mapped container format described in recording.py
+(samples.f32 + timestamps.f64 + blocks.idx + meta.json), or, with
+compression="zlib"/"lzma", the chunk-compressed format in compressed_recording.py.
+Stimulus markers sent by the app (see markers.py) are stored next to the samples
+in markers.jsonl.
+
+A recording can be converted to the legacy { "eegData": [ [ch1...], [ch2...], ... ] }
+JSON layout with:
+    python raw_recorder.py to-json <recording.bglrec> <output.json>
+"""
+
+import json
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+from compressed_recording import CompressedRecordingWriter, open_recording
+from recording import MarkerWriter, RecordingWriter
+
+DEFAULT_BLOCK_SIZE = 256        # Samples buffered by write_sample before a block is queued
+DEFAULT_FLUSH_INTERVAL = 1.0    # Max seconds between file flushes
+DEFAULT_MAX_PENDING = 256       # Max queued blocks before new blocks are dropped (never blocks the caller)
+CLOSE_TIMEOUT = 10.0            # Max seconds close() waits for the writer to drain the queue
+
+
+def session_filename(prefix, extension=".bglrec"):
+    """Return e.g. 'datasets/RAW-eeg-data-20250101-120000.bglrec' for a new session."""
+    return f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}{extension}"
+
+
+class RawRecorder:
+    """Background-thread writer for the recording container format."""
+
+    def __init__(self, filename, channels, sampling_rate, metadata=None,
+                 block_size=DEFAULT_BLOCK_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_pending=DEFAULT_MAX_PENDING, compression=None):
+        self.filename = filename
+        self.channels = channels
+        self.sampling_rate = float(sampling_rate)
+        self.flush_interval = flush_interval
+
+        self.blocks_written = 0
+        self.samples_written = 0
+        self.blocks_dropped = 0
+
+        # Staging block for write_sample
+        self._block_size = block_size
+        self._stage_times = np.zeros(block_size, dtype="<f8")
+        self._stage_values = np.zeros((block_size, channels), dtype="<f4")
+        self._staged = 0
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self.error = None   # Exception that stopped the writer thread (e.g. disk full); blocks are refused after it
+
+        if compression:
+            self._writer = CompressedRecordingWriter(filename, channels, self.sampling_rate, metadata, codec=compression)
+        else:
+            self._writer = RecordingWriter(filename, channels, self.sampling_rate, metadata)
+
+        # Stimulus markers go straight to markers.jsonl (see write_marker)
+        self._markers = MarkerWriter(filename)
+        self._markers_lock = threading.Lock()
+        self.markers_written = 0
+
+        self._thread = threading.Thread(target=self._writer_loop, name="raw-recorder", daemon=True)
+        self._thread.start()
+
+    def write_block(self, timestamps, values):
+        """Queue a block of samples: timestamps (n,) and values (n, channels)."""
+        if self._closed or self.error is not None:
+            return
+        self._flush_stage()
+        self._enqueue(timestamps, values)
+
+    def _enqueue(self, timestamps, values):
+        if self.error is not None:
+            self.blocks_dropped += 1
+            return
+        # Copy now: callers reuse their buffers as soon as this returns
+        times = np.array(timestamps, dtype="<f8")
+        data = np.array(np.asarray(values)[:, :self.channels], dtype="<f4")
+        try:
+            self._queue.put_nowait((times, data))
+        except queue.Full:
+            self.blocks_dropped += 1
+
+    def write_sample(self, timestamp, values):
+        """Stage a single sample; a block is queued every block_size samples."""
+        if self._closed or self.error is not None:
+            return
+        i = self._staged
+        self._stage_times[i] = timestamp
+        self._stage_values[i] = values[:self.channels]
+        self._staged = i + 1
+        if self._staged == self._block_size:
+            self._flush_stage()
+
+    def _flush_stage(self):
+        if self._staged:
+            self._enqueue(self._stage_times[:self._staged], self._stage_values[:self._staged])
+            self._staged = 0
+
+    def write_marker(self, marker):
+        """Append a stamped marker ({"time": ..., "type": ..., ...}) to the recording's markers.jsonl."""
+        with self._markers_lock:
+            if self._closed:
+                return
+            self._markers.write(marker)
+            self.markers_written += 1
+
+    def _writer_loop(self):
+        try:
+            self._write_until_closed()
+        except Exception as e:
+            # Disk full, I/O error, ...: stop accepting blocks; close() must not wait on this thread
+            self.error = e
+            print(f"[ERROR] Raw recorder stopped writing {self.filename}: {e}", flush=True)
+        try:
+            self._writer.close()
+        except Exception as e:
+            print(f"[ERROR] Raw recorder could not close {self.filename}: {e}", flush=True)
+
+    def _write_until_closed(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                times, data = item
+                if times is None:
+                    break
+                self._writer.append(times, data)
+                self.blocks_written += 1
+                self.samples_written += len(times)
+
+            now = time.monotonic()
+            if now - last_flush >= self.flush_interval:
+                self._writer.flush()
+                last_flush = now
+
+    def close(self):
+        """Write any staged samples, drain the queue and close the file."""
+        if self._closed:
+            return
+        self._flush_stage()
+        with self._markers_lock:
+            self._closed = True
+            self._markers.close()
+        if self._thread.is_alive():
+            try:
+                self._queue.put((None, None), timeout=CLOSE_TIMEOUT)
+            except queue.Full:
+                print(f"[WARN] Raw recorder queue still full after {CLOSE_TIMEOUT:g}s; not waiting for the writer.")
+            self._thread.join(CLOSE_TIMEOUT)
+            if self._thread.is_alive():
+                print(f"[WARN] Raw recorder writer still busy after {CLOSE_TIMEOUT:g}s; {self.filename} may be incomplete.")
+        if self.blocks_dropped:
+            reason = f"writer stopped: {self.error}" if self.error is not None else "writer could not keep up"
+            print(f"[WARN] Raw recorder dropped {self.blocks_dropped} blocks ({reason}).")
+
+
+def read_recording(filename):
+    """Load a whole recording. Returns (timestamps (n,), values (n, channels), metadata)."""
+    recording = open_recording(filename)
+    metadata = dict(recording.metadata, channels=recording.channels, samplingRate=recording.sampling_rate)
+    blocks = list(recording.blocks())
+    if not blocks:
+        return np.zeros(0, dtype="<f8"), np.zeros((0, recording.channels), dtype="<f4"), metadata
+    return np.concatenate([t for t, _ in blocks]), np.concatenate([v for _, v in blocks]), metadata
+
+
+def convert_to_legacy_json(filename, output_filename):
+    """Write a recording as { "eegData": [ [ch1...], [ch2...], ... ] }."""
+    _, values, _ = read_recording(filename)
+    with open(output_filename, "w") as f:
+        json.dump({"eegData": values.T.astype(np.float64).tolist()}, f)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "to-json":
+        convert_to_legacy_json(sys.argv[2], sys.argv[3])
+    else:
+        print("Usage: python raw_recorder.py to-json <recording.bglrec> <output.json>", file=sys.stderr)
+        sys.exit(2)
@@ -0,0 +1,239 @@
+"""Memory-mapped EEG recording container with a timestamp block index.
+
+A recording is a directory (conventionally named *.bglrec) holding:
+    meta.json       channels, samplingRate and free-form metadata
+    samples.f32     (num_samples, channels) little-endian float32, row-major, no header
+    timestamps.f64  (num_samples,) little-endian float64
+    blocks.idx      one record per written block: first time, last time, sample offset, count
+    markers.jsonl   optional stimulus markers, one JSON object per line (see read_markers)
+
+samples.f32 and timestamps.f64 are opened with np.memmap, so a window of a
+multi-hour session is sliced without reading the rest of the file. Window
+lookups bisect the (in-memory) blocks.idx and then the timestamps of a single block, which is
+O(log n) in the number of samples.
+
+    rec = Recording("datasets/session.bglrec")
+    eeg = rec.eeg_window_before(t_marker, rec.sampling_rate * 4)   # (channels, samples) view
+"""
+
+import json
+import os
+
+import numpy as np
+
+SAMPLES_FILE = "samples.f32"
+TIMESTAMPS_FILE = "timestamps.f64"
+INDEX_FILE = "blocks.idx"
+META_FILE = "meta.json"
+MARKERS_FILE = "markers.jsonl"
+
+SAMPLE_DTYPE = np.dtype("<f4")
+TIMESTAMP_DTYPE = np.dtype("<f8")
+INDEX_DTYPE = np.dtype([("first", "<f8"), ("last", "<f8"), ("offset", "<u8"), ("count", "<u4")])
+
+
+class RecordingWriter:
+    """Synchronous appender for the container format. Not thread-safe; RawRecorder owns one per thread."""
+
+    def __init__(self, path, channels, sampling_rate, metadata=None):
+        self.path = path
+        self.channels = channels
+        self.sampling_rate = float(sampling_rate)
+        self.num_samples = 0
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump({"channels": channels, "samplingRate": self.sampling_rate,
+                       "metadata": metadata or {}}, f, indent=2)
+
+        self._samples = open(os.path.join(path, SAMPLES_FILE), "wb")
+        self._timestamps = open(os.path.join(path, TIMESTAMPS_FILE), "wb")
+        self._index = open(os.path.join(path, INDEX_FILE), "wb")
+        self._entry = np.zeros(1, dtype=INDEX_DTYPE)
+
+    def append(self, timestamps, values):
+        """Append a block: timestamps (n,) and values (n, channels)."""
+        times = np.ascontiguousarray(timestamps, dtype=TIMESTAMP_DTYPE)
+        data = np.ascontiguousarray(np.asarray(values)[:, :self.channels], dtype=SAMPLE_DTYPE)
+        count = len(times)
+        if not count:
+            return
+
+        self._samples.write(data.tobytes())
+        self._timestamps.write(times.tobytes())
+
+        # The index entry goes last, so a reader never sees an entry whose samples are missing
+        entry = self._entry
+        entry["first"] = times[0]
+        entry["last"] = times[-1]
+        entry["offset"] = self.num_samples
+        entry["count"] = count
+        self._index.write(entry.tobytes())
+        self.num_samples += count
+
+    def flush(self):
+        self._samples.flush()
+        self._timestamps.flush()
+        self._index.flush()
+
+    def close(self):
+        self.flush()
+        self._samples.close()
+        self._timestamps.close()
+        self._index.close()
+
+
+def _memmap(path, dtype, shape):
+    if shape[0] == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+class Recording:
+    """Read-only view of a recording container. Nothing is loaded until it is sliced."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        self.channels = int(meta["channels"])
+        self.sampling_rate = float(meta["samplingRate"])
+        self.metadata = meta.get("metadata", {})
+
+        # The block index is small (one record per block) and is read into memory; the samples stay mapped.
+        # Only entries whose samples and timestamps are fully on disk are used.
+        index = np.fromfile(os.path.join(path, INDEX_FILE), dtype=INDEX_DTYPE)
+        available = min(os.path.getsize(os.path.join(path, SAMPLES_FILE)) // (SAMPLE_DTYPE.itemsize * self.channels),
+                        os.path.getsize(os.path.join(path, TIMESTAMPS_FILE)) // TIMESTAMP_DTYPE.itemsize)
+        block_ends = index["offset"] + index["count"]
+        num_blocks = int(np.searchsorted(block_ends, available, side="right"))
+        self.index = index[:num_blocks]
+        self._block_last = np.ascontiguousarray(self.index["last"])
+        self.num_samples = int(block_ends[num_blocks - 1]) if num_blocks else 0
+
+        self.samples = _memmap(os.path.join(path, SAMPLES_FILE), SAMPLE_DTYPE, (self.num_samples, self.channels))
+        self.timestamps = _memmap(os.path.join(path, TIMESTAMPS_FILE), TIMESTAMP_DTYPE, (self.num_samples,))
+
+    def __len__(self):
+        return self.num_samples
+
+    @property
+    def start_time(self):
+        return float(self.index["first"][0]) if len(self.index) else None
+
+    @property
+    def end_time(self):
+        return float(self.index["last"][-1]) if len(self.index) else None
+
+    def index_at(self, t):
+        """Position of the first sample stamped at or after t (num_samples if none)."""
+        block = int(np.searchsorted(self._block_last, t, side="left"))
+        if block >= len(self.index):
+            return self.num_samples
+        offset = int(self.index["offset"][block])
+        count = int(self.index["count"][block])
+        return offset + int(np.searchsorted(self.timestamps[offset:offset + count], t, side="left"))
+
+    def samples_between(self, start, end):
+        """Sample rows [start, end) as a (samples, channels) view."""
+        return self.samples[start:end]
+
+    def window(self, t_start, t_end):
+        """Samples stamped in [t_start, t_end) as a (samples, channels) view."""
+        return self.samples[self.index_at(t_start):self.index_at(t_end)]
+
+    def eeg_window(self, t_start, t_end):
+        """Same as window() but shaped (channels, samples), as the FBCCA modules expect."""
+        return self.window(t_start, t_end).T
+
+    def eeg_window_before(self, t_end, num_samples):
+        """The num_samples samples stamped before t_end, shaped (channels, samples)."""
+        end = self.index_at(t_end)
+        start = max(0, end - int(num_samples))
+        return self.samples[start:end].T
+
+    def markers(self):
+        """The recording's markers as a MarkerIndex."""
+        return load_markers(self.path)
+
+    def blocks(self):
+        """Yield (timestamps, values) views block by block, in recording order."""
+        for entry in self.index:
+            offset, count = int(entry["offset"]), int(entry["count"])
+            yield self.timestamps[offset:offset + count], self.samples[offset:offset + count]
+
+
+def read_markers(path):
+    """Return the markers of a recording (raw or compressed) sorted by time, or [] if it has none.
+
+    Each marker is a dict with at least "time" (acquisition clock, like the
+    sample timestamps) and "type". Gaze markers ("gaze-start"/"gaze-end") also
+    carry "scenarioId", "target" (class index, -1 for idle) and optionally
+    "buttonId" and "frequencies".
+    """
+    markers_path = os.path.join(path, MARKERS_FILE)
+    if not os.path.isfile(markers_path):
+        return []
+    markers = []
+    with open(markers_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                markers.append(json.loads(line))
+            except json.JSONDecodeError:
+                break  # A torn last line from an interrupted session
+    markers.sort(key=lambda marker: marker["time"])
+    return markers
+
+
+def load_markers(path):
+    """read_markers() wrapped in a MarkerIndex for time queries."""
+    return MarkerIndex(read_markers(path))
+
+
+class MarkerWriter:
+    """Appends stamped markers to a recording's markers.jsonl. Markers are rare, so each one is flushed."""
+
+    def __init__(self, path):
+        self._file = open(os.path.join(path, MARKERS_FILE), "a")
+
+    def write(self, marker):
+        self._file.write(json.dumps(marker) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class MarkerIndex:
+    """Markers sorted by time, with O(log n) lookups by time."""
+
+    def __init__(self, markers):
+        self.markers = sorted(markers, key=lambda marker: marker["time"])
+        self.times = np.array([marker["time"] for marker in self.markers], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.markers)
+
+    def __iter__(self):
+        return iter(self.markers)
+
+    def between(self, t_start, t_end):
+        """Markers stamped in [t_start, t_end)."""
+        start = int(np.searchsorted(self.times, t_start, side="left"))
+        end = int(np.searchsorted(self.times, t_end, side="left"))
+        return self.markers[start:end]
+
+    def latest(self, t, marker_type=None):
+        """The last marker stamped at or before t (of marker_type, if given), or None."""
+        i = int(np.searchsorted(self.times, t, side="right")) - 1
+        while i >= 0:
+            if marker_type is None or self.markers[i]["type"] == marker_type:
+                return self.markers[i]
+            i -= 1
+        return None
+
+    def of_type(self, marker_type):
+        return [marker for marker in self.markers if marker["type"] == marker_type]
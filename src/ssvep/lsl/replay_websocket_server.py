@@ -0,0 +1,204 @@
+"""Replay a recorded session through the WebSocket server, as if a headset were attached.
+
+Serves ws://localhost:8765 with the same packets and JSON-RPC events as the LSL,
+Unicorn and Emotiv servers (READY, server-ready, headset-connected, and
+headset-disconnected when the recording ends), so the app and the benchmarks can
+run on any machine without a headset.
+
+    python replay_websocket_server.py <recording.bglrec> [--speed 1] [--loop] [--restamp]
+
+--speed 1 replays in real time, --speed N at N x real time and --speed 0 as fast
+as possible (the producer then waits for the slowest client instead of letting its
+queue overflow). Recordings hold raw samples, so they are filtered with the
+settings the recording server stored in the metadata ("filter", see
+sample_blocks.filter_settings), or not at all if it streamed them unfiltered or
+--no-filter is given. Recordings without stored settings get DEFAULT_FILTER_SETTINGS.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import websockets
+
+from acquisition_hub import AcquisitionHub
+from alloc_probe import create_probe
+from compressed_recording import open_recording
+from memory_monitor import MemoryMonitor
+from sample_blocks import SampleBlockEncoder, design_filters, filter_settings, per_sample_filter_matrix
+from stream_metrics import StreamMetrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Adding the sibling folder fbcca-py to sys.path so it can import fbcca_config_service.fbcca_config.
+try:
+    FBCCA_DIR = os.path.join(os.path.dirname(BASE_DIR), "fbcca-py")
+    if FBCCA_DIR not in sys.path:
+        sys.path.insert(0, FBCCA_DIR)
+
+    from fbcca_config_service import fbcca_config
+    from profiling import Profiler
+except Exception as e:
+    print(f"[ERROR] Failed to import fbcca_config_service.fbcca_config: {e}")
+    # Stop here so the rest of the script doesn't run with missing config
+    raise SystemExit(1)
+
+# ---------- CONFIGS ----------
+CHANNELS = fbcca_config["channels"]     # Channels sent to clients (capped by the recording's channel count)
+
+BLOCK_SIZE = 32                 # Samples per published packet
+APPLY_FILTERING = True          # Bandpass + notch, as the recording server did (overridden by --no-filter)
+DEFAULT_FILTER_SETTINGS = filter_settings(lowcut=2.0, highcut=100.0, order=5, notch_freq=50.0)  # For recordings without "filter" metadata
+CLIENT_QUEUE_SIZE = 1024        # Max packets buffered per WebSocket client before the overflow policy applies
+CLIENT_OVERFLOW_POLICY = "drop-oldest"  # "drop-oldest" or "disconnect" for clients that fall behind
+# -----------------------------
+
+
+# === JSON-RPC event emitter (mirrors lsl_websocket_server.py) ===
+def emit_event(event_type: str, **params):
+    """Emit a JSON-RPC style event line to stdout for Node consumer."""
+    try:
+        payload = {"jsonrpc": "2.0", "method": "event", "params": {"type": event_type}}
+        if params:
+            payload["params"].update(params)
+        print(json.dumps(payload), flush=True)
+    except Exception:
+        pass
+
+
+def recorded_filter_settings(recording, path):
+    """The filter settings stored with a recording, or DEFAULT_FILTER_SETTINGS for older recordings."""
+    settings = recording.metadata.get("filter")
+    if settings is None:
+        print(f"[WARN] Recording '{path}' does not store its filter settings; "
+              f"using the defaults ({DEFAULT_FILTER_SETTINGS}).")
+        return DEFAULT_FILTER_SETTINGS
+    return settings
+
+
+def replay_blocks(recording, block_size):
+    """Yield (timestamps, values) slices of at most block_size samples, in recording order."""
+    for times, values in recording.blocks():
+        for start in range(0, len(times), block_size):
+            yield times[start:start + block_size], values[start:start + block_size]
+
+
+def make_replay_producer(path, speed=1.0, loop=False, restamp=False, apply_filtering=APPLY_FILTERING,
+                         block_size=BLOCK_SIZE):
+    """Return a hub producer that replays the recording at `path`.
+
+    speed > 0 paces packets by the recorded timestamps divided by speed; speed 0
+    publishes as fast as the clients take them. With restamp, timestamps are
+    shifted so the first sample is stamped with the wall-clock replay start.
+    """
+
+    async def replay_producer(hub):
+        recording = open_recording(path)
+        if not len(recording):
+            emit_event("error", message=f"Recording '{path}' is empty.")
+            return
+
+        channels = min(CHANNELS, recording.channels)
+        encoder = SampleBlockEncoder(channels, block_size)
+        settings = recorded_filter_settings(recording, path)
+        filtering = apply_filtering and settings["enabled"]
+        filter_matrix_t = per_sample_filter_matrix(channels, *design_filters(settings, recording.sampling_rate)).T
+
+        channel_names = recording.metadata.get("channelNames")
+        if channel_names:
+            hub.set_state("channelNames", json.dumps({"channelNames": channel_names[:channels]}))
+
+        print(f"[INFO] Replaying '{path}': {len(recording)} samples, {recording.channels} channels "
+              f"at {recording.sampling_rate} Hz, speed {'max' if speed <= 0 else speed}, "
+              f"filter {settings if filtering else 'off'}.")
+
+        gc.collect()
+        gc.freeze()
+        probe = create_probe(emit_event)
+        metrics = StreamMetrics(hub, emit_event, recording.sampling_rate).start()
+        emit_event("headset-connected")
+
+        loop_clock = asyncio.get_running_loop()
+        published = 0
+        try:
+            while True:
+                start_clock = loop_clock.time()
+                first_time = recording.start_time
+                time_offset = (time.time() - first_time) if restamp else 0.0
+
+                for timestamps, raw_block in replay_blocks(recording, block_size):
+                    n = len(timestamps)
+                    if speed > 0:
+                        delay = start_clock + (timestamps[-1] - first_time) / speed - loop_clock.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    else:
+                        await hub.wait_for_capacity()
+
+                    np.add(timestamps, time_offset, out=encoder.times[:n])
+                    filter_started = time.perf_counter()
+                    if filtering:
+                        np.matmul(raw_block[:, :channels], filter_matrix_t, out=encoder.values[:n])
+                    else:
+                        encoder.values[:n] = raw_block[:, :channels]
+                    filter_secs = time.perf_counter() - filter_started
+                    hub.publish(encoder.encode(n, published))
+                    metrics.record_block(n, n, filter_secs, encoder.times[:n])
+                    published += n
+
+                    if probe is not None:
+                        probe.tick(n)
+                    if speed <= 0:
+                        await asyncio.sleep(0)
+
+                elapsed = loop_clock.time() - start_clock
+                print(f"[INFO] Replay pass finished: {published} samples in {elapsed:.2f}s "
+                      f"({published / max(elapsed, 1e-9):.0f} samples/s).")
+                if not loop:
+                    break
+                published = 0
+        finally:
+            metrics.stop()
+            gc.unfreeze()
+            gc.collect()
+            if probe is not None:
+                probe.stop()
+            emit_event("headset-disconnected")
+
+    return replay_producer
+
+
+async def main(args):
+    producer = make_replay_producer(args.recording, speed=args.speed, loop=args.loop, restamp=args.restamp,
+                                    apply_filtering=APPLY_FILTERING and not args.no_filter,
+                                    block_size=args.block_size)
+    # No markers to record here; clients may still ask for a profile (see profiling.py)
+    profiler = Profiler("replay_server", announce=emit_event)
+    hub = AcquisitionHub(producer, queue_size=CLIENT_QUEUE_SIZE, overflow_policy=CLIENT_OVERFLOW_POLICY,
+                         on_message=profiler.handle_message)
+    async with websockets.serve(hub.serve_client, "localhost", args.port):
+        print("READY")
+        emit_event("server-ready")
+        profiler.start_from_env("BOGGLE_PROFILE", seconds=True)
+        memory = MemoryMonitor(emit_event).start()  # BOGGLE_MEMORY=<seconds>, see memory_monitor.py
+        try:
+            await asyncio.Future()  # Run indefinitely
+        finally:
+            memory.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded EEG session over the WebSocket server")
+    parser.add_argument("recording", help="Recording directory (*.bglrec, raw or chunk-compressed)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed: 1 = real time, N = N x, 0 = as fast as possible")
+    parser.add_argument("--loop", action="store_true", help="Start over when the recording ends")
+    parser.add_argument("--restamp", action="store_true", help="Shift timestamps so the replay starts at the current time")
+    parser.add_argument("--no-filter", action="store_true", help="Send the recorded samples unfiltered")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Samples per packet")
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+"""Preallocated sample blocks and allocation-light packet encoding for the acquisition loops.
+
+The servers filter each sample across its channel vector with lfilter and zero
+initial state. For a fixed channel count that is a linear map, so the bandpass
+and notch stages collapse into one (channels x channels) matrix that can be
+applied to a whole block with np.matmul into a preallocated output.
+filter_settings() describes a server's bandpass + notch and design_filters()
+turns it into coefficients, so every server (and a replay of its recordings,
+which store the settings in their metadata) designs the same filters.
+
+SampleBlockEncoder keeps one (max_samples, 1 + channels) float64 matrix whose
+first column holds timestamps and the rest the channel values, and renders the
+first n rows with a cached %-format string as
+    {"seq": N, "samples": [{"time": t, "values": [v1, ...]}, ...]}
+so steady-state streaming builds no per-sample dicts or lists. seq is the
+sequence number of the first sample (see sample_ring.py).
+"""
+
+import numpy as np
+from scipy.signal import butter, iirnotch, lfilter
+
+
+def filter_settings(enabled=True, lowcut=2.0, highcut=100.0, order=5, notch_freq=50.0, notch_q=30.0):
+    """Bandpass + notch settings as stored under "filter" in recording metadata."""
+    return {"enabled": bool(enabled), "lowcut": lowcut, "highcut": highcut, "order": order,
+            "notchFreq": notch_freq, "notchQ": notch_q}
+
+
+def design_filters(settings, fs):
+    """Return ((b, a) bandpass, (b, a) notch) for a filter_settings() dict at sampling rate fs."""
+    nyquist = 0.5 * fs
+    bandpass = butter(settings["order"], [settings["lowcut"] / nyquist, settings["highcut"] / nyquist], btype="band")
+    notch = iirnotch(settings["notchFreq"] / nyquist, settings["notchQ"])
+    return bandpass, notch
+
+
+def per_sample_filter_matrix(channels, *filters):
+    """Return M such that block @ M.T equals applying lfilter(b, a, row) for each (b, a) to every row."""
+    impulse = np.zeros(channels)
+    impulse[0] = 1.0
+
+    matrix = np.eye(channels)
+    for b, a in filters:
+        response = lfilter(b, a, impulse)
+        toeplitz = np.zeros((channels, channels))
+        for i in range(channels):
+            toeplitz[i, :i + 1] = response[i::-1]
+        matrix = toeplitz @ matrix
+    return matrix
+
+
+class SampleBlockEncoder:
+    """Reusable (time, values) block buffer with a cached JSON renderer."""
+
+    def __init__(self, channels, max_samples):
+        self.channels = channels
+        self.max_samples = max_samples
+
+        self.block = np.zeros((max_samples, 1 + channels), dtype=np.float64)
+        self.times = self.block[:, 0]
+        self.values = self.block[:, 1:]
+
+        self._sample_format = '{"time": %r, "values": [' + ", ".join(["%r"] * channels) + "]}"
+        self._formats = {}
+
+    def _format_for(self, num_samples):
+        fmt = self._formats.get(num_samples)
+        if fmt is None:
+            fmt = '{"seq": %d, "samples": [' + ", ".join([self._sample_format] * num_samples) + "]}"
+            self._formats[num_samples] = fmt
+        return fmt
+
+    def encode(self, num_samples, seq=0):
+        """Render the first num_samples rows of the block as one JSON batch packet starting at sample seq."""
+        return self._format_for(num_samples) % (seq, *self.block[:num_samples].ravel().tolist())
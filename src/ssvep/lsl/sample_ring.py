@@ -0,0 +1,347 @@
+"""Acquisition ring buffer indexed by sample sequence number and timestamp, with gap and drift detection.
+
+Every sample a server publishes gets a sequence number (seq). Whether samples
+were lost is only decided from evidence that timestamp jitter cannot produce:
+  - device counters (append(..., counters=...), e.g. the Emotiv COUNTER column):
+    a jump of the counter means samples were lost, a repeated counter is a
+    duplicate. The counter may wrap; its modulus is learned from the wraps seen;
+  - timestamps the source already made regular (trust_timestamps=True: LSL
+    dejittered timestamps, or timestamps reconstructed from the device rate):
+    a sample more than GAP_TOLERANCE periods after the previous one.
+Proven gaps of up to max_fill samples are filled by linear interpolation, so
+the stream stays regular and every window has the expected length; longer ones
+are counted and reported, a new stretch starts at the new sample and windows
+that would span the break are refused. Proven duplicates are dropped.
+
+Timestamps stamped on arrival (bursty, jittery) prove nothing, so without
+counters or trusted timestamps the ring is observe-only: every sample is kept
+as it came, intervals longer than SUSPECT_GAP_SECONDS are only counted as
+suspected gaps, and only a silence longer than BREAK_SECONDS (a lost and
+resumed stream, far beyond any jitter) starts a new stretch. Timestamps that do
+not increase are counted, never dropped.
+
+Drift is a least-squares fit of time against seq over the last drift_window
+seconds. Each drift_interval contributes one point, the mean seq and mean time
+of its samples, so per-sample jitter averages out; the rate is reported (in ppm
+of the nominal rate) once the fit spans DRIFT_MIN_SECONDS, and a "stream-drift"
+event is emitted when it moves beyond drift_alarm_ppm.
+
+window_ending_at(t, n) maps t to a seq from the latest sample (or the start of
+the stretch containing t) at the nominal rate, then steps over the few
+neighbours that jitter and drift put on the wrong side of t.
+
+Packets carry the seq of their first sample ({"seq": N, "samples": [...]}), so
+a client can detect lost packets: the next packet's seq must be N + len(samples).
+"""
+
+import collections
+
+import numpy as np
+
+DEFAULT_RING_SECONDS = 60.0        # Samples kept for window queries
+DEFAULT_MAX_FILL_SECONDS = 0.1     # Longest proven gap filled by interpolation
+DEFAULT_DRIFT_INTERVAL = 2.0       # Seconds per drift fit point
+DEFAULT_DRIFT_WINDOW = 60.0        # Seconds of fit points the drift estimate uses
+DEFAULT_DRIFT_ALARM_PPM = 500.0    # Fitted rate off by more than this is reported
+DRIFT_MIN_SECONDS = 20.0           # Span of fit points before a drift estimate is reported
+GAP_TOLERANCE = 1.5                # Periods between trusted timestamps before it counts as a gap
+SUSPECT_GAP_SECONDS = 0.1          # Untrusted timestamps: longer intervals are counted as suspected gaps
+BREAK_SECONDS = 1.0                # Untrusted timestamps: longer silences start a new stretch
+
+
+class SampleRing:
+    def __init__(self, channels, sampling_rate, seconds=DEFAULT_RING_SECONDS, max_fill_seconds=DEFAULT_MAX_FILL_SECONDS,
+                 drift_interval=DEFAULT_DRIFT_INTERVAL, drift_window=DEFAULT_DRIFT_WINDOW,
+                 drift_alarm_ppm=DEFAULT_DRIFT_ALARM_PPM, trust_timestamps=False, emit=None):
+        self.channels = channels
+        self.rate = float(sampling_rate)
+        self.period = 1.0 / self.rate
+        self.capacity = max(1, int(round(seconds * self.rate)))
+        self.max_fill = int(round(max_fill_seconds * self.rate))
+        self.drift_interval = drift_interval
+        self.drift_alarm_ppm = drift_alarm_ppm
+        self.trust_timestamps = trust_timestamps
+        self.emit = emit
+
+        self.times = np.zeros(self.capacity, dtype=np.float64)
+        self.values = np.zeros((self.capacity, channels), dtype=np.float64)
+        self.next_seq = 0
+        self.breaks = collections.deque()   # (seq, time) where each gap-free stretch starts
+
+        self._last_counter = None
+        self._counter_modulus = None
+        # Drift fit: one (mean seq, mean time) point per drift_interval
+        self._drift_points = collections.deque(maxlen=max(2, int(np.ceil(drift_window / drift_interval)) + 1))
+        self._point_start = None
+        self._point_seq_sum = 0.0
+        self._point_time_sum = 0.0
+        self._point_count = 0
+        self._drift_alarm = False
+
+        # Counters
+        self.samples_in = 0
+        self.samples_filled = 0
+        self.samples_lost = 0
+        self.gaps = 0
+        self.gaps_filled = 0
+        self.duplicates = 0
+        self.suspected_gaps = 0
+        self.non_increasing = 0
+        self.drift_ppm = None
+        self.drift_alarms = 0
+
+    @property
+    def oldest_seq(self):
+        return max(0, self.next_seq - self.capacity)
+
+    @property
+    def last_time(self):
+        return self.times[(self.next_seq - 1) % self.capacity] if self.next_seq else None
+
+    def append(self, timestamps, values, counters=None):
+        """Append a block. Returns (seq of the first row written, rows written, clean).
+
+        counters are the device's sample counters for the block, if it has any.
+        clean is True when the rows written are exactly the given block (no fill,
+        no dropped duplicates), so the caller can publish its own buffer as is;
+        otherwise it should publish rows [seq, seq + count) from the ring (see read).
+        """
+        n = len(timestamps)
+        first_seq = self.next_seq
+        if not n:
+            return first_seq, 0, True
+        self.samples_in += n
+        timestamps = np.asarray(timestamps)
+        if not self.breaks:
+            self._start_stretch(first_seq, timestamps[0])
+
+        # Fast path: nothing missing or repeated by the available evidence
+        intervals = np.diff(timestamps, prepend=self.last_time if first_seq else timestamps[0])
+        if counters is not None:
+            counters = np.asarray(counters, dtype=np.int64)
+            steps = np.diff(counters, prepend=self._last_counter if self._last_counter is not None else counters[0] - 1)
+            regular = n <= self.capacity and np.all(steps == 1)
+        elif self.trust_timestamps:
+            regular = n <= self.capacity and np.all(intervals <= GAP_TOLERANCE * self.period)
+        else:
+            regular = n <= self.capacity and np.all(intervals <= SUSPECT_GAP_SECONDS)
+        if regular:
+            self.non_increasing += int(np.count_nonzero(intervals[1:] <= 0) + (first_seq > 0 and intervals[0] <= 0))
+            if counters is not None:
+                self._last_counter = int(counters[-1])
+            self._write(timestamps, values)
+            self._add_drift_points(first_seq, timestamps)
+            return first_seq, n, True
+
+        clean = True
+        for i in range(n):
+            rows = self._append_one(timestamps[i], values[i], None if counters is None else int(counters[i]))
+            clean = clean and rows == 1
+        rows = min(self.next_seq - first_seq, self.capacity)
+        if rows:
+            self._add_drift_points(self.next_seq - rows, self.read(self.next_seq - rows, rows)[0])
+        return first_seq, self.next_seq - first_seq, clean
+
+    def _append_one(self, t, row, counter):
+        """Append one sample (plus any fill before it). Returns the number of rows written."""
+        last_time = self.last_time
+        interval = None if last_time is None else t - last_time
+        if interval is not None and interval <= 0:
+            self.non_increasing += 1
+
+        missing = 0
+        if counter is not None:
+            last = self._last_counter
+            if last is not None and counter == last:
+                self.duplicates += 1
+                return 0
+            if last is not None:
+                if counter > last:
+                    missing = counter - last - 1
+                else:
+                    # Wrapped: the modulus is one more than the largest counter seen
+                    self._counter_modulus = max(self._counter_modulus or 0, last + 1)
+                    missing = self._counter_modulus - last - 1 + counter
+            self._last_counter = counter
+        elif self.trust_timestamps:
+            if interval is not None and interval > GAP_TOLERANCE * self.period:
+                missing = int(round(interval * self.rate)) - 1
+        elif interval is not None and interval > SUSPECT_GAP_SECONDS:
+            # Arrival timestamps: maybe lost samples, maybe only a late burst
+            self.suspected_gaps += 1
+            if interval > BREAK_SECONDS:
+                self.gaps += 1
+                self._break(int(round(interval * self.rate)) - 1, interval, t)
+            self._write((t,), (row,))
+            return 1
+
+        written = 1
+        if missing > 0:
+            self.gaps += 1
+            if missing <= self.max_fill and last_time is not None:
+                # Linear interpolation between the last sample and this one
+                prev = self.values[(self.next_seq - 1) % self.capacity].copy()
+                fractions = np.arange(1, missing + 1, dtype=np.float64) / (missing + 1)
+                fill_times = last_time + fractions * (t - last_time)
+                fill_values = prev + fractions[:, None] * (np.asarray(row, dtype=np.float64) - prev)
+                self._write(fill_times, fill_values)
+                self.samples_filled += missing
+                self.gaps_filled += 1
+                written += missing
+            else:
+                self._break(missing, interval, t)
+        self._write((t,), (row,))
+        return written
+
+    def _break(self, missing, seconds, t):
+        self.samples_lost += missing
+        if self.emit is not None:
+            self.emit("stream-gap", missingSamples=missing,
+                      seconds=None if seconds is None else round(float(seconds), 4), seq=self.next_seq)
+        self._start_stretch(self.next_seq, t)
+
+    def _write(self, timestamps, values):
+        n = len(timestamps)
+        start = self.next_seq % self.capacity
+        first = min(n, self.capacity - start)
+        self.times[start:start + first] = timestamps[:first]
+        self.values[start:start + first] = values[:first]
+        if first < n:
+            self.times[:n - first] = timestamps[first:]
+            self.values[:n - first] = values[first:]
+        self.next_seq += n
+
+    def _start_stretch(self, seq, t):
+        self.breaks.append((seq, t))
+        # Keep the start of the oldest buffered stretch, drop the ones before it
+        while len(self.breaks) > 1 and self.breaks[1][0] <= self.oldest_seq:
+            self.breaks.popleft()
+        # Time against seq only holds within a stretch
+        self._drift_points.clear()
+        self._point_start = None
+        self._point_seq_sum = self._point_time_sum = 0.0
+        self._point_count = 0
+
+    def _add_drift_points(self, first_seq, timestamps):
+        n = len(timestamps)
+        if not n:
+            return
+        stretch_seq = self.breaks[-1][0]
+        if first_seq < stretch_seq:
+            # Only the part after the latest break belongs to the current fit
+            timestamps = timestamps[stretch_seq - first_seq:]
+            first_seq, n = stretch_seq, len(timestamps)
+            if not n:
+                return
+        if self._point_start is None:
+            self._point_start = float(timestamps[0])
+        self._point_seq_sum += n * first_seq + n * (n - 1) / 2.0
+        self._point_time_sum += float(np.sum(timestamps))
+        self._point_count += n
+        if timestamps[-1] - self._point_start < self.drift_interval:
+            return
+
+        self._drift_points.append((self._point_seq_sum / self._point_count, self._point_time_sum / self._point_count))
+        self._point_start = None
+        self._point_seq_sum = self._point_time_sum = 0.0
+        self._point_count = 0
+        self._fit_drift()
+
+    def _fit_drift(self):
+        points = np.array(self._drift_points)
+        if len(points) < 2 or points[-1, 1] - points[0, 1] < DRIFT_MIN_SECONDS:
+            return
+        seqs, times = points[:, 0] - points[0, 0], points[:, 1] - points[0, 1]
+        seconds_per_sample = np.dot(seqs - seqs.mean(), times - times.mean()) / np.dot(seqs - seqs.mean(), seqs - seqs.mean())
+        measured = 1.0 / seconds_per_sample
+        self.drift_ppm = float((measured / self.rate - 1.0) * 1e6)
+        alarm = abs(self.drift_ppm) > self.drift_alarm_ppm
+        if alarm and not self._drift_alarm:
+            self.drift_alarms += 1
+            if self.emit is not None:
+                self.emit("stream-drift", driftPpm=round(self.drift_ppm, 1), measuredRate=round(float(measured), 3),
+                          fitSeconds=round(float(times[-1]), 1))
+        self._drift_alarm = alarm
+
+    def seq_at(self, t):
+        """Seq one past the last sample stamped at or before t (clamped to the buffered range)."""
+        if self.next_seq == 0:
+            return 0
+        anchor_seq, anchor_time = self.next_seq - 1, self.last_time
+        if t < self.breaks[-1][1]:
+            # Earlier data: map through the start of the stretch containing t
+            for anchor_seq, anchor_time in reversed(self.breaks):
+                if anchor_time <= t:
+                    break
+        end = anchor_seq + int(np.floor((t - anchor_time) * self.rate + 1e-6)) + 1
+        end = min(max(end, self.oldest_seq), self.next_seq)
+        # The mapping is exact up to timestamp jitter and drift since the anchor, so this is a few steps
+        while end > self.oldest_seq and self.times[(end - 1) % self.capacity] > t:
+            end -= 1
+        while end < self.next_seq and self.times[end % self.capacity] <= t:
+            end += 1
+        return end
+
+    def read(self, seq, count, out_times=None, out_values=None):
+        """Copy rows [seq, seq + count) into out_times/out_values (allocated if not given). Returns them."""
+        if seq < self.oldest_seq or seq + count > self.next_seq:
+            raise IndexError(f"Rows {seq}..{seq + count} are not in the ring ({self.oldest_seq}..{self.next_seq}).")
+        if out_times is None:
+            out_times = np.empty(count, dtype=np.float64)
+        if out_values is None:
+            out_values = np.empty((count, self.channels), dtype=np.float64)
+        start = seq % self.capacity
+        first = min(count, self.capacity - start)
+        out_times[:first] = self.times[start:start + first]
+        out_values[:first] = self.values[start:start + first]
+        if first < count:
+            out_times[first:count] = self.times[:count - first]
+            out_values[first:count] = self.values[:count - first]
+        return out_times, out_values
+
+    def window_ending_at(self, t, num_samples):
+        """The num_samples samples stamped at or before t as (times, values (samples, channels)).
+
+        Returns None if they are not all buffered or the window would span a break.
+        """
+        return self._window(self.seq_at(t), num_samples)
+
+    def latest(self, num_samples):
+        """The most recent num_samples samples, or None (see window_ending_at)."""
+        return self._window(self.next_seq, num_samples)
+
+    def _window(self, end, num_samples):
+        start = end - num_samples
+        if start < self.oldest_seq:
+            return None
+        for seq, _ in reversed(self.breaks):
+            if seq <= start:
+                break
+            if seq < end:
+                return None
+        return self.read(start, num_samples)
+
+    def stats(self):
+        return {
+            "seq": self.next_seq,
+            "samplesIn": self.samples_in,
+            "samplesFilled": self.samples_filled,
+            "samplesLost": self.samples_lost,
+            "gaps": self.gaps,
+            "gapsFilled": self.gaps_filled,
+            "duplicates": self.duplicates,
+            "suspectedGaps": self.suspected_gaps,
+            "nonIncreasing": self.non_increasing,
+            "driftPpm": None if self.drift_ppm is None else round(self.drift_ppm, 1),
+            "driftAlarms": self.drift_alarms,
+        }
+
+
+def publish_ring_rows(hub, ring, encoder, seq, count):
+    """Publish ring rows [seq, seq + count) through encoder in packets of at most encoder.max_samples."""
+    offset = 0
+    while offset < count:
+        k = min(encoder.max_samples, count - offset)
+        ring.read(seq + offset, k, encoder.times, encoder.values)
+        hub.publish(encoder.encode(k, seq + offset))
+        offset += k
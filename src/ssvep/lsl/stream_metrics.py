@@ -0,0 +1,171 @@
+"""Periodic streaming metrics for the acquisition servers, reported as a "metrics" JSON-RPC event.
+
+Every interval (METRICS_INTERVAL, or BOGGLE_METRICS=<seconds>; 0 disables) the
+server emits
+  samplesInPerSec     samples taken from the source
+  samplesOutPerSec    samples published (includes gap fill)
+  effectiveRate       samples per second of sample timestamps (the source's real rate; nominalRate alongside)
+  packetsPerSec       packets published to the hub
+  filterMs            {mean, max} time spent filtering one block
+  loopLagMs           {mean, max} event-loop lag, from a LAG_PROBE_INTERVAL timer
+  clients             per client: queue depth, max depth, packets dropped, send latency {mean, max} ms
+  samplesLost         samples missing from the source (unfilled gaps) during the interval
+  packetsDropped      packets dropped for slow clients during the interval
+  sampleIntervalMs    jitter of the device timestamps: count, mean, p50/p90/p99/p99.9, max
+                      of the intervals between consecutive samples (see jitter_histogram.py)
+plus whatever the server's `extra` callable returns (e.g. the SampleRing counters).
+Every client entry also carries sendIntervalMs, the same summary for the
+intervals between its WebSocket sends.
+
+When reporting stops (stop()), the whole sample and send interval histograms
+are emitted as a "jitter-histogram" event (summary plus every non-empty
+[lowMs, highMs, count] bucket) and summarised in the log, so changes to an
+acquisition loop can be judged on jitter as well as on mean rate. Send
+intervals of clients that disconnect between two metrics events are lost.
+
+Producers call record_block() once per block; everything else is sampled by a
+task that wakes up every LAG_PROBE_INTERVAL, so the cost on the hot path is a
+few additions per block.
+"""
+
+import asyncio
+import os
+import time
+
+from jitter_histogram import JitterHistogram
+
+METRICS_INTERVAL = 5.0        # Seconds between metrics events
+LAG_PROBE_INTERVAL = 0.1      # Seconds between event-loop lag samples
+
+
+def interval_from_env(var="BOGGLE_METRICS"):
+    """Metrics interval in seconds: METRICS_INTERVAL unless overridden, None when disabled."""
+    raw = os.environ.get(var)
+    if raw is None or raw == "":
+        return METRICS_INTERVAL
+    try:
+        value = float(raw)
+    except ValueError:
+        return METRICS_INTERVAL
+    return value if value > 0 else None
+
+
+class StreamMetrics:
+    def __init__(self, hub, emit, nominal_rate=None, extra=None, interval=None):
+        self.hub = hub
+        self.emit = emit
+        self.nominal_rate = nominal_rate
+        self.extra = extra
+        self.interval = interval_from_env() if interval is None else interval
+        self._task = None
+        self.sample_intervals = JitterHistogram()
+        self.send_intervals = JitterHistogram()   # All clients, merged at every snapshot
+        self._reset()
+        self._last_published = hub.published
+        self._last_lost = 0
+        self._latest_time = None
+        self._reported_time = None
+
+    def _reset(self):
+        self.samples_in = 0
+        self.samples_out = 0
+        self.blocks = 0
+        self.filter_secs = 0.0
+        self.filter_max = 0.0
+        self.lag_sum = 0.0
+        self.lag_max = 0.0
+        self.lag_samples = 0
+
+    def record_block(self, samples_in, samples_out=None, filter_secs=0.0, times=None):
+        """Count one acquired block (hot path). times are the device timestamps of its samples."""
+        self.samples_in += samples_in
+        self.samples_out += samples_in if samples_out is None else samples_out
+        self.blocks += 1
+        self.filter_secs += filter_secs
+        if filter_secs > self.filter_max:
+            self.filter_max = filter_secs
+        if times is not None and len(times):
+            self._latest_time = times[-1]
+            if self.interval is not None:
+                self.sample_intervals.record_times(times)
+
+    def start(self):
+        """Start reporting on the running loop (no-op when disabled)."""
+        if self.interval is not None and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def stop(self):
+        """Stop reporting and dump the jitter histograms."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.dump_histograms()
+
+    def dump_histograms(self):
+        for client in tuple(self.hub.clients):
+            client.send_intervals.take_interval(into=self.send_intervals)
+        histograms = {"sampleIntervals": self.sample_intervals, "sendIntervals": self.send_intervals}
+        for name, histogram in histograms.items():
+            print(f"[INFO] {name} (ms): {histogram.summary()}")
+        self.emit("jitter-histogram", **{name: {"summary": histogram.summary(), "buckets": histogram.buckets()}
+                                         for name, histogram in histograms.items()})
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        while True:
+            expected = loop.time() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            now = loop.time()
+            lag = max(0.0, now - expected)
+            self.lag_sum += lag
+            self.lag_samples += 1
+            if lag > self.lag_max:
+                self.lag_max = lag
+
+            if now - started >= self.interval:
+                self.emit("metrics", **self.snapshot(now - started))
+                started = now
+
+    def snapshot(self, elapsed):
+        """Metrics since the previous snapshot (resets the interval counters)."""
+        published = self.hub.published
+        clients = [client.interval_stats(self.send_intervals) for client in tuple(self.hub.clients)]
+        extra = self.extra() if self.extra is not None else {}
+        lost = extra.get("samplesLost", 0)
+        effective_rate = None
+        if self._reported_time is not None and self._latest_time is not None:
+            span = self._latest_time - self._reported_time
+            if span > 0:
+                effective_rate = round(self.samples_in / span, 2)
+
+        metrics = {
+            "intervalSecs": round(elapsed, 3),
+            "samplesInPerSec": round(self.samples_in / elapsed, 1),
+            "samplesOutPerSec": round(self.samples_out / elapsed, 1),
+            "effectiveRate": effective_rate,
+            "nominalRate": self.nominal_rate,
+            "packetsPerSec": round((published - self._last_published) / elapsed, 1),
+            "filterMs": {
+                "mean": round(self.filter_secs / self.blocks * 1e3, 4) if self.blocks else None,
+                "max": round(self.filter_max * 1e3, 4),
+            },
+            "loopLagMs": {
+                "mean": round(self.lag_sum / self.lag_samples * 1e3, 3) if self.lag_samples else None,
+                "max": round(self.lag_max * 1e3, 3),
+            },
+            "sampleIntervalMs": self.sample_intervals.take_interval(),
+            "clients": clients,
+            "samplesLost": max(0, lost - self._last_lost),  # The counter restarts with a new stream
+            "packetsDropped": sum(client["droppedInInterval"] for client in clients),
+            "time": time.time(),
+        }
+        if extra:
+            metrics["stream"] = extra
+
+        self._last_published = published
+        self._last_lost = lost
+        self._reported_time = self._latest_time
+        self._reset()
+        return metrics
@@ -0,0 +1,171 @@
+"""Synthetic multi-channel SSVEP signal source for benchmarks and headset-free testing.
+
+The background is 1/f (pink) noise plus mains interference; while a target is
+gazed at, a sinusoidal response at that target's frequency and phase (with a
+weaker second harmonic) is added on every channel with a per-channel gain,
+strongest on the first channels as on the occipital electrodes. Everything is
+generated a block at a time with numpy and the noise filter state carries over
+between blocks, so consecutive blocks form one continuous signal.
+
+Phases follow scenarioConfig_lowFreqs.json and are in multiples of pi.
+
+    source = SyntheticSSVEP(frequencies, phases, channels=8, sampling_rate=250, snr_db=-5)
+    source.set_script(GazeScript.parse("0:4,idle:2,3:4"))
+    timestamps, values = source.next_block(32)      # (32,), (32, 8) float32
+
+    eeg = synthetic_trial(frequencies, phases, target=2, seconds=4)   # (channels, samples)
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+from scipy.signal import lfilter, lfilter_zi
+
+DEFAULT_NOISE_RMS = 10.0      # uV, background EEG
+DEFAULT_SNR_DB = -5.0         # SSVEP fundamental RMS relative to the background RMS
+DEFAULT_LINE_FREQ = 50.0      # Hz
+DEFAULT_LINE_RMS = 2.0        # uV of mains interference left after the amplifier
+HARMONIC_GAINS = (1.0, 0.5)   # Relative amplitudes of the fundamental and its harmonics
+
+# Pink noise as white noise through a 3-pole/3-zero filter (Kellet's approximation of 1/f within ~0.05 dB)
+PINK_B = np.array([0.049922035, -0.095993537, 0.050612699, -0.004408786])
+PINK_A = np.array([1.0, -2.494956002, 2.017265875, -0.522189400])
+
+
+def _pink_gain():
+    """RMS of the pink filter's output for unit-variance white noise."""
+    impulse = np.zeros(1 << 15)
+    impulse[0] = 1.0
+    return float(np.sqrt(np.sum(lfilter(PINK_B, PINK_A, impulse) ** 2)))
+
+
+_PINK_GAIN = _pink_gain()
+
+
+class GazeScript:
+    """Timeline of gazed targets: a list of (target index or None for idle, seconds), played in a loop."""
+
+    def __init__(self, segments, loop=True):
+        if not segments:
+            raise ValueError("A gaze script needs at least one segment.")
+        self.segments = [(target, float(seconds)) for target, seconds in segments]
+        self.loop = loop
+        self.duration = sum(seconds for _, seconds in self.segments)
+
+    @classmethod
+    def parse(cls, text, loop=True):
+        """Parse e.g. "0:4,idle:2,3:4" (target:seconds, comma separated)."""
+        segments = []
+        for part in text.split(","):
+            target, seconds = part.strip().split(":")
+            segments.append((None if target.strip().lower() in ("idle", "-1") else int(target), float(seconds)))
+        return cls(segments, loop)
+
+    def target_at(self, t):
+        """Target gazed at t seconds into the script (the last one holds when not looping)."""
+        if self.loop:
+            t = math.fmod(t, self.duration)
+        for target, seconds in self.segments:
+            if t < seconds:
+                return target
+            t -= seconds
+        return self.segments[-1][0]
+
+
+class SyntheticSSVEP:
+    """Block-wise generator of (timestamps, values) with an embedded SSVEP response."""
+
+    def __init__(self, frequencies, phases=None, channels=8, sampling_rate=250.0, snr_db=DEFAULT_SNR_DB,
+                 noise_rms=DEFAULT_NOISE_RMS, line_freq=DEFAULT_LINE_FREQ, line_rms=DEFAULT_LINE_RMS,
+                 harmonic_gains=HARMONIC_GAINS, start_time=0.0, seed=None):
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.phases = np.pi * np.asarray(phases if phases is not None else np.zeros(len(self.frequencies)),
+                                         dtype=np.float64)
+        self.channels = channels
+        self.sampling_rate = float(sampling_rate)
+        self.noise_rms = noise_rms
+        self.line_freq = line_freq
+        self.line_rms = line_rms
+        self.harmonic_gains = np.asarray(harmonic_gains, dtype=np.float64)
+        self.start_time = start_time
+        self.samples_generated = 0
+
+        self.rng = np.random.default_rng(seed)
+        self.set_snr(snr_db)
+
+        # Response strongest on the first channels, with some per-channel spread; line noise in phase on all
+        self.channel_gains = np.linspace(1.0, 0.4, channels) * self.rng.uniform(0.8, 1.2, channels)
+        self.line_phases = self.rng.uniform(0, 2 * np.pi, channels)
+        self._noise_state = lfilter_zi(PINK_B, PINK_A)[:, None] * self.rng.normal(0, 1, channels)
+
+        self.target = None
+        self.script = None
+
+    def set_snr(self, snr_db):
+        """SNR of the SSVEP fundamental (RMS) against the background noise (RMS), in dB."""
+        self.snr_db = snr_db
+        self.ssvep_amplitude = math.sqrt(2) * self.noise_rms * 10 ** (snr_db / 20)
+
+    def gaze(self, target):
+        """Gaze at target index `target` from now on (None for idle). Clears any script."""
+        self.script = None
+        self.target = target
+
+    def set_script(self, script):
+        """Drive the gazed target from a GazeScript, timed from the current sample."""
+        self.script = script
+        self._script_origin = self.samples_generated
+
+    def current_target(self):
+        if self.script is not None:
+            return self.script.target_at((self.samples_generated - self._script_origin) / self.sampling_rate)
+        return self.target
+
+    def next_block(self, num_samples):
+        """Generate the next num_samples samples. Returns (timestamps (n,), values (n, channels) float32)."""
+        k = np.arange(self.samples_generated, self.samples_generated + num_samples, dtype=np.float64)
+        t = k / self.sampling_rate
+        timestamps = self.start_time + t
+
+        white = self.rng.normal(0, self.noise_rms / _PINK_GAIN, (num_samples, self.channels))
+        values, self._noise_state = lfilter(PINK_B, PINK_A, white, axis=0, zi=self._noise_state)
+
+        if self.line_rms:
+            line = math.sqrt(2) * self.line_rms * np.sin(2 * np.pi * self.line_freq * t[:, None] + self.line_phases)
+            values += line
+
+        # The target is sampled per block; scripts switch at block boundaries, which is fine for small blocks
+        target = self.current_target()
+        if target is not None:
+            freq, phase = self.frequencies[target], self.phases[target]
+            response = np.zeros(num_samples)
+            for h, gain in enumerate(self.harmonic_gains, start=1):
+                response += gain * np.sin(2 * np.pi * h * freq * t + h * phase)
+            values += self.ssvep_amplitude * response[:, None] * self.channel_gains
+
+        self.samples_generated += num_samples
+        return timestamps, values.astype(np.float32)
+
+
+def synthetic_trial(frequencies, phases=None, target=0, seconds=4.0, channels=8, sampling_rate=250.0,
+                    snr_db=DEFAULT_SNR_DB, seed=None):
+    """One gaze window as a (channels, samples) array, in the layout run_fbcca expects."""
+    source = SyntheticSSVEP(frequencies, phases, channels, sampling_rate, snr_db=snr_db, seed=seed)
+    source.gaze(target)
+    _, values = source.next_block(int(math.ceil(seconds * sampling_rate)))
+    return values.T
+
+
+def scenario_stimuli(scenario_id):
+    """(frequencies, phases) of a scenario in scenarioConfig_lowFreqs.json."""
+    fbcca_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fbcca-py")
+    if fbcca_dir not in sys.path:
+        sys.path.insert(0, fbcca_dir)
+    from run_fbcca import scenario_config
+
+    scenario = (scenario_config or {}).get(f"scenario_{scenario_id}")
+    if scenario is None:
+        raise ValueError(f"Scenario {scenario_id} not found in the scenario config.")
+    return scenario["frequencies"], scenario.get("phases")
@@ -0,0 +1,171 @@
+"""Synthetic SSVEP backend: serves generated EEG (see synthetic_ssvep.py) on ws://localhost:8765.
+
+Uses the same packets and JSON-RPC events as the live servers, plus a
+"synthetic-target" event whenever the scripted gaze target changes, so a
+client can score its decisions against ground truth.
+
+    python synthetic_websocket_server.py [--scenario 0] [--script "0:4,idle:2,3:4"] [--snr -5]
+                                         [--channels 8] [--rate 250] [--speed 1]
+
+--speed 1 streams in real time, N at N x and 0 as fast as the slowest client drains.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import websockets
+
+from acquisition_hub import AcquisitionHub
+from alloc_probe import create_probe
+from memory_monitor import MemoryMonitor
+from sample_blocks import SampleBlockEncoder, design_filters, filter_settings, per_sample_filter_matrix
+from stream_metrics import StreamMetrics
+from synthetic_ssvep import DEFAULT_SNR_DB, GazeScript, SyntheticSSVEP, scenario_stimuli
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Adding the sibling folder fbcca-py to sys.path so it can import fbcca_config_service.fbcca_config.
+try:
+    FBCCA_DIR = os.path.join(os.path.dirname(BASE_DIR), "fbcca-py")
+    if FBCCA_DIR not in sys.path:
+        sys.path.insert(0, FBCCA_DIR)
+
+    from fbcca_config_service import fbcca_config
+    from profiling import Profiler
+except Exception as e:
+    print(f"[ERROR] Failed to import fbcca_config_service.fbcca_config: {e}")
+    # Stop here so the rest of the script doesn't run with missing config
+    raise SystemExit(1)
+
+# ---------- CONFIGS ----------
+CHANNELS = fbcca_config["channels"]
+SAMPLING_RATE = fbcca_config["samplingRate"]
+
+BLOCK_SIZE = 10                 # Samples per published packet
+DEFAULT_SCRIPT = "0:4,idle:2"   # target:seconds segments, looped
+APPLY_FILTERING = True          # Bandpass + notch, as the live servers do (overridden by --no-filter)
+FILTER_SETTINGS = filter_settings(lowcut=2.0, highcut=100.0, order=5, notch_freq=50.0)
+CLIENT_QUEUE_SIZE = 1024        # Max packets buffered per WebSocket client before the overflow policy applies
+CLIENT_OVERFLOW_POLICY = "drop-oldest"  # "drop-oldest" or "disconnect" for clients that fall behind
+# -----------------------------
+
+
+# === JSON-RPC event emitter (mirrors lsl_websocket_server.py) ===
+def emit_event(event_type: str, **params):
+    """Emit a JSON-RPC style event line to stdout for Node consumer."""
+    try:
+        payload = {"jsonrpc": "2.0", "method": "event", "params": {"type": event_type}}
+        if params:
+            payload["params"].update(params)
+        print(json.dumps(payload), flush=True)
+    except Exception:
+        pass
+
+
+def make_synthetic_producer(frequencies, phases, script, channels=CHANNELS, sampling_rate=SAMPLING_RATE,
+                            snr_db=DEFAULT_SNR_DB, speed=1.0, apply_filtering=APPLY_FILTERING,
+                            block_size=BLOCK_SIZE, seed=None):
+    """Return a hub producer streaming a SyntheticSSVEP source driven by `script`."""
+
+    async def synthetic_producer(hub):
+        source = SyntheticSSVEP(frequencies, phases, channels, sampling_rate, snr_db=snr_db,
+                                start_time=time.time(), seed=seed)
+        source.set_script(script)
+        encoder = SampleBlockEncoder(channels, block_size)
+        filter_matrix_t = per_sample_filter_matrix(channels, *design_filters(FILTER_SETTINGS, sampling_rate)).T
+
+        print(f"[INFO] Streaming synthetic SSVEP: {channels} channels at {sampling_rate} Hz, "
+              f"SNR {snr_db} dB, speed {'max' if speed <= 0 else speed}.")
+
+        gc.collect()
+        gc.freeze()
+        probe = create_probe(emit_event)
+        metrics = StreamMetrics(hub, emit_event, sampling_rate).start()
+        emit_event("headset-connected")
+
+        loop_clock = asyncio.get_running_loop()
+        start_clock = loop_clock.time()
+        # Stamp from here, where pacing starts, so setup time does not show up as sample age
+        source.start_time = time.time()
+        target = object()
+        try:
+            while True:
+                if source.current_target() != target:
+                    target = source.current_target()
+                    emit_event("synthetic-target", target=-1 if target is None else target,
+                               frequency=None if target is None else float(source.frequencies[target]),
+                               time=source.start_time + source.samples_generated / source.sampling_rate)
+
+                timestamps, raw_block = source.next_block(block_size)
+                if speed > 0:
+                    delay = start_clock + source.samples_generated / sampling_rate / speed - loop_clock.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    await hub.wait_for_capacity()
+
+                np.copyto(encoder.times, timestamps)
+                filter_started = time.perf_counter()
+                if apply_filtering:
+                    np.matmul(raw_block, filter_matrix_t, out=encoder.values)
+                else:
+                    np.copyto(encoder.values, raw_block)
+                filter_secs = time.perf_counter() - filter_started
+                hub.publish(encoder.encode(block_size, source.samples_generated - block_size))
+                metrics.record_block(block_size, block_size, filter_secs, timestamps)
+
+                if probe is not None:
+                    probe.tick(block_size)
+                if speed <= 0:
+                    await asyncio.sleep(0)
+        finally:
+            metrics.stop()
+            gc.unfreeze()
+            gc.collect()
+            if probe is not None:
+                probe.stop()
+            emit_event("headset-disconnected")
+
+    return synthetic_producer
+
+
+async def main(args):
+    frequencies, phases = scenario_stimuli(args.scenario)
+    producer = make_synthetic_producer(frequencies, phases, GazeScript.parse(args.script),
+                                       channels=args.channels, sampling_rate=args.rate, snr_db=args.snr,
+                                       speed=args.speed, apply_filtering=APPLY_FILTERING and not args.no_filter,
+                                       block_size=args.block_size, seed=args.seed)
+    # No markers to record here; clients may still ask for a profile (see profiling.py)
+    profiler = Profiler("synthetic_server", announce=emit_event)
+    hub = AcquisitionHub(producer, queue_size=CLIENT_QUEUE_SIZE, overflow_policy=CLIENT_OVERFLOW_POLICY,
+                         on_message=profiler.handle_message)
+    async with websockets.serve(hub.serve_client, "localhost", args.port):
+        print("READY")
+        emit_event("server-ready")
+        profiler.start_from_env("BOGGLE_PROFILE", seconds=True)
+        memory = MemoryMonitor(emit_event).start()  # BOGGLE_MEMORY=<seconds>, see memory_monitor.py
+        try:
+            await asyncio.Future()  # Run indefinitely
+        finally:
+            memory.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic SSVEP EEG over the WebSocket server")
+    parser.add_argument("--scenario", type=int, default=0, help="Scenario whose frequencies and phases are used")
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="Gaze script, e.g. '0:4,idle:2,3:4'")
+    parser.add_argument("--snr", type=float, default=DEFAULT_SNR_DB, help="SSVEP SNR in dB")
+    parser.add_argument("--channels", type=int, default=CHANNELS)
+    parser.add_argument("--rate", type=float, default=SAMPLING_RATE)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N x, 0 = as fast as possible")
+    parser.add_argument("--no-filter", action="store_true", help="Send the generated samples unfiltered")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Samples per packet")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
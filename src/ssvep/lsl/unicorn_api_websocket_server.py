@@ -3,10 +3,19 @@ import json
 import os
 import time
 import gc
-import struct
 
+import numpy as np
 import websockets
-from scipy.signal import butter, lfilter, iirnotch
+from scipy.signal import lfilter
+
+from acquisition_hub import AcquisitionHub
+from alloc_probe import create_probe
+from markers import MarkerSink
+from memory_monitor import MemoryMonitor
+from raw_recorder import RawRecorder, session_filename
+from sample_blocks import SampleBlockEncoder, design_filters, filter_settings, per_sample_filter_matrix
+from sample_ring import SampleRing, publish_ring_rows
+from stream_metrics import StreamMetrics
 
 import os
 import sys
@@ -19,6 +28,7 @@ try:
         sys.path.insert(0, FBCCA_DIR)
 
     from fbcca_config_service import fbcca_config
+    from profiling import Profiler
 except Exception as e:
     print(f"[ERROR] Failed to import fbcca_config_service.fbcca_config: {e}")
     # Stop here so the rest of the script doesn't run with missing config
@@ -50,81 +60,43 @@ if UnicornPy is not None and hasattr(UnicornPy, "SamplingRate"):
     SAMPLING_RATE = UnicornPy.SamplingRate
 
 SAMPLES_PER_SECOND = 250     # Max samples pushed per second to WebSocket
+FRAME_LENGTH = 10            # Samples fetched per GetData call (1 = legacy per-sample mode)
+COUNTER_CHANNEL = 15         # Index of the device's sample counter in an acquired frame (Unicorn API docs)
 APPLY_FILTERING = True       # Enable/disable bandpass + notch
-SAVE_RAW_DATA = False        # Enable/disable saving raw data to JSON
+FILTER_SETTINGS = filter_settings(APPLY_FILTERING, lowcut=2.0, highcut=100.0, order=5, notch_freq=50.0)
+SAVE_RAW_DATA = False        # Enable/disable recording raw data (raw_recorder.py)
+CLIENT_QUEUE_SIZE = 1024     # Max packets buffered per WebSocket client before the overflow policy applies
+CLIENT_OVERFLOW_POLICY = "drop-oldest"  # "drop-oldest" or "disconnect" for clients that fall behind
 
 # ^---------- CONFIGS ----------^
 
 
-# Raw data JSON storage
-RAW_JSON_FILENAME = "datasets/RAW-eeg-data_unicorn_api.json"
-RAW_SAMPLE_BUFFER = []
-RAW_SAMPLE_BUFFER_SIZE = 1000
-
-
-def save_raw_sample_to_json(sample, filename: str = RAW_JSON_FILENAME) -> None:
-    """Buffer raw EEG samples and periodically write to JSON.
-
-    Stored format: { "eegData": [ [], [], ... ] }
-    """
-    global RAW_SAMPLE_BUFFER
-    RAW_SAMPLE_BUFFER.append(sample)
-
-    if len(RAW_SAMPLE_BUFFER) < RAW_SAMPLE_BUFFER_SIZE:
-        return
-
+# === JSON-RPC event emitter (mirrors lsl_websocket_server.py) ===
+def emit_event(event_type: str, **params):
+    """Emit a JSON-RPC style event line to stdout for Node consumer."""
     try:
-        folder = os.path.dirname(filename)
-        if folder and not os.path.exists(folder):
-            os.makedirs(folder, exist_ok=True)
+        payload = {"jsonrpc": "2.0", "method": "event", "params": {"type": event_type}}
+        if params:
+            payload["params"].update(params)
+        print(json.dumps(payload), flush=True)
+    except Exception:
+        pass
 
-        try:
-            with open(filename, "r") as f:
-                file_data = json.load(f)
-            eeg_data = file_data.get("eegData", [])
-        except (FileNotFoundError, json.JSONDecodeError):
-            eeg_data = [[] for _ in range(len(sample))]
 
-        for buffered_sample in RAW_SAMPLE_BUFFER:
-            for i, value in enumerate(buffered_sample):
-                eeg_data[i].append(value)
-
-        with open(filename, "w") as f:
-            json.dump({"eegData": eeg_data}, f, indent=2)
-
-        RAW_SAMPLE_BUFFER = []
-    except Exception as e:
-        print(f"[ERROR] Error saving raw EEG samples: {e}")
+# Raw recordings are written append-only on a background thread (see raw_recorder.py);
+# convert with `python raw_recorder.py to-json <file> <out.json>` for the { "eegData": [...] } layout.
+RAW_RECORDING_PREFIX = "datasets/RAW-eeg-data_unicorn_api"
+RAW_RECORDING_COMPRESSION = None   # None (raw, memory-mapped), "zlib" or "lzma" (chunk-compressed, see compressed_recording.py)
 
 
 # Filters
 
-def butter_bandpass(lowcut: float, highcut: float, fs: float, order: int = 5):
-    nyquist = 0.5 * fs
-    low = lowcut / nyquist
-    high = highcut / nyquist
-    return butter(order, [low, high], btype="band")
-
-
-def notch_filter(freq: float, fs: float, quality: float = 30.0):
-    nyquist = 0.5 * fs
-    norm_freq = freq / nyquist
-    return iirnotch(norm_freq, quality)
-
-
-def apply_filter(data, b, a):
-    return lfilter(b, a, data)
+def apply_filter(data, b, a, axis=-1):
+    return lfilter(b, a, data, axis=axis)
 
 
 def init_filters():
-    fs = SAMPLING_RATE
-    lowcut = 2.0
-    highcut = 100.0
-    notch_freq = 50.0
-
-    b_band, a_band = butter_bandpass(lowcut, highcut, fs, order=5)
-    b_notch, a_notch = notch_filter(notch_freq, fs, quality=30.0)
-    return (b_band, a_band), (b_notch, a_notch)
+    return design_filters(FILTER_SETTINGS, SAMPLING_RATE)
 
 
 # Unicorn device helpers
@@ -154,37 +126,54 @@ class UnicornDeviceWrapper:
 
         # Setting the number of channels
         self.num_channels = CHANNELS
+        self.acquired_channels = self.device.GetNumberOfAcquiredChannels()
+        self.sampling_rate = UnicornPy.SamplingRate if UnicornPy is not None else SAMPLING_RATE
 
-        self.frame_length = 1  # one sample per GetData call
-        self.buffer_length = self.frame_length * self.num_channels * 4  # float32 -> 4 bytes
+        # Preallocated receive buffer for one frame, viewed as (frame_length, acquired_channels) float32.
+        # The EEG view is a slice of that matrix, so decoding a frame never copies or allocates.
+        self.frame_length = max(1, int(FRAME_LENGTH))
+        self.buffer_length = self.frame_length * self.acquired_channels * 4  # float32 -> 4 bytes
         self.buffer = bytearray(self.buffer_length)
+        self.frame = np.frombuffer(self.buffer, dtype="<f4").reshape(self.frame_length, self.acquired_channels)
+        self.eeg = self.frame[:, :self.num_channels]
+        # The sample counter proves lost frames (see sample_ring.py); None if it is not acquired
+        self.counters = None
+        if self.acquired_channels > COUNTER_CHANNEL:
+            self.counter_view = self.frame[:, COUNTER_CHANNEL]
+            self.counters = np.empty(self.frame_length, dtype=np.int64)
+
+        # Per-sample timestamps are reconstructed from the device rate rather than read from the wall clock
+        self.sample_offsets = np.arange(self.frame_length, dtype=np.float64) / self.sampling_rate
+        self.timestamps = np.empty(self.frame_length, dtype=np.float64)
+        self.samples_read = 0
+        self.start_time = None
 
         print("[INFO] Acquisition Configuration:")
-        print(f"        Sampling Rate: {UnicornPy.SamplingRate if UnicornPy is not None else SAMPLING_RATE} Hz")
+        print(f"        Sampling Rate: {self.sampling_rate} Hz")
         print(f"        Frame Length: {self.frame_length}")
-        print(f"        Number Of Acquired Channels: {self.device.GetNumberOfAcquiredChannels()} but USING {self.num_channels}")
+        print(f"        Number Of Acquired Channels: {self.acquired_channels} but USING {self.num_channels}")
 
         # Start data acquisition (testsig disabled -> real EEG)
         test_signals_enabled = False
         self.device.StartAcquisition(test_signals_enabled)
+        self.start_time = time.time()
         print("[INFO] Unicorn data acquisition started.")
 
-    def get_sample(self):
-        """Return a single EEG sample as a list of CHANNELS values.
+    def get_block(self):
+        """Read one frame and return (timestamps, eeg) for its samples.
 
-        Uses UnicornPy.Unicorn.GetData with frame length 1, then unpacks the
-        float32 values from the byte buffer.
+        `eeg` is a (frame_length, CHANNELS) float32 view into the receive
+        buffer and `timestamps` (like `counters`) is a reused array, so both are
+        only valid until the next call. Sample k of the session is stamped start_time + k / rate.
         """
-        # Fill internal byte buffer with one frame of data
+        # Fill internal byte buffer with one frame of data (blocks until the frame is complete)
         self.device.GetData(self.frame_length, self.buffer, self.buffer_length)
 
-        # Unpack as little-endian float32
-        total_floats = self.frame_length * self.num_channels
-        fmt = f"<{total_floats}f"
-        values = struct.unpack(fmt, self.buffer)
-
-        # For frame_length == 1, this is exactly one sample per channel
-        return [float(values[ch]) for ch in range(self.num_channels)]
+        np.add(self.sample_offsets, self.start_time + self.samples_read / self.sampling_rate, out=self.timestamps)
+        self.samples_read += self.frame_length
+        if self.counters is not None:
+            np.copyto(self.counters, self.counter_view, casting="unsafe")
+        return self.timestamps, self.eeg
 
     def close(self):
         # Stop acquisition
@@ -193,8 +182,11 @@ class UnicornDeviceWrapper:
         except Exception as e:
             print(f"[WARN] Failed to stop Unicorn acquisition cleanly: {e}")
 
-        # Release receive buffer
+        # Release receive buffer (views first, so the bytearray is no longer exported)
         try:
+            del self.eeg
+            self.counter_view = None
+            del self.frame
             del self.buffer
         except Exception:
             pass
@@ -208,13 +200,31 @@ class UnicornDeviceWrapper:
 
 # WebSocket streaming
 
-async def unicorn_to_websocket(websocket):
-    """Acquire Unicorn Hybrid Black EEG via Python API and stream over WebSocket.
+# Sample timestamps are reconstructed from time.time() at StartAcquisition, so markers use the wall clock
+marker_sink = MarkerSink(time.time)
+
+# cProfile of the event loop on request: BOGGLE_PROFILE=<seconds> or {"profile": {"seconds": T}} (see profiling.py)
+profiler = Profiler("unicorn_server", announce=emit_event)
+
+
+def handle_client_message(message):
+    """Hub on_message: stimulus markers (markers.py), otherwise profiling requests."""
+    if marker_sink.handle_message(message) is None:
+        profiler.handle_message(message)
+
+
+async def unicorn_producer(hub):
+    """Acquire Unicorn Hybrid Black EEG via Python API and publish to all WebSocket clients.
 
-    JSON packet format matches your existing LSL server:
-      { "time": timestamp, "values": [ch1, ch2, ...] }
+    Runs once per process, so every client shares the same device connection.
+    Each frame is published as one batch packet:
+      { "seq": first sample number, "samples": [ { "time": timestamp, "values": [ch1, ch2, ...] }, ... ] }
     """
     device = None
+    probe = None
+    recorder = None
+    ring = None
+    metrics = None
     (b_band, a_band), (b_notch, a_notch) = init_filters()
 
     try:
@@ -222,9 +232,27 @@ async def unicorn_to_websocket(websocket):
         device = UnicornDeviceWrapper()
         print("[INFO] Unicorn Hybrid Black device ready.")
 
+        # Everything the loop touches is allocated once here
+        encoder = SampleBlockEncoder(device.num_channels, device.frame_length)
+        # Timestamps are reconstructed from the device rate; lost frames only show in the counter
+        ring = SampleRing(device.num_channels, device.sampling_rate, trust_timestamps=True, emit=emit_event)
+        metrics = StreamMetrics(hub, emit_event, device.sampling_rate, extra=ring.stats)
+        if SAVE_RAW_DATA:
+            recorder = RawRecorder(session_filename(RAW_RECORDING_PREFIX), device.num_channels,
+                                   device.sampling_rate, metadata={"source": "unicorn", "filter": FILTER_SETTINGS},
+                                   compression=RAW_RECORDING_COMPRESSION)
+            marker_sink.recorder = recorder
+        # Bandpass + notch over each sample's channel vector, folded into one matrix
+        filter_matrix_t = per_sample_filter_matrix(device.num_channels, (b_band, a_band), (b_notch, a_notch)).T
+
+        # Startup objects (modules, filters, buffers) never become garbage: move them out of the collector's way
+        gc.collect()
+        gc.freeze()
+        probe = create_probe(emit_event)
+        metrics.start()
+
         count = 0
         start_time = time.time()
-        gc_timer = time.time()
 
         while True:
             now = time.time()
@@ -235,51 +263,65 @@ async def unicorn_to_websocket(websocket):
                 count = 0
 
             if count < SAMPLES_PER_SECOND:
-                raw_sample = device.get_sample()  # list of length CHANNELS
-                
-                if SAVE_RAW_DATA:
-                    save_raw_sample_to_json(raw_sample)
+                # GetData blocks for a whole frame, so wait for it off the event loop
+                timestamps, raw_block = await asyncio.to_thread(device.get_block)
 
-                # Filtering
+                if recorder is not None:
+                    recorder.write_block(timestamps, raw_block)
+
+                np.copyto(encoder.times, timestamps)
+                # Filtering (per sample, across its channel values, as in per-sample mode)
+                filter_started = time.perf_counter()
                 if APPLY_FILTERING:
-                    filtered = apply_filter(raw_sample[:CHANNELS], b_band, a_band)
-                    filtered = apply_filter(filtered, b_notch, a_notch)
-                    values = list(map(float, filtered))
+                    np.matmul(raw_block, filter_matrix_t, out=encoder.values)
                 else:
-                    values = list(map(float, raw_sample[:CHANNELS]))
-                packet = {
-                    "time": now,
-                    "values": values,
-                }
-
-                try:
-                    await websocket.send(json.dumps(packet))
-                    count += 1
-                except websockets.exceptions.ConnectionClosed:
-                    print("[INFO] WebSocket client disconnected.")
-                    break
-
-            # Periodic GC to keep memory usage stable
-            if now - gc_timer >= 5.0:
-                gc.collect()
-                gc_timer = now
+                    np.copyto(encoder.values, raw_block)
+                filter_secs = time.perf_counter() - filter_started
+
+                seq, written, clean = ring.append(encoder.times, encoder.values, device.counters)
+                if clean:
+                    hub.publish(encoder.encode(device.frame_length, seq))
+                else:
+                    publish_ring_rows(hub, ring, encoder, seq, written)
+                metrics.record_block(device.frame_length, written, filter_secs, timestamps)
+                count += device.frame_length
+
+                if probe is not None:
+                    probe.tick(device.frame_length)
 
             await asyncio.sleep(0.0001)
 
     except Exception as e:
-        print(f"[ERROR] Unicorn WebSocket loop error: {e}")
+        print(f"[ERROR] Unicorn acquisition loop error: {e}")
     finally:
+        if metrics is not None:
+            metrics.stop()
+        marker_sink.recorder = None
         if device is not None:
             device.close()
+        if recorder is not None:
+            recorder.close()
+        if ring is not None:
+            print(f"[INFO] Stream: {ring.stats()}")
+        if probe is not None:
+            probe.stop()
+        gc.unfreeze()
         gc.collect()
 
 
 async def main():
     # Mirror the behavior of lsl_websocket_server/emotiv_websocket_server:
     # start a WebSocket server on ws://localhost:8765 and print READY when up.
-    async with websockets.serve(unicorn_to_websocket, "localhost", 8765):
+    hub = AcquisitionHub(unicorn_producer, queue_size=CLIENT_QUEUE_SIZE, overflow_policy=CLIENT_OVERFLOW_POLICY,
+                         on_message=handle_client_message)
+    async with websockets.serve(hub.serve_client, "localhost", 8765):
         print("READY")
-        await asyncio.Future()  # Run indefinitely
+        profiler.start_from_env("BOGGLE_PROFILE", seconds=True)
+        memory = MemoryMonitor(emit_event).start()  # BOGGLE_MEMORY=<seconds>, see memory_monitor.py
+        try:
+            await asyncio.Future()  # Run indefinitely
+        finally:
+            memory.stop()
 
 
 if __name__ == "__main__":